@@ -0,0 +1,63 @@
+"""
+Linha de comando do EqualProp.
+
+    python -m equalprop batch <raiz> [--saida DIR] [--rfps N] [--max-modelo N] [--pular-concluidos] [--simular]
+
+Os parâmetros de concorrência são repassados pelas mesmas variáveis de
+ambiente lidas em equalprop.config, então precisam ser definidos antes de
+importar o restante do pacote.
+"""
+
+import argparse
+import os
+import sys
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m equalprop", description="EqualProp sem interface.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    batch = sub.add_parser("batch", help="processa todas as pastas de RFP de um diretório",
+                           description="Procura <rfp>/rfp.pdf + <rfp>/propostas/*.pdf abaixo da raiz e gera "
+                                       "um relatório por RFP.")
+    batch.add_argument("raiz", help="diretório com as pastas de RFP")
+    batch.add_argument("--saida", default=None, help="diretório dos relatórios (padrão: <raiz>/saida_lote)")
+    batch.add_argument("--rfps", type=int, default=None, help="RFPs processadas ao mesmo tempo (EQUALPROP_BATCH_RFPS)")
+    batch.add_argument("--max-modelo", type=int, default=None,
+                       help="chamadas simultâneas ao modelo somando todas as RFPs (EQUALPROP_MAX_MODEL_CONCURRENCY)")
+    batch.add_argument("--pular-concluidos", action="store_true",
+                       help="pula RFPs cuja pasta de saída já tem o relatório consolidado")
+    batch.add_argument("--simular", action="store_true",
+                       help="só lista as RFPs e as pastas de saída, sem chamar o modelo nem gravar nada")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = _parser().parse_args(argv)
+    if args.rfps is not None:
+        os.environ["EQUALPROP_BATCH_RFPS"] = str(args.rfps)
+    if args.max_modelo is not None:
+        os.environ["EQUALPROP_MAX_MODEL_CONCURRENCY"] = str(args.max_modelo)
+
+    from equalprop.batch import plan_batch, print_plan, print_summary, run_batch
+    from equalprop.config import BATCH_CONCURRENT_RFPS, build_gen_config, setup_gemini_client
+
+    root = os.path.abspath(args.raiz)
+    if not os.path.isdir(root):
+        print(f"[ERRO] Diretório não encontrado: {root}")
+        return 2
+    out_root = os.path.abspath(args.saida or os.path.join(root, "saida_lote"))
+    if args.simular:
+        print_plan(*plan_batch(root, out_root, skip_done=args.pular_concluidos))
+        return 0
+    print("[INFO] Configurando modelo Gemini...")
+    model = setup_gemini_client()
+    gen_config = build_gen_config(temperature=0.0, response_mime_type="application/json")
+    summary = run_batch(model, gen_config, root, out_root, max_rfps=BATCH_CONCURRENT_RFPS,
+                        skip_done=args.pular_concluidos)
+    print_summary(summary)
+    print(f"[OK] Relatórios em {out_root}")
+    return 0 if summary["falhas"] == 0 and summary["canceladas"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+"""
+Backend do modelo: upload de arquivos e geração de conteúdo.
+
+O resto do pacote não chama google.generativeai diretamente para criar
+modelos, enviar, consultar ou apagar arquivos: tudo passa por get_backend(),
+escolhido por EQUALPROP_BACKEND.
+
+- GeminiBackend ("gemini"): a API real.
+- RecordingBackend ("record"): a API real, gravando cada chamada (chave do
+  conteúdo, texto, pedaços do streaming, latências e usage_metadata) e cada
+  upload em fitas JSON no diretório CASSETTE_DIR.
+- ReplayBackend ("replay"): serve as fitas sem rede nem chave de API, com a
+  latência gravada multiplicada por REPLAY_LATENCY_SCALE e falhas
+  transitórias (429/503) sorteadas com probabilidade REPLAY_FAILURE_RATE.
+  Serve para medir de ponta a ponta tudo o que não é o modelo.
+
+A chave de cada fita é a mesma do cache de respostas
+(response_cache.make_key), então gravação e replay devem rodar com
+EQUALPROP_RESPONSE_CACHE=0; caso contrário as respostas em cache não
+chegam ao backend. O cache de contexto remoto não é usado ao gravar nem no
+replay: o prefixo vai junto em cada chamada e entra na chave da fita.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import google.generativeai as genai
+
+from equalprop.config import (
+    CASSETTE_DIR,
+    MODEL_BACKEND,
+    REPLAY_FAILURE_RATE,
+    REPLAY_LATENCY_SCALE,
+    REPLAY_SEED,
+)
+from equalprop.transport import resumable_upload
+
+GEMINI = "gemini"
+RECORD = "record"
+REPLAY = "replay"
+
+_USAGE_FIELDS = ("prompt_token_count", "candidates_token_count", "thoughts_token_count",
+                 "cached_content_token_count", "total_token_count")
+# Vazão usada para simular uploads sem registro na fita
+_REPLAY_UPLOAD_MBPS = 20.0
+
+
+class ReplayMissError(LookupError):
+    """Chamada sem fita correspondente no replay."""
+
+
+class ResourceExhausted(Exception):
+    """Falha 429 simulada pelo replay (mesmo nome da exceção da API, para o classify_error)."""
+
+    code = 429
+
+
+class ServiceUnavailable(Exception):
+    """Falha 503 simulada pelo replay."""
+
+    code = 503
+
+
+def _file_sha256(path: str) -> str:
+    # Import tardio: upload_cache depende deste módulo
+    from equalprop.upload_cache import file_sha256
+
+    return file_sha256(path)
+
+
+class GeminiBackend:
+    """API real do Gemini."""
+
+    name = GEMINI
+    needs_api_key = True
+
+    def configure(self, api_key: str) -> None:
+        genai.configure(api_key=api_key)
+
+    def model(self, model_name: str):
+        return genai.GenerativeModel(model_name)
+
+    def upload_file(self, path: str, mime_type: str = "application/pdf"):
+        """Upload resumable em blocos; se o protocolo falhar, usa o upload simples do SDK."""
+        try:
+            return resumable_upload(path, mime_type=mime_type)
+        except Exception as e:
+            if 'ragStoreName' in str(e):
+                raise
+            print(f"[AVISO] Upload resumable indisponível para {os.path.basename(path)} ({e}); "
+                  f"usando upload simples.")
+            return genai.upload_file(path=path, mime_type=mime_type)
+
+    def get_file(self, name: str):
+        return genai.get_file(name)
+
+    def delete_file(self, name: str) -> None:
+        genai.delete_file(name)
+
+    def create_cached_content(self, model_name: str, contents, ttl, display_name: str):
+        from google.generativeai import caching
+
+        return caching.CachedContent.create(model=model_name, display_name=display_name,
+                                            contents=list(contents), ttl=ttl)
+
+    def model_from_cached(self, cached_content):
+        return genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+
+
+class Cassette:
+    """Fitas de um diretório: uma chamada por arquivo chamadas/<chave>.json e um upload por uploads/<sha256>.json."""
+
+    def __init__(self, directory: str = CASSETTE_DIR):
+        self.directory = directory
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.directory, kind, f"{key}.json")
+
+    def _write(self, kind: str, key: str, entry: Dict[str, Any]) -> None:
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def _read(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(kind, key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def record_call(self, key: str, entry: Dict[str, Any]) -> None:
+        self._write("chamadas", key, entry)
+
+    def call(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._read("chamadas", key)
+
+    def record_upload(self, digest: str, entry: Dict[str, Any]) -> None:
+        self._write("uploads", digest, entry)
+
+    def upload(self, digest: str) -> Optional[Dict[str, Any]]:
+        return self._read("uploads", digest)
+
+
+def _usage_dict(usage_metadata) -> Dict[str, int]:
+    return {name: int(getattr(usage_metadata, name, 0) or 0) for name in _USAGE_FIELDS}
+
+
+def _call_key(model_name: str, contents, kwargs) -> str:
+    # Import tardio: response_cache -> upload_cache -> backend
+    from equalprop.response_cache import make_key
+
+    return make_key(model_name, list(contents), kwargs.get("generation_config"))
+
+
+class _RecordingStream:
+    """Repassa os pedaços do streaming e grava a fita ao fim da iteração."""
+
+    def __init__(self, response, on_done):
+        self._response = response
+        self._on_done = on_done
+        self._chunks: List[str] = []
+        self._first_chunk_s: Optional[float] = None
+        self._start = time.monotonic()
+
+    def __iter__(self):
+        for chunk in self._response:
+            if self._first_chunk_s is None:
+                self._first_chunk_s = time.monotonic() - self._start
+            try:
+                self._chunks.append(chunk.text or "")
+            except ValueError:
+                pass
+            yield chunk
+        self._on_done(self._chunks, self._first_chunk_s, getattr(self._response, "usage_metadata", None))
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class RecordingModel:
+    """Modelo real que grava cada chamada bem-sucedida na fita."""
+
+    def __init__(self, inner, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    @property
+    def model_name(self):
+        return getattr(self.inner, "model_name", None)
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        key = _call_key(self.model_name, contents, kwargs)
+        start = time.monotonic()
+        response = self.inner.generate_content(contents=contents, stream=stream, **kwargs)
+        if not stream:
+            self.cassette.record_call(key, {
+                "model": self.model_name,
+                "text": getattr(response, "text", None),
+                "chunks": None,
+                "elapsed_s": round(time.monotonic() - start, 3),
+                "first_chunk_s": None,
+                "usage": _usage_dict(getattr(response, "usage_metadata", None)),
+            })
+            return response
+
+        def _on_done(chunks, first_chunk_s, usage_metadata):
+            self.cassette.record_call(key, {
+                "model": self.model_name,
+                "text": "".join(chunks),
+                "chunks": chunks,
+                "elapsed_s": round(time.monotonic() - start, 3),
+                "first_chunk_s": None if first_chunk_s is None else round(first_chunk_s, 3),
+                "usage": _usage_dict(usage_metadata),
+            })
+
+        return _RecordingStream(response, _on_done)
+
+
+class RecordingBackend(GeminiBackend):
+    """API real gravando chamadas e uploads em fitas."""
+
+    name = RECORD
+
+    def __init__(self, cassette: Optional[Cassette] = None):
+        self.cassette = cassette or Cassette()
+
+    def model(self, model_name: str):
+        return RecordingModel(super().model(model_name), self.cassette)
+
+    def upload_file(self, path: str, mime_type: str = "application/pdf"):
+        start = time.monotonic()
+        uploaded = super().upload_file(path, mime_type=mime_type)
+        self.cassette.record_upload(_file_sha256(path), {
+            "size_bytes": os.path.getsize(path),
+            "elapsed_s": round(time.monotonic() - start, 3),
+        })
+        return uploaded
+
+    def create_cached_content(self, model_name: str, contents, ttl, display_name: str):
+        raise RuntimeError("cache de contexto desativado durante a gravação")
+
+
+class _UsageMetadata:
+    def __init__(self, counts: Dict[str, int]):
+        for name in _USAGE_FIELDS:
+            setattr(self, name, int((counts or {}).get(name, 0) or 0))
+
+
+class _ReplayChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class ReplayResponse:
+    """Resposta servida pela fita; iterável como o streaming do SDK."""
+
+    def __init__(self, entry: Dict[str, Any], delays: List[float], chunks: List[str]):
+        self.text = entry.get("text")
+        self.usage_metadata = _UsageMetadata(entry.get("usage"))
+        self._delays = delays
+        self._chunks = chunks
+
+    def __iter__(self):
+        for delay, text in zip(self._delays, self._chunks):
+            if delay > 0:
+                time.sleep(delay)
+            yield _ReplayChunk(text)
+
+
+class ReplayFile:
+    """Handle de arquivo simulado (mesmos atributos usados do File do SDK)."""
+
+    state = None
+    expiration_time = None
+
+    def __init__(self, name: str, size_bytes: int = 0, mime_type: str = "application/pdf"):
+        self.name = name
+        self.uri = f"replay://{name}"
+        self.size_bytes = size_bytes
+        self.mime_type = mime_type
+
+
+class ReplayModel:
+    """Modelo que responde a partir das fitas."""
+
+    def __init__(self, model_name: str, backend: "ReplayBackend"):
+        self.model_name = model_name
+        self.backend = backend
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        key = _call_key(self.model_name, contents, kwargs)
+        entry = self.backend.cassette.call(key)
+        if entry is None:
+            raise ReplayMissError(f"chamada sem fita no replay (chave {key[:16]}) em {self.backend.cassette.directory}")
+        scale = self.backend.latency_scale
+        elapsed = float(entry.get("elapsed_s") or 0.0) * scale
+        self.backend.maybe_fail(elapsed)
+        if not stream:
+            if elapsed > 0:
+                time.sleep(elapsed)
+            return ReplayResponse(entry, [], [])
+        chunks = entry.get("chunks") or [entry.get("text") or ""]
+        first = entry.get("first_chunk_s")
+        first = elapsed / len(chunks) if first is None else float(first) * scale
+        rest = max(0.0, elapsed - first) / max(1, len(chunks) - 1)
+        delays = [first] + [rest] * (len(chunks) - 1)
+        return ReplayResponse(entry, delays, chunks)
+
+
+class ReplayBackend:
+    """Serve as fitas gravadas, sem rede, com latência e falhas simuladas."""
+
+    name = REPLAY
+    needs_api_key = False
+
+    def __init__(self, cassette: Optional[Cassette] = None, latency_scale: float = REPLAY_LATENCY_SCALE,
+                 failure_rate: float = REPLAY_FAILURE_RATE, seed=REPLAY_SEED):
+        self.cassette = cassette or Cassette()
+        self.latency_scale = max(0.0, latency_scale)
+        self.failure_rate = min(1.0, max(0.0, failure_rate))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sizes: Dict[str, int] = {}
+
+    def configure(self, api_key: str) -> None:
+        pass
+
+    def model(self, model_name: str):
+        return ReplayModel(model_name, self)
+
+    def maybe_fail(self, elapsed_s: float) -> None:
+        """Sorteia uma falha transitória; a falha chega depois de parte da latência."""
+        with self._lock:
+            draw = self._random.random()
+            kind = self._random.random()
+        if draw >= self.failure_rate:
+            return
+        time.sleep(elapsed_s * 0.1)
+        if kind < 0.5:
+            raise ResourceExhausted("429 Resource has been exhausted (falha simulada pelo replay)")
+        raise ServiceUnavailable("503 The service is currently unavailable (falha simulada pelo replay)")
+
+    def upload_file(self, path: str, mime_type: str = "application/pdf"):
+        digest = _file_sha256(path)
+        size = os.path.getsize(path)
+        entry = self.cassette.upload(digest) or {}
+        elapsed = entry.get("elapsed_s")
+        if elapsed is None:
+            elapsed = size / (_REPLAY_UPLOAD_MBPS * 1024 * 1024)
+        self.maybe_fail(float(elapsed) * self.latency_scale)
+        time.sleep(float(elapsed) * self.latency_scale)
+        name = f"files/replay-{digest[:16]}"
+        with self._lock:
+            self._sizes[name] = size
+        return ReplayFile(name, size, mime_type)
+
+    def get_file(self, name: str):
+        with self._lock:
+            size = self._sizes.get(name, 0)
+        return ReplayFile(name, size)
+
+    def delete_file(self, name: str) -> None:
+        with self._lock:
+            self._sizes.pop(name, None)
+
+    def create_cached_content(self, model_name: str, contents, ttl, display_name: str):
+        raise RuntimeError("cache de contexto indisponível no replay")
+
+    def model_from_cached(self, cached_content):
+        raise RuntimeError("cache de contexto indisponível no replay")
+
+
+_BACKENDS = {GEMINI: GeminiBackend, RECORD: RecordingBackend, REPLAY: ReplayBackend}
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend único para o processo, conforme EQUALPROP_BACKEND."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            factory = _BACKENDS.get(MODEL_BACKEND)
+            if factory is None:
+                print(f"[AVISO] EQUALPROP_BACKEND '{MODEL_BACKEND}' desconhecido; usando '{GEMINI}'.")
+                factory = GeminiBackend
+            _backend = factory()
+        return _backend
+
+
+def set_backend(backend) -> None:
+    """Troca o backend do processo (ex.: replay com outra fita ou outra taxa de falhas)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,205 @@
+"""
+Processamento em lote, sem interface: várias RFPs de uma árvore de pastas.
+
+Estrutura esperada (em qualquer profundidade abaixo da raiz):
+
+    <raiz>/<rfp>/rfp.pdf            (ou rfp.xlsx / rfp.xls)
+    <raiz>/<rfp>/propostas/*.pdf    (ou .xlsx / .xls)
+
+Cada RFP passa pelo mesmo run_report_pipeline da interface (process_files,
+gemini_service, consolidate_reports) e grava o relatório em
+<saida>/<caminho da rfp>. Até BATCH_CONCURRENT_RFPS RFPs rodam ao mesmo
+tempo; as chamadas ao modelo de todas elas passam pelo limitador único do
+processo (rate_limit.get_limiter), então a concorrência total com o modelo
+continua limitada por EQUALPROP_MAX_MODEL_CONCURRENCY e pela cota.
+
+Ao fim, imprime a vazão (RFPs por hora) e os tokens por RFP e grava o
+resumo em <saida>/resumo_lote.json. plan_batch (--simular na linha de
+comando) só lista o que seria processado, sem chamar o modelo.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from equalprop.cancellation import CancelToken, RunCancelled
+from equalprop.config import BATCH_CONCURRENT_RFPS, RUN_DEADLINE_S
+from equalprop.io_utils import sanitize_filename
+
+_ACCEPTED = ('.pdf', '.xlsx', '.xls')
+_RFP_NAMES = tuple(f"rfp{ext}" for ext in _ACCEPTED)
+_PROPOSALS_DIR = "propostas"
+REPORT_NAME = "relatorio_consolidado.xlsx"
+
+
+def find_rfp_folders(root: str) -> List[Tuple[str, str, List[str]]]:
+    """Lista (pasta, caminho_rfp, [propostas]) de cada pasta de RFP abaixo de root, em ordem."""
+    found = []
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        by_lower = {f.lower(): f for f in files}
+        rfp_name = next((by_lower[n] for n in _RFP_NAMES if n in by_lower), None)
+        proposals_dir = next((d for d in dirs if d.lower() == _PROPOSALS_DIR), None)
+        if rfp_name is None or proposals_dir is None:
+            continue
+        # As propostas não são pastas de RFP
+        dirs.remove(proposals_dir)
+        proposals_path = os.path.join(folder, proposals_dir)
+        proposals = sorted(
+            os.path.join(proposals_path, f) for f in os.listdir(proposals_path)
+            if f.lower().endswith(_ACCEPTED) and os.path.isfile(os.path.join(proposals_path, f))
+        )
+        if not proposals:
+            print(f"[AVISO] {folder}: nenhuma proposta em {_PROPOSALS_DIR}/; pasta ignorada.")
+            continue
+        found.append((folder, os.path.join(folder, rfp_name), proposals))
+    return found
+
+
+def _out_dir_for(root: str, folder: str, out_root: str) -> str:
+    rel = os.path.relpath(folder, root)
+    if rel == os.curdir:
+        rel = os.path.basename(os.path.abspath(root)) or "rfp"
+    name = "__".join(sanitize_filename(p) or "_" for p in rel.split(os.sep))
+    return os.path.join(out_root, name)
+
+
+def _run_one(model, gen_config, folder, rfp_path, proposal_paths, out_dir, cancel) -> Dict[str, Any]:
+    # Import tardio: o pipeline importa o restante do pacote
+    from equalprop.pipeline import run_report_pipeline
+
+    entry = {"pasta": folder, "saida": out_dir, "propostas": len(proposal_paths), "status": "erro",
+             "relatorio": None, "tokens": 0, "custo_usd": 0.0, "tempo_s": 0.0, "erro": None}
+    temp_dir = tempfile.mkdtemp(prefix="equalprop_lote_")
+    start = time.monotonic()
+    print(f"[INFO] Iniciando {folder} ({len(proposal_paths)} propostas).")
+    try:
+        result = run_report_pipeline(model, gen_config, rfp_path, proposal_paths, temp_dir,
+                                     cancel=cancel, out_dir=out_dir)
+        totals = result["usage"]["totals"]
+        entry.update(status="ok", relatorio=result.get("report_xlsx"), tokens=totals["total_tokens"],
+                     custo_usd=totals["estimated_cost_usd"])
+    except RunCancelled as e:
+        entry.update(status="cancelado", erro=str(e))
+    except Exception as e:
+        print(f"[ERRO] {folder}: {e}")
+        entry["erro"] = str(e)
+    finally:
+        entry["tempo_s"] = round(time.monotonic() - start, 1)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return entry
+
+
+def plan_batch(root: str, out_root: str, skip_done: bool = False):
+    """Devolve ([(pasta, caminho_rfp, [propostas], pasta_saida)] a processar, [pastas puladas])."""
+    folders = find_rfp_folders(root)
+    if not folders:
+        print(f"[AVISO] Nenhuma pasta com rfp.* e {_PROPOSALS_DIR}/ encontrada em {root}.")
+    pending, skipped = [], []
+    for folder, rfp_path, proposals in folders:
+        out_dir = _out_dir_for(root, folder, out_root)
+        if skip_done and os.path.exists(os.path.join(out_dir, REPORT_NAME)):
+            skipped.append(folder)
+        else:
+            pending.append((folder, rfp_path, proposals, out_dir))
+    if skipped:
+        print(f"[INFO] {len(skipped)} RFP(s) já com relatório; puladas.")
+    return pending, skipped
+
+
+def print_plan(pending, skipped) -> None:
+    """Simulação do lote: o que seria processado e onde cada relatório seria gravado."""
+    print("\n========== Simulação do lote ==========")
+    for folder, _rfp_path, proposals, out_dir in pending:
+        print(f"{folder}: {len(proposals)} proposta(s) -> {out_dir}")
+    for folder in skipped:
+        print(f"{folder}: já tem relatório (pulada)")
+    print(f"Total: {len(pending)} RFP(s) a processar, {len(skipped)} pulada(s).")
+
+
+def run_batch(model, gen_config, root: str, out_root: str, max_rfps: int = BATCH_CONCURRENT_RFPS,
+              skip_done: bool = False, deadline_s: Optional[float] = RUN_DEADLINE_S) -> Dict[str, Any]:
+    """Processa todas as RFPs de root e devolve o resumo do lote.
+
+    skip_done pula as RFPs cuja pasta de saída já tem o relatório (para
+    retomar um lote interrompido). deadline_s é o prazo de cada RFP.
+    Ctrl+C interrompe as RFPs em andamento e descarta as que não começaram.
+    """
+    pending, skipped = plan_batch(root, out_root, skip_done)
+    os.makedirs(out_root, exist_ok=True)
+    print(f"[INFO] Lote: {len(pending)} RFP(s), até {max(1, max_rfps)} ao mesmo tempo.")
+
+    tokens: List[CancelToken] = []
+    tokens_lock = threading.Lock()
+    entries: List[Dict[str, Any]] = []
+    start = time.monotonic()
+
+    def _task(folder, rfp_path, proposals, out_dir):
+        cancel = CancelToken(deadline_s or None)
+        with tokens_lock:
+            tokens.append(cancel)
+        return _run_one(model, gen_config, folder, rfp_path, proposals, out_dir, cancel)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_rfps), thread_name_prefix="lote")
+    futures = [executor.submit(_task, *item) for item in pending]
+    collected = set()
+    try:
+        for future in as_completed(futures):
+            entry = future.result()
+            collected.add(future)
+            entries.append(entry)
+            print(f"[{'OK' if entry['status'] == 'ok' else 'AVISO'}] {len(entries)}/{len(futures)} "
+                  f"{entry['pasta']}: {entry['status']} em {entry['tempo_s']:.0f}s, {entry['tokens']} tokens.")
+    except KeyboardInterrupt:
+        print("[AVISO] Lote interrompido; cancelando as RFPs em andamento...")
+        with tokens_lock:
+            for cancel in tokens:
+                cancel.cancel("lote interrompido pelo usuário")
+        executor.shutdown(wait=True, cancel_futures=True)
+        entries.extend(f.result() for f in futures if f not in collected and f.done() and not f.cancelled())
+    finally:
+        executor.shutdown(wait=True)
+
+    summary = summarize(entries, time.monotonic() - start)
+    summary["puladas"] = skipped
+    with open(os.path.join(out_root, "resumo_lote.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def summarize(entries: List[Dict[str, Any]], wall_s: float) -> Dict[str, Any]:
+    """Vazão do lote: RFPs concluídas por hora e tokens/custo médios por RFP."""
+    ok = [e for e in entries if e["status"] == "ok"]
+    total_tokens = sum(e["tokens"] for e in ok)
+    return {
+        "rfps": len(entries),
+        "concluidas": len(ok),
+        "falhas": sum(1 for e in entries if e["status"] == "erro"),
+        "canceladas": sum(1 for e in entries if e["status"] == "cancelado"),
+        "tempo_total_s": round(wall_s, 1),
+        "rfps_por_hora": round(len(ok) * 3600 / wall_s, 2) if wall_s > 0 else 0.0,
+        "tokens_total": total_tokens,
+        "tokens_por_rfp": round(total_tokens / len(ok)) if ok else 0,
+        "custo_total_usd": round(sum(e["custo_usd"] for e in ok), 4),
+        "tempo_medio_rfp_s": round(sum(e["tempo_s"] for e in ok) / len(ok), 1) if ok else 0.0,
+        "itens": sorted(entries, key=lambda e: e["pasta"]),
+    }
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    print("\n========== Resumo do lote ==========")
+    print(f"RFPs concluídas:  {summary['concluidas']} de {summary['rfps']} "
+          f"({summary['falhas']} com erro, {summary['canceladas']} canceladas)")
+    print(f"Tempo total:      {summary['tempo_total_s']:.0f}s "
+          f"(média de {summary['tempo_medio_rfp_s']:.0f}s por RFP)")
+    print(f"Vazão:            {summary['rfps_por_hora']:.2f} RFPs/hora")
+    print(f"Tokens por RFP:   {summary['tokens_por_rfp']} (total {summary['tokens_total']})")
+    print(f"Custo estimado:   US$ {summary['custo_total_usd']:.4f}")
+    for e in summary["itens"]:
+        if e["status"] != "ok":
+            print(f"[AVISO] {e['pasta']}: {e['status']} - {e['erro']}")
@@ -0,0 +1,90 @@
+"""
+Cancelamento e prazo de uma execução do pipeline.
+
+CancelToken é criado por execução e passado às etapas: chamadas ao modelo,
+consultas do QSA, esperas entre tentativas e a consolidação o consultam
+antes de começar e, durante o streaming, a cada pedaço recebido. cancel()
+(botão "Interromper") ou o fim do prazo (deadline_s) fazem as chamadas em
+andamento serem abandonadas e nenhuma nova ser disparada.
+
+document_timeout dimensiona o timeout de cada requisição pelo número de
+páginas e pelo tamanho do documento, limitado ao tempo que resta do prazo.
+"""
+
+import threading
+import time
+from typing import Optional
+
+from equalprop.config import TIMEOUT_BASE_S, TIMEOUT_MAX_S, TIMEOUT_MIN_S, TIMEOUT_PER_MB_S, TIMEOUT_PER_PAGE_S
+
+
+class RunCancelled(Exception):
+    """A execução foi interrompida ou esgotou o prazo; não deve ser repetida."""
+
+
+class CancelToken:
+    """Sinal de cancelamento compartilhado pelas threads de uma execução."""
+
+    def __init__(self, deadline_s: Optional[float] = None):
+        self._event = threading.Event()
+        self._reason = None
+        self.deadline = time.monotonic() + deadline_s if deadline_s else None
+
+    def cancel(self, reason: str = "execução interrompida pelo usuário") -> None:
+        if self._reason is None:
+            self._reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("prazo máximo da execução esgotado")
+            return True
+        return False
+
+    @property
+    def reason(self) -> Optional[str]:
+        return self._reason
+
+    def check(self) -> None:
+        """Levanta RunCancelled se a execução foi interrompida."""
+        if self.cancelled:
+            raise RunCancelled(self._reason)
+
+    def remaining(self) -> Optional[float]:
+        """Segundos até o prazo (None sem prazo)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def sleep(self, seconds: float) -> None:
+        """Espera seconds, acordando assim que a execução for interrompida."""
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self._event.wait(remaining)
+        else:
+            self._event.wait(max(0.0, seconds))
+        self.check()
+
+    def cap(self, timeout_s: Optional[float]) -> Optional[float]:
+        """Limita timeout_s ao tempo que resta do prazo."""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout_s
+        return max(1.0, remaining) if timeout_s is None else max(1.0, min(timeout_s, remaining))
+
+
+def check(cancel: Optional[CancelToken]) -> None:
+    """cancel.check() aceitando None."""
+    if cancel is not None:
+        cancel.check()
+
+
+def document_timeout(pages: Optional[int] = None, size_bytes: Optional[int] = None) -> Optional[float]:
+    """Timeout de uma requisição pelo tamanho do documento; None se o tamanho é desconhecido."""
+    if not pages and not size_bytes:
+        return None
+    timeout = TIMEOUT_BASE_S + (pages or 0) * TIMEOUT_PER_PAGE_S + (size_bytes or 0) / 1e6 * TIMEOUT_PER_MB_S
+    return round(min(TIMEOUT_MAX_S, max(TIMEOUT_MIN_S, timeout)))
@@ -11,14 +11,16 @@ import time
 import requests
 from typing import Dict, List, Optional
 
-def _fetch_qsa_brasilapi(cnpj: str) -> Optional[List[str]]:
+from equalprop.cancellation import check
+
+def _fetch_qsa_brasilapi(cnpj: str, timeout: float = 20) -> Optional[List[str]]:
     """Tenta obter QSA via BrasilAPI. Retorna lista de linhas ou None."""
     cnpj_digits = re.sub(r"\D", "", str(cnpj or ""))
     if len(cnpj_digits) != 14:
         return None
     url = f"https://brasilapi.com.br/api/cnpj/v1/{cnpj_digits}"
     try:
-        r = requests.get(url, timeout=20)
+        r = requests.get(url, timeout=timeout)
         if r.status_code != 200:
             return None
         data = r.json()
@@ -37,14 +39,16 @@ def _fetch_qsa_brasilapi(cnpj: str) -> Optional[List[str]]:
     except Exception:
         return None
 
-def get_quadro_societario_for_list(cnpjs_by_id: Dict[str, str]) -> Dict[str, Optional[List[str]]]:
+def get_quadro_societario_for_list(cnpjs_by_id: Dict[str, str], cancel=None) -> Dict[str, Optional[List[str]]]:
     """
     Para cada {id: cnpj}, retorna {id: [linhas_do_quadro_s��cios] | None}.
     Atualmente usa BrasilAPI. Dǭ para plugar outros provedores como fallback.
     """
     resultados: Dict[str, Optional[List[str]]] = {}
     for file_id, cnpj in cnpjs_by_id.items():
-        linhas = _fetch_qsa_brasilapi(cnpj)
+        # Execução interrompida (CancelToken): nenhuma nova consulta
+        check(cancel)
+        linhas = _fetch_qsa_brasilapi(cnpj, timeout=cancel.cap(20) if cancel is not None else 20)
         resultados[file_id] = linhas  # mantǸm None quando nǜo dispon��vel
         time.sleep(0.15)  # gentileza p/ rate limit
     return resultados
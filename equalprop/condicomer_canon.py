@@ -0,0 +1,214 @@
+"""
+Padronização local dos nomes de condições comerciais.
+
+Substitui, na maior parte das execuções, a chamada padroniza_condicomer: os
+nomes das condicoes_comerciais de cada proposta são mapeados para um nome
+padronizado por um dicionário de sinônimos (comparação via _norm_key, sem
+acentos nem separadores) e, em seguida, por semelhança de palavras. Os
+valores são pivotados localmente em proposta_1..N, no mesmo formato que o
+modelo devolvia.
+
+Só os nomes que não puderam ser classificados vão ao modelo, numa chamada
+curta com apenas esses nomes. As classificações devolvidas são gravadas em
+CACHE_DIR/condicomer_sinonimos.sqlite (compartilhado pelos processos de
+trabalho do serviço) e passam a fazer parte do dicionário nas execuções
+seguintes.
+"""
+
+import json
+import os
+import sqlite3
+import unicodedata
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from equalprop.config import CACHE_DIR, CONDICOMER_MATCH_THRESHOLD
+from equalprop.reports.relatorio_condicomer import _norm_key
+
+_DB_PATH = os.path.join(CACHE_DIR, "condicomer_sinonimos.sqlite")
+
+# Nome padronizado -> variações conhecidas
+SYNONYMS: Dict[str, List[str]] = {
+    "Validade da proposta": [
+        "validade", "validade da proposta", "prazo de validade", "validade proposta",
+        "validade do orçamento", "proposta válida por", "validade da cotação",
+    ],
+    "Condições de pagamento": [
+        "pagamento", "condições de pagamento", "condição de pagamento", "forma de pagamento",
+        "prazo de pagamento", "cond. pagamento", "cond pagto", "pagto", "condições de pagto",
+    ],
+    "Frete": [
+        "frete", "tipo de frete", "modalidade de frete", "custo de transporte", "transporte",
+        "frete cif/fob", "entrega cif/fob",
+    ],
+    "Prazo de entrega": [
+        "prazo de entrega", "entrega", "previsão de entrega", "data de entrega", "prazo entrega",
+        "prazo de fornecimento",
+    ],
+    "Reajuste": ["reajuste", "índice de reajuste", "reajuste de preços"],
+    "Garantia": ["garantia", "prazo de garantia", "garantia do produto"],
+    "Impostos": ["impostos", "tributos", "impostos inclusos", "encargos", "impostos e encargos"],
+    "Faturamento mínimo": ["faturamento mínimo", "pedido mínimo", "valor mínimo", "compra mínima"],
+    "Local de entrega": ["local de entrega", "endereço de entrega"],
+    "Observações": ["observações", "observação", "obs", "notas"],
+}
+
+_STOPWORDS = {"a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "para", "por", "p", "no", "na", "em"}
+
+
+def _tokens(text: str) -> set:
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = "".join(c if c.isalnum() else " " for c in text)
+    return {t for t in text.split() if t not in _STOPWORDS}
+
+
+@contextmanager
+def _connect():
+    """Abre o banco, executa a transação e fecha a conexão ao final."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(_DB_PATH, timeout=30)
+    try:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sinonimos (chave TEXT PRIMARY KEY, padronizado TEXT NOT NULL)")
+            yield conn
+    finally:
+        conn.close()
+
+
+def _load_learned() -> Dict[str, str]:
+    try:
+        with _connect() as conn:
+            return dict(conn.execute("SELECT chave, padronizado FROM sinonimos").fetchall())
+    except sqlite3.Error as e:
+        print(f"[AVISO] Dicionário de condições comerciais indisponível: {e}")
+        return {}
+
+
+def learn(mapping: Dict[str, str]) -> None:
+    """Grava classificações confirmadas (nome original -> padronizado) no dicionário persistente."""
+    rows = [(_norm_key(name), canonical) for name, canonical in (mapping or {}).items() if name and canonical]
+    if not rows:
+        return
+    try:
+        with _connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO sinonimos (chave, padronizado) VALUES (?, ?)", rows)
+    except sqlite3.Error as e:
+        print(f"[AVISO] Não foi possível gravar o dicionário de condições comerciais: {e}")
+
+
+def known_canonical_names() -> List[str]:
+    """Nomes padronizados conhecidos: os do dicionário embutido e os já aprendidos."""
+    return sorted(set(SYNONYMS) | set(_load_learned().values()), key=str.lower)
+
+
+class KeyCanonicalizer:
+    """Mapeia nomes de condições comerciais para nomes padronizados."""
+
+    def __init__(self, synonyms: Optional[Dict[str, Iterable[str]]] = None,
+                 learned: Optional[Dict[str, str]] = None,
+                 threshold: float = CONDICOMER_MATCH_THRESHOLD):
+        synonyms = SYNONYMS if synonyms is None else synonyms
+        self.threshold = threshold
+        self.exact: Dict[str, str] = {}
+        self.token_sets: List[Tuple[set, str]] = []
+        for canonical, variants in synonyms.items():
+            for variant in [canonical] + list(variants):
+                self.exact[_norm_key(variant)] = canonical
+                tokens = _tokens(variant)
+                if tokens:
+                    self.token_sets.append((tokens, canonical))
+        self.exact.update(_load_learned() if learned is None else learned)
+
+    @property
+    def canonical_names(self) -> List[str]:
+        return sorted(set(self.exact.values()), key=str.lower)
+
+    def canonical(self, name: str) -> Optional[str]:
+        """Nome padronizado para name, ou None quando não há correspondência segura."""
+        exact = self.exact.get(_norm_key(name))
+        if exact:
+            return exact
+        tokens = _tokens(name)
+        if not tokens:
+            return None
+        scores: Dict[str, float] = {}
+        for variant_tokens, canonical in self.token_sets:
+            overlap = len(tokens & variant_tokens)
+            if not overlap:
+                continue
+            score = overlap / len(tokens | variant_tokens)
+            # Nome que contém todas as palavras de uma variante com 2+ palavras ("prazo de pagamento 28 ddl")
+            if len(variant_tokens) >= 2 and variant_tokens <= tokens:
+                score = max(score, self.threshold)
+            scores[canonical] = max(scores.get(canonical, 0.0), score)
+        if not scores:
+            return None
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        best, best_score = ranked[0]
+        # Empate entre padronizados diferentes fica para o modelo
+        if best_score < self.threshold or (len(ranked) > 1 and ranked[1][1] == best_score):
+            return None
+        return best
+
+
+def _conditions_of(proposal: Any) -> List[Tuple[str, Any]]:
+    if isinstance(proposal, str):
+        try:
+            proposal = json.loads(proposal)
+        except ValueError:
+            return []
+    if not isinstance(proposal, dict):
+        return []
+    body = proposal.get("proposta") if isinstance(proposal.get("proposta"), dict) else proposal
+    pairs = []
+    for item in body.get("condicoes_comerciais") or []:
+        if isinstance(item, dict) and item.get("chave") and str(item["chave"]).strip().lower() != "null":
+            pairs.append((str(item["chave"]).strip(), item.get("valor")))
+    return pairs
+
+
+def _fallback_name(name: str) -> str:
+    name = " ".join(name.split())
+    return name[:1].upper() + name[1:].lower() if name else name
+
+
+def pivot_conditions(propostas_json: Dict[str, Any], mapping: Dict[str, str]) -> Dict[str, Any]:
+    """Monta {"condicoes_comerciais": [{"chave", "proposta_1", ...}]} a partir dos nomes já classificados.
+
+    Nomes ausentes de mapping ficam como vieram (só a primeira letra maiúscula).
+    Valores de uma mesma condição repetida numa proposta são unidos com "; ".
+    """
+    n = len(propostas_json)
+    rows: Dict[str, Dict[str, Any]] = {}
+    for i, proposal in enumerate(propostas_json.values(), start=1):
+        for name, value in _conditions_of(proposal):
+            key = mapping.get(name) or _fallback_name(name)
+            row = rows.setdefault(key, {"chave": key, **{f"proposta_{j}": None for j in range(1, n + 1)}})
+            if value in (None, "", "null"):
+                continue
+            value = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+            col = f"proposta_{i}"
+            row[col] = value if row[col] is None else f"{row[col]}; {value}"
+    return {"condicoes_comerciais": list(rows.values())}
+
+
+def canonicalize_conditions(propostas_json: Dict[str, Any],
+                            canonicalizer: Optional[KeyCanonicalizer] = None) -> Tuple[Dict[str, str], List[str]]:
+    """Classifica localmente os nomes de todas as propostas.
+
+    Devolve (mapeamento nome -> padronizado, nomes_não_classificados).
+    """
+    canonicalizer = canonicalizer or KeyCanonicalizer()
+    mapping: Dict[str, str] = {}
+    leftovers: List[str] = []
+    for proposal in propostas_json.values():
+        for name, _value in _conditions_of(proposal):
+            if name in mapping or name in leftovers:
+                continue
+            canonical = canonicalizer.canonical(name)
+            if canonical:
+                mapping[name] = canonical
+            else:
+                leftovers.append(name)
+    return mapping, leftovers
@@ -1,11 +1,219 @@
 import os
 import sys
+import tempfile
 import google.generativeai as genai
 
 
+# Número máximo de propostas processadas simultaneamente pelo modelo
+MAX_CONCURRENT_PROPOSALS = int(os.environ.get("EQUALPROP_MAX_CONCURRENCY", "4"))
+# Número máximo de uploads simultâneos para a Files API
+MAX_CONCURRENT_UPLOADS = int(os.environ.get("EQUALPROP_UPLOAD_CONCURRENCY", "4"))
+# Pede as respostas das propostas em streaming para usar o cabeçalho antes do fim
+STREAM_RESPONSES = os.environ.get("EQUALPROP_STREAM", "1") not in ("0", "false", "no")
+
+# Diretório dos caches persistentes (uploads, respostas do modelo, etc.)
+CACHE_DIR = os.environ.get("EQUALPROP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".equalprop_cache"))
+# A Files API mantém os arquivos por 48h; reenviamos com folga antes disso
+UPLOAD_CACHE_TTL_HOURS = float(os.environ.get("EQUALPROP_UPLOAD_CACHE_TTL_HOURS", "46"))
+UPLOAD_CACHE_MAX_ENTRIES = int(os.environ.get("EQUALPROP_UPLOAD_CACHE_MAX_ENTRIES", "500"))
+# Cache de respostas do modelo (chamadas determinísticas, temperature 0.0)
+RESPONSE_CACHE_ENABLED = os.environ.get("EQUALPROP_RESPONSE_CACHE", "1") not in ("0", "false", "no")
+RESPONSE_CACHE_MAX_MB = float(os.environ.get("EQUALPROP_RESPONSE_CACHE_MAX_MB", "200"))
+
+# Envia o texto extraído localmente no lugar do PDF quando a camada de texto é confiável
+TEXT_FAST_PATH = os.environ.get("EQUALPROP_TEXT_FAST_PATH", "1") not in ("0", "false", "no")
+TEXT_MIN_CHARS_PER_PAGE = int(os.environ.get("EQUALPROP_TEXT_MIN_CHARS_PER_PAGE", "200"))
+TEXT_MAX_GARBAGE_RATIO = float(os.environ.get("EQUALPROP_TEXT_MAX_GARBAGE_RATIO", "0.05"))
+
+# Poda de páginas irrelevantes (catálogos, certificados, fichas técnicas) das propostas longas;
+# EQUALPROP_PAGE_PRUNING=0 volta a enviar o documento completo
+PAGE_PRUNING = os.environ.get("EQUALPROP_PAGE_PRUNING", "1") not in ("0", "false", "no")
+# Documentos com menos páginas que isto seguem inteiros
+PAGE_PRUNING_MIN_PAGES = int(os.environ.get("EQUALPROP_PAGE_PRUNING_MIN_PAGES", "4"))
+# Pontuação mínima para uma página ser considerada tabela de preços/condições comerciais
+PAGE_PRUNING_MIN_SCORE = float(os.environ.get("EQUALPROP_PAGE_PRUNING_MIN_SCORE", "6"))
+
+# Preparação dos documentos (texto e poda) num pool de processos único, reaproveitado entre
+# execuções: cada processo reimporta o pacote ao nascer, então só documentos a partir de
+# PREPARE_POOL_MIN_MB (e ao menos dois deles) vão ao pool; os demais são lidos na própria thread
+PREPARE_WORKERS = int(os.environ.get("EQUALPROP_PREPARE_WORKERS", "4"))
+PREPARE_POOL_MIN_MB = float(os.environ.get("EQUALPROP_PREPARE_POOL_MIN_MB", "5"))
+
+# Otimização dos PDFs antes do envio: reamostra imagens acima de PDF_SLIM_TARGET_DPI,
+# remove imagens duplicadas e objetos sem uso e comprime os fluxos de conteúdo
+PDF_SLIM = os.environ.get("EQUALPROP_PDF_SLIM", "1") not in ("0", "false", "no")
+# Arquivos menores que isto seguem sem otimização
+PDF_SLIM_MIN_MB = float(os.environ.get("EQUALPROP_PDF_SLIM_MIN_MB", "2"))
+PDF_SLIM_TARGET_DPI = int(os.environ.get("EQUALPROP_PDF_SLIM_TARGET_DPI", "150"))
+PDF_SLIM_JPEG_QUALITY = int(os.environ.get("EQUALPROP_PDF_SLIM_JPEG_QUALITY", "75"))
+
+# Documentos até este tamanho vão inline na requisição (sem upload prévio);
+# os maiores seguem pela Files API em upload resumable, em blocos de UPLOAD_CHUNK_MB
+INLINE_MAX_MB = float(os.environ.get("EQUALPROP_INLINE_MAX_MB", "4"))
+UPLOAD_CHUNK_MB = int(os.environ.get("EQUALPROP_UPLOAD_CHUNK_MB", "8"))
+
+# Similaridade mínima (Dice de trigramas) para dois nomes do QSA serem o mesmo sócio
+SOCIO_MATCH_THRESHOLD = float(os.environ.get("EQUALPROP_SOCIO_MATCH_THRESHOLD", "0.88"))
+# Sobreposição mínima de palavras para um nome de condição comercial ser padronizado sem o modelo
+CONDICOMER_MATCH_THRESHOLD = float(os.environ.get("EQUALPROP_CONDICOMER_MATCH_THRESHOLD", "0.6"))
+
+# Cache de contexto do prefixo comum (rfp_json + proposta_prompt) das chamadas de proposta
+CONTEXT_CACHE_ENABLED = os.environ.get("EQUALPROP_CONTEXT_CACHE", "1") not in ("0", "false", "no")
+CONTEXT_CACHE_TTL_S = float(os.environ.get("EQUALPROP_CONTEXT_CACHE_TTL_S", "3600"))
+# Só compensa criar o cache a partir deste número de propostas
+CONTEXT_CACHE_MIN_PROPOSALS = int(os.environ.get("EQUALPROP_CONTEXT_CACHE_MIN_PROPOSALS", "3"))
+# Usa a versão local (sem chamada à API de cache), útil para testes offline
+CONTEXT_CACHE_LOCAL = os.environ.get("EQUALPROP_CONTEXT_CACHE_LOCAL", "0") in ("1", "true", "yes")
+
+# Limites de cota do modelo, compartilhados por todas as sessões do processo
+RATE_LIMIT_RPM = float(os.environ.get("EQUALPROP_RATE_LIMIT_RPM", "150"))
+RATE_LIMIT_TPM = float(os.environ.get("EQUALPROP_RATE_LIMIT_TPM", "2000000"))
+# Teto do limite adaptativo de chamadas simultâneas ao modelo
+MAX_MODEL_CONCURRENCY = int(os.environ.get("EQUALPROP_MAX_MODEL_CONCURRENCY", "8"))
+# Latência acima da qual o limite de concorrência é reduzido, nas etapas sem documento anexado
+# (condicomer, reparo); por etapa: EQUALPROP_LATENCY_TARGET_<ETAPA> (ver stage_settings)
+LATENCY_TARGET_S = float(os.environ.get("EQUALPROP_LATENCY_TARGET_S", "120"))
+MAX_RETRIES = int(os.environ.get("EQUALPROP_MAX_RETRIES", "3"))
+# Estimativa de tokens de um documento anexado, usada antes de a resposta informar o total real
+DOC_TOKEN_ESTIMATE = int(os.environ.get("EQUALPROP_DOC_TOKEN_ESTIMATE", "8000"))
+
+# Requisições de proposta "hedged": passado o percentil HEDGE_PERCENTILE da latência histórica
+# de documentos de tamanho parecido, uma cópia da chamada é disparada e vale a primeira resposta válida
+HEDGE_ENABLED = os.environ.get("EQUALPROP_HEDGE", "1") not in ("0", "false", "no")
+HEDGE_PERCENTILE = float(os.environ.get("EQUALPROP_HEDGE_PERCENTILE", "95"))
+# Amostras mínimas para usar o histórico; antes disso vale HEDGE_DEFAULT_DELAY_S
+HEDGE_MIN_SAMPLES = int(os.environ.get("EQUALPROP_HEDGE_MIN_SAMPLES", "5"))
+HEDGE_DEFAULT_DELAY_S = float(os.environ.get("EQUALPROP_HEDGE_DEFAULT_DELAY_S", "90"))
+# Teto de chamadas extras (cópias) por execução
+HEDGE_MAX_PER_RUN = int(os.environ.get("EQUALPROP_HEDGE_MAX_PER_RUN", "2"))
+
+# Modelo, orçamento de raciocínio, teto de saída e timeout de cada etapa. EQUALPROP_MODEL_PRESET
+# escolhe o ponto de partida: "quality" (gemini-2.5-pro em tudo, como antes) ou "latency" (modelos
+# flash nas etapas auxiliares, com teto de saída e timeout curtos; só a associação PDC<->POP das
+# propostas fica no pro). Cada valor pode ser sobrescrito por etapa: EQUALPROP_MODEL_<ETAPA>,
+# EQUALPROP_THINKING_<ETAPA>, EQUALPROP_MAX_OUTPUT_<ETAPA> e EQUALPROP_TIMEOUT_<ETAPA>
+# (ETAPA = RFP, PROPOSTA, CONDICOMER, REPARO). None deixa o padrão da API (raciocínio dinâmico,
+# saída máxima, timeout do SDK). O SDK fixado não envia thinking_budget (ver build_gen_config),
+# por isso os presets não o definem: o flash-lite já vem sem raciocínio e o flash raciocina
+# de forma dinâmica.
+DEFAULT_MODEL = "gemini-2.5-pro"
+MODEL_PRESET = os.environ.get("EQUALPROP_MODEL_PRESET", "quality").strip().lower()
+STAGE_PRESETS = {
+    "quality": {
+        "rfp": {"model": DEFAULT_MODEL, "thinking_budget": None, "max_output_tokens": None, "timeout_s": None},
+        # timeout None: dimensionado por documento (cancellation.document_timeout)
+        "proposta": {"model": DEFAULT_MODEL, "thinking_budget": None, "max_output_tokens": None, "timeout_s": None},
+        "condicomer": {"model": DEFAULT_MODEL, "thinking_budget": None, "max_output_tokens": None, "timeout_s": None},
+        "reparo": {"model": DEFAULT_MODEL, "thinking_budget": None, "max_output_tokens": None, "timeout_s": None},
+    },
+    "latency": {
+        "rfp": {"model": "gemini-2.5-flash", "thinking_budget": None, "max_output_tokens": 16384, "timeout_s": 120},
+        "proposta": {"model": DEFAULT_MODEL, "thinking_budget": None, "max_output_tokens": None, "timeout_s": None},
+        "condicomer": {"model": "gemini-2.5-flash-lite", "thinking_budget": None, "max_output_tokens": 2048,
+                       "timeout_s": 30},
+        "reparo": {"model": "gemini-2.5-flash", "thinking_budget": None, "max_output_tokens": None, "timeout_s": 120},
+    },
+}
+
+
+def _optional_int(value):
+    value = (value or "").strip().lower()
+    if value in ("", "none", "auto"):
+        return None
+    return int(float(value))
+
+
+# Etapas que enviam o documento inteiro: a duração acompanha o tamanho dele e não indica
+# sobrecarga da API, então o limitador só reage aos 429 (latency_target_s None)
+_DOCUMENT_STAGES = ("rfp", "proposta")
+
+
+def stage_settings(stage: str) -> dict:
+    """Modelo, thinking_budget, max_output_tokens, timeout_s e latency_target_s de uma etapa.
+
+    stage pode ter sufixo ("proposta_hedge", "rfp_reparo"...).
+    """
+    stage = stage or ""
+    if stage.endswith("_reparo"):
+        base = "reparo"
+    elif stage.startswith("proposta"):
+        base = "proposta"
+    else:
+        base = stage
+    preset = STAGE_PRESETS.get(MODEL_PRESET, STAGE_PRESETS["quality"])
+    settings = dict(preset.get(base) or {"model": DEFAULT_MODEL, "thinking_budget": None,
+                                         "max_output_tokens": None, "timeout_s": None})
+    settings.setdefault("latency_target_s", None if base in _DOCUMENT_STAGES else LATENCY_TARGET_S)
+    suffix = base.upper()
+    if os.environ.get(f"EQUALPROP_MODEL_{suffix}"):
+        settings["model"] = os.environ[f"EQUALPROP_MODEL_{suffix}"].strip()
+    for key, env in (("thinking_budget", "THINKING"), ("max_output_tokens", "MAX_OUTPUT"), ("timeout_s", "TIMEOUT"),
+                     ("latency_target_s", "LATENCY_TARGET")):
+        if f"EQUALPROP_{env}_{suffix}" in os.environ:
+            settings[key] = _optional_int(os.environ[f"EQUALPROP_{env}_{suffix}"])
+    return settings
+
+
+# Timeout de cada requisição de proposta dimensionado pelo documento:
+# base + páginas * por_página + MB * por_MB, entre o mínimo e o máximo
+TIMEOUT_BASE_S = float(os.environ.get("EQUALPROP_TIMEOUT_BASE_S", "45"))
+TIMEOUT_PER_PAGE_S = float(os.environ.get("EQUALPROP_TIMEOUT_PER_PAGE_S", "6"))
+TIMEOUT_PER_MB_S = float(os.environ.get("EQUALPROP_TIMEOUT_PER_MB_S", "10"))
+TIMEOUT_MIN_S = float(os.environ.get("EQUALPROP_TIMEOUT_MIN_S", "60"))
+TIMEOUT_MAX_S = float(os.environ.get("EQUALPROP_TIMEOUT_MAX_S", "600"))
+# Prazo total de uma execução do pipeline (0 = sem prazo)
+RUN_DEADLINE_S = float(os.environ.get("EQUALPROP_RUN_DEADLINE_S", "0"))
+
+# Execuções em segundo plano (equalprop.jobs): relatórios simultâneos, onde ficam os
+# relatórios gerados e por quanto tempo um job terminado continua disponível
+MAX_CONCURRENT_JOBS = int(os.environ.get("EQUALPROP_MAX_JOBS", "2"))
+JOBS_DIR = os.environ.get("EQUALPROP_JOBS_DIR", os.path.join(tempfile.gettempdir(), "equalprop_jobs"))
+JOB_RETENTION_S = float(os.environ.get("EQUALPROP_JOB_RETENTION_S", str(6 * 3600)))
+
+# Serviço compartilhado (equalprop.server): fila SQLite persistente, processos de trabalho e API HTTP local
+SERVICE_DIR = os.environ.get("EQUALPROP_SERVICE_DIR", os.path.join(os.path.expanduser("~"), ".equalprop_service"))
+SERVICE_WORKERS = int(os.environ.get("EQUALPROP_SERVICE_WORKERS", "2"))
+SERVICE_HOST = os.environ.get("EQUALPROP_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("EQUALPROP_SERVICE_PORT", "8765"))
+SERVICE_MAX_UPLOAD_MB = float(os.environ.get("EQUALPROP_SERVICE_MAX_UPLOAD_MB", "200"))
+# Job "em execução" sem sinal de vida do processo há mais que isto volta para a fila
+SERVICE_STALE_S = float(os.environ.get("EQUALPROP_SERVICE_STALE_S", "60"))
+# Tentativas de um job interrompido (queda do processo/servidor) antes de marcá-lo como erro
+SERVICE_MAX_ATTEMPTS = int(os.environ.get("EQUALPROP_SERVICE_MAX_ATTEMPTS", "3"))
+
+# Processamento em lote (python -m equalprop batch): RFPs processadas ao mesmo tempo;
+# as chamadas ao modelo de todas elas dividem EQUALPROP_MAX_MODEL_CONCURRENCY
+BATCH_CONCURRENT_RFPS = int(os.environ.get("EQUALPROP_BATCH_RFPS", "3"))
+
+# Backend do modelo: "gemini" (API real), "record" (API real gravando as chamadas em fitas)
+# ou "replay" (serve as fitas gravadas, sem rede nem cota)
+MODEL_BACKEND = os.environ.get("EQUALPROP_BACKEND", "gemini").strip().lower()
+CASSETTE_DIR = os.environ.get("EQUALPROP_CASSETTE_DIR", os.path.join(CACHE_DIR, "fitas"))
+# Replay: multiplica a latência gravada (0 = instantâneo) e injeta falhas transitórias (429/503)
+REPLAY_LATENCY_SCALE = float(os.environ.get("EQUALPROP_REPLAY_LATENCY_SCALE", "1.0"))
+REPLAY_FAILURE_RATE = float(os.environ.get("EQUALPROP_REPLAY_FAILURE_RATE", "0.0"))
+REPLAY_SEED = os.environ.get("EQUALPROP_REPLAY_SEED") or None
+
+# Orçamento opcional de tokens por execução (0 = sem limite)
+RUN_TOKEN_BUDGET = int(os.environ.get("EQUALPROP_RUN_TOKEN_BUDGET", "0"))
+# Preços de referência (USD por milhão de tokens) para estimar o custo de cada execução;
+# tokens de raciocínio são cobrados como saída
+MODEL_PRICES_USD_PER_MTOK = {
+    "gemini-2.5-pro": {"input": 1.25, "output": 10.00},
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+    "gemini-2.5-flash-lite": {"input": 0.10, "output": 0.40},
+}
+
+
 def setup_gemini_client():
     """Initialize Gemini client"""
+    from equalprop.backend import get_backend
+
+    backend = get_backend()
     api_key = os.environ.get("GOOGLE_API_KEY")
+    if not backend.needs_api_key:
+        print(f"[INFO] Backend '{MODEL_BACKEND}': fitas em {CASSETTE_DIR}.")
+        return backend.model(stage_settings("proposta")["model"])
     if not api_key:
         print("[ERRO] GOOGLE_API_KEY não encontrada nas variáveis de ambiente")
         print("Configure a variável de ambiente:")
@@ -13,16 +221,70 @@ def setup_gemini_client():
         print("   Windows  : set GOOGLE_API_KEY=sua_chave_aqui")
         sys.exit(1)
     try:
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel('gemini-2.5-pro')
+        backend.configure(api_key)
+        return backend.model(stage_settings("proposta")["model"])
     except Exception as e:
         print(f"[ERRO] Falha ao configurar Gemini: {e}")
         sys.exit(1)
 
 
-def build_gen_config(temperature: float = 0.0, response_mime_type: str = "application/json"):
+# O google-generativeai fixado em requirements.txt não tem thinking_config no GenerationConfig
+# (a API recusa o campo com ValueError); o orçamento de raciocínio só é enviado se o SDK o aceitar
+SDK_SUPPORTS_THINKING = "thinking_config" in genai.protos.GenerationConfig.meta.fields
+_thinking_warned = False
+
+
+def build_gen_config(temperature: float = 0.0, response_mime_type: str = "application/json", stage: str = None,
+                     max_output_tokens: int = None, thinking_budget: int = None):
+    """Configuração de geração; com stage, o teto de saída e o raciocínio vêm de stage_settings().
+
+    thinking_budget só é aplicado quando o SDK instalado conhece thinking_config
+    (SDK_SUPPORTS_THINKING); caso contrário é descartado com um aviso e vale o
+    raciocínio padrão do modelo.
+    """
+    global _thinking_warned
+    if stage is not None:
+        settings = stage_settings(stage)
+        max_output_tokens = settings["max_output_tokens"] if max_output_tokens is None else max_output_tokens
+        thinking_budget = settings["thinking_budget"] if thinking_budget is None else thinking_budget
+    if thinking_budget is not None and not SDK_SUPPORTS_THINKING:
+        if not _thinking_warned:
+            _thinking_warned = True
+            print(f"[AVISO] O SDK google-generativeai {genai.__version__} não aceita thinking_config; "
+                  f"thinking_budget={thinking_budget} ignorado (vale o raciocínio padrão do modelo).")
+        thinking_budget = None
+    if thinking_budget is not None:
+        config = {"temperature": temperature, "response_mime_type": response_mime_type,
+                  "thinking_config": {"thinking_budget": thinking_budget}}
+        if max_output_tokens is not None:
+            config["max_output_tokens"] = max_output_tokens
+        return config
+    if max_output_tokens is not None:
+        return genai.types.GenerationConfig(
+            temperature=temperature,
+            response_mime_type=response_mime_type,
+            max_output_tokens=max_output_tokens,
+        )
     return genai.types.GenerationConfig(
         temperature=temperature,
         response_mime_type=response_mime_type,
     )
 
+
+def gen_config_value(gen_config, name: str, default=None):
+    """Lê um campo da configuração de geração, seja GenerationConfig ou dict."""
+    if isinstance(gen_config, dict):
+        return gen_config.get(name, default)
+    return getattr(gen_config, name, default)
+
+
+def stage_gen_config(gen_config, stage: str):
+    """Configuração da etapa, mantendo temperature e response_mime_type de gen_config."""
+    if gen_config is None:
+        return None
+    return build_gen_config(
+        temperature=gen_config_value(gen_config, "temperature", 0.0),
+        response_mime_type=gen_config_value(gen_config, "response_mime_type", "application/json"),
+        stage=stage,
+    )
+
@@ -0,0 +1,78 @@
+"""
+Cache de contexto para o prefixo comum das chamadas de proposta.
+
+Todas as propostas de uma execução recebem o mesmo rfp_json e o mesmo
+proposta_prompt. SharedPrefixModel cria, uma vez por execução, um
+CachedContent com esse prefixo (TTL explícito, removido ao final) e faz as
+chamadas de cada proposta enviando apenas o documento. Se a API recusar o
+cache (ex.: prefixo abaixo do mínimo de tokens) ou com CONTEXT_CACHE_LOCAL,
+o mesmo objeto funciona localmente, reenviando o prefixo a cada chamada,
+o que permite testar o fluxo sem rede.
+"""
+
+import datetime
+
+from equalprop.backend import get_backend
+from equalprop.config import CONTEXT_CACHE_LOCAL, CONTEXT_CACHE_TTL_S
+
+
+class SharedPrefixModel:
+    """Modelo que antepõe prefix_contents a cada chamada, via cache remoto ou localmente."""
+
+    def __init__(self, base_model, prefix_contents, cached_content=None):
+        self.base_model = base_model
+        self.prefix_contents = list(prefix_contents)
+        self.cached_content = cached_content
+        self._remote_model = None
+        self.calls = 0
+        if cached_content is not None:
+            self._remote_model = get_backend().model_from_cached(cached_content)
+
+    @property
+    def model_name(self):
+        return getattr(self.base_model, "model_name", None)
+
+    @property
+    def is_remote(self) -> bool:
+        return self._remote_model is not None
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        if self._remote_model is not None:
+            return self._remote_model.generate_content(contents=list(contents), **kwargs)
+        return self.base_model.generate_content(contents=self.prefix_contents + list(contents), **kwargs)
+
+    def close(self) -> None:
+        """Remove o cache remoto (se houver); chamadas seguintes passam a ser locais."""
+        cached, self.cached_content, self._remote_model = self.cached_content, None, None
+        if cached is None:
+            return
+        try:
+            cached.delete()
+            print(f"[INFO] Cache de contexto removido após {self.calls} chamadas.")
+        except Exception as e:
+            print(f"[AVISO] Falha ao remover cache de contexto: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def create_shared_prefix(base_model, prefix_contents, ttl_s: float = CONTEXT_CACHE_TTL_S) -> SharedPrefixModel:
+    """Cria o cache remoto do prefixo; em caso de falha devolve a versão local."""
+    if CONTEXT_CACHE_LOCAL:
+        return SharedPrefixModel(base_model, prefix_contents)
+    try:
+        cached = get_backend().create_cached_content(
+            base_model.model_name,
+            list(prefix_contents),
+            ttl=datetime.timedelta(seconds=ttl_s),
+            display_name="equalprop-prefixo-propostas",
+        )
+        print(f"[OK] Cache de contexto criado ({getattr(cached, 'name', 'sem-id')}, TTL {ttl_s:.0f}s).")
+        return SharedPrefixModel(base_model, prefix_contents, cached_content=cached)
+    except Exception as e:
+        print(f"[AVISO] Cache de contexto indisponível, prefixo será reenviado: {e}")
+        return SharedPrefixModel(base_model, prefix_contents)
@@ -1,79 +1,484 @@
 ﻿import os
 import json
 import time
-import google.generativeai as genai
-import base64
-from tenacity import retry, stop_after_attempt, wait_exponential
+import queue
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from equalprop import response_cache, upload_cache
+from equalprop.backend import get_backend
+from equalprop.cancellation import RunCancelled, check
+from equalprop.config import DOC_TOKEN_ESTIMATE, STREAM_RESPONSES, gen_config_value, stage_gen_config, stage_settings
+from equalprop.hedging import HedgeCancelled, part_size
+from equalprop.json_repair import PROPOSTA, SCHEMA_PROMPTS, JsonRepairError, describe_problems, parse_response, summarize_repairs
+from equalprop.json_stream import IncrementalJsonScanner, parse_event
+from equalprop.payloads import rfp_payload_for_proposals
+from equalprop.prompts import reparo_json_prompt
+from equalprop.rate_limit import call_with_retries, get_limiter
+from equalprop.transport import INLINE, choose_transport, make_inline_part
+
+
+def upload_pdf(pdf_path):
+    """Envia um PDF e devolve o handle do Gemini (ou None em caso de falha).
+
+    Arquivos até INLINE_MAX_MB seguem inline, sem round trip de upload. Os
+    demais vão pela Files API; conteúdos já enviados e ainda válidos são
+    reaproveitados a partir do upload_cache, sem reenviar nenhum byte.
+    """
+    try:
+        file_name = os.path.basename(pdf_path)
+        size = os.path.getsize(pdf_path)
+        if choose_transport(size) == INLINE:
+            print(f"[INFO] {file_name} ({size / 1e6:.1f} MB) segue inline, sem upload.")
+            return make_inline_part(pdf_path)
+        digest = upload_cache.file_sha256(pdf_path)
+        cached = upload_cache.lookup(digest)
+        if cached == "inline":
+            print(f"[INFO] {file_name} preparado via inline_data (preferência em cache).")
+            return make_inline_part(pdf_path)
+        if cached is not None:
+            print(f"[OK] {file_name} reaproveitado do cache! (ID: {cached.name})")
+            return cached
+        print(f"[INFO] Enviando: {file_name} ({size / 1e6:.1f} MB)...")
+        try:
+            uploaded_file = get_backend().upload_file(pdf_path)
+            file_id = getattr(uploaded_file, 'name', None) or getattr(uploaded_file, 'uri', None) or 'sem-id'
+            print(f"[OK] {file_name} enviado! (ID: {file_id})")
+            upload_cache.store(digest, uploaded_file)
+            return uploaded_file
+        except Exception as ue:
+            if 'ragStoreName' in str(ue):
+                print(f"[WARN] Upload falhou por 'ragStoreName'. Usando inline_data para {file_name}.")
+                inline_obj = make_inline_part(pdf_path)
+                upload_cache.store(digest, inline=True)
+                print(f"[OK] {file_name} preparado via inline_data.")
+                return inline_obj
+            raise ue
+    except Exception as e:
+        print(f"[ERRO] Erro ao enviar {pdf_path}: {str(e)}")
+        return None
 
 
 def upload_pdfs_to_gemini(pdf_files):
     """Faz upload de PDFs para o Gemini.
 
-    Tenta usar a Files API. Se o backend exigir "ragStoreName",
-    faz fallback para inline_data (base64), evitando a rota de RAG.
+    Pequenos seguem inline; os demais vão pela Files API. Se o backend exigir
+    "ragStoreName", faz fallback para inline_data, evitando a rota de RAG.
     """
     uploaded_files = []
-
-    def _make_inline_pdf(path: str):
-        with open(path, "rb") as f:
-            data_b64 = base64.b64encode(f.read()).decode("utf-8")
-        return {"inline_data": {"mime_type": "application/pdf", "data": data_b64}}
-
     for pdf_path in pdf_files:
-        try:
-            file_name = os.path.basename(pdf_path)
-            print(f"[INFO] Enviando: {file_name}...")
-            try:
-                uploaded_file = genai.upload_file(
-                    path=pdf_path,
-                    mime_type='application/pdf'
-                )
-                uploaded_files.append(uploaded_file)
-                file_id = getattr(uploaded_file, 'name', None) or getattr(uploaded_file, 'uri', None) or 'sem-id'
-                print(f"[OK] {file_name} enviado! (ID: {file_id})")
-            except Exception as ue:
-                if 'ragStoreName' in str(ue):
-                    print(f"[WARN] Upload falhou por 'ragStoreName'. Usando inline_data para {file_name}.")
-                    inline_obj = _make_inline_pdf(pdf_path)
-                    uploaded_files.append(inline_obj)
-                    print(f"[OK] {file_name} preparado via inline_data.")
-                else:
-                    raise ue
-        except Exception as e:
-            print(f"[ERRO] Erro ao enviar {pdf_path}: {str(e)}")
+        uploaded_file = upload_pdf(pdf_path)
+        if uploaded_file is not None:
+            uploaded_files.append(uploaded_file)
     return uploaded_files
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def process_proposal_with_retry(model, rfp_json, proposal_file, prompt, gen_config):
-    """Processa proposta com retry"""
+def submit_uploads(pdf_files, executor):
+    """Agenda o upload de cada PDF no executor e devolve um Future por arquivo.
+
+    Os Futures seguem a ordem de pdf_files e resolvem para o handle do Gemini
+    (ou None em caso de falha). Podem ser passados diretamente a
+    process_all_proposals, que inicia cada proposta assim que seu upload termina.
+    """
+    return [executor.submit(upload_pdf, pdf_path) for pdf_path in pdf_files]
+
+
+def _model_name(model) -> str:
+    return getattr(model, "model_name", None) or type(model).__name__
+
+
+# Modelos de etapa por backend: após set_backend (replay <-> API real, testes), o
+# backend novo cria os seus e os do anterior são descartados com ele
+_stage_models: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def stage_model(model, stage):
+    """Modelo configurado para a etapa (ver config.stage_settings).
+
+    model é o modelo principal (o das propostas, criado por
+    setup_gemini_client); etapas configuradas com esse mesmo nome o usam
+    diretamente. As demais recebem, pelo backend atual, o modelo do nome
+    configurado, criado uma vez por nome e backend.
+    """
+    name = stage_settings(stage)["model"]
+    if not name or name in (stage_settings("proposta")["model"], _model_name(model).split("/")[-1]):
+        return model
+    backend = get_backend()
+    models = _stage_models.setdefault(backend, {})
+    if name not in models:
+        models[name] = backend.model(name)
+    return models[name]
+
+
+def _is_cacheable(text, gen_config) -> bool:
+    """Só guarda respostas JSON que de fato decodificam."""
+    if not text:
+        return False
+    if gen_config_value(gen_config, "response_mime_type") != "application/json":
+        return True
+    try:
+        json.loads(text)
+        return True
+    except ValueError:
+        return False
+
+
+def _chunk_text(chunk) -> str:
+    # Pedaços sem partes de texto (ex.: apenas metadados) levantam ValueError em .text
     try:
-        rfp_json_str = json.dumps(rfp_json)
-        response = model.generate_content(
-            contents=[rfp_json_str, proposal_file, prompt],
-            generation_config=gen_config,
-            request_options={"timeout": 180}
-        )
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+
+def _estimate_tokens(contents) -> int:
+    """Estimativa grosseira de tokens de entrada, usada pelo balde TPM antes da chamada."""
+    total = 0
+    for part in contents:
+        total += len(part) // 4 if isinstance(part, str) else DOC_TOKEN_ESTIMATE
+    return total
+
+
+def _close_stream(response) -> None:
+    # Melhor esforço: encerra o stream gRPC para a API parar de gerar (e de cobrar)
+    iterator = getattr(response, "_iterator", None)
+    for target in (iterator, response):
+        closer = getattr(target, "cancel", None) or getattr(target, "close", None)
+        if callable(closer):
+            try:
+                closer()
+                return
+            except Exception:
+                pass
+
+
+def _call_model(model, contents, kwargs, on_chunk, stream, cancel, timing, on_start=None, latency_target_s=None):
+    """Executa generate_content numa vaga do limitador de chamadas.
+
+    Com cancel, a chamada é abandonada assim que a execução é interrompida: o
+    stream em andamento é fechado daqui e a thread da chamada só devolve a vaga
+    ao terminar de fato (uma chamada sem streaming termina no seu timeout, já
+    limitado ao prazo de cancel). timing["start"] recebe o instante em que a
+    vaga foi obtida, quando on_start() também é chamado. latency_target_s é o
+    alvo de latência da etapa para o limitador (ver config.stage_settings).
+    """
+    box = {}
+
+    def _body():
+        with get_limiter().slot(_estimate_tokens(contents), latency_target_s) as slot:
+            # Interrompida enquanto esperava a vaga: nada a enviar
+            check(cancel)
+            timing["start"] = time.time()
+            if on_start is not None:
+                on_start()
+            if stream:
+                response = box["stream"] = model.generate_content(contents=contents, stream=True, **kwargs)
+                for chunk in response:
+                    if cancel is not None and cancel.cancelled:
+                        _close_stream(response)
+                        raise RunCancelled(cancel.reason)
+                    piece = _chunk_text(chunk)
+                    if piece and on_chunk is not None:
+                        on_chunk(piece)
+            else:
+                response = model.generate_content(contents=contents, **kwargs)
+                if on_chunk is not None:
+                    on_chunk(getattr(response, "text", None) or "")
+            slot.tokens = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
         return response
+
+    if cancel is None:
+        return _body()
+    # A chamada bloqueante roda numa thread própria: a espera aqui acorda a cada
+    # 0,5 s para verificar o cancelamento e libera o chamador sem esperar o timeout
+    done = threading.Event()
+
+    def _run():
+        try:
+            box["response"] = _body()
+        except BaseException as e:
+            box["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=_run, name="chamada-modelo", daemon=True).start()
+    while not done.wait(0.5):
+        if cancel.cancelled:
+            if "stream" in box:
+                _close_stream(box["stream"])
+            raise RunCancelled(cancel.reason)
+    if "error" in box:
+        raise box["error"]
+    return box["response"]
+
+
+def generate(model, contents, gen_config, request_options=None, on_chunk=None, ledger=None, stage="modelo",
+             cancel=None, timeout_s=None, on_start=None):
+    """Chama o modelo passando pelo cache persistente de respostas.
+
+    Com on_chunk, a resposta é pedida em streaming e on_chunk(texto) recebe
+    cada pedaço assim que chega (numa resposta em cache, o texto inteiro de uma vez).
+    Com ledger (RunLedger), a chamada é contabilizada sob o nome stage e o
+    orçamento de tokens da execução é verificado antes do disparo. Sem
+    request_options, o timeout é timeout_s ou, na falta dele, o configurado
+    para a etapa, limitado ao prazo restante de cancel (CancelToken); com
+    cancel a resposta também vem em streaming, para que uma execução
+    interrompida encerre a geração no próximo pedaço. on_start() é chamado
+    quando a requisição sai de fato, depois da vaga do limitador.
+    """
+    check(cancel)
+    model_name = _model_name(model)
+    # Modelos com prefixo em cache (SharedPrefixModel) recebem só o sufixo, mas a
+    # chave do cache de respostas considera o conteúdo completo
+    prefix = list(getattr(model, "prefix_contents", None) or [])
+    key = response_cache.make_key(model_name, prefix + list(contents), gen_config)
+    text = response_cache.get(key)
+    if text is not None:
+        print("[INFO] Resposta servida pelo cache.")
+        if ledger is not None:
+            ledger.record(stage, model_name, cached=True)
+        if on_chunk is not None:
+            on_chunk(text)
+        return response_cache.CachedResponse(text)
+    if ledger is not None:
+        ledger.check_budget(stage)
+    kwargs = {"generation_config": gen_config}
+    if request_options is None:
+        timeout = timeout_s or stage_settings(stage)["timeout_s"]
+        if cancel is not None:
+            timeout = cancel.cap(timeout)
+        if timeout:
+            request_options = {"timeout": timeout}
+    if request_options:
+        kwargs["request_options"] = request_options
+    timing = {"start": time.time()}
+    try:
+        stream = STREAM_RESPONSES and (on_chunk is not None or cancel is not None)
+        response = _call_model(model, contents, kwargs, on_chunk, stream, cancel, timing, on_start,
+                               stage_settings(stage)["latency_target_s"])
+        text = getattr(response, "text", None)
     except Exception as e:
-        print(f"[ERRO] {str(e)}")
+        if ledger is not None:
+            ledger.record(stage, model_name, elapsed_s=time.time() - timing["start"], error=str(e))
         raise
+    if ledger is not None:
+        ledger.record(stage, model_name, getattr(response, "usage_metadata", None),
+                      elapsed_s=time.time() - timing["start"])
+    if _is_cacheable(text, gen_config):
+        response_cache.put(key, text)
+    return response
 
 
-def process_all_proposals(model, rfp_json, proposal_files, proposal_paths, prompt, gen_config):
-    """Processa todas as propostas"""
-    results = {}
-    for proposal_file, proposal_path in zip(proposal_files, proposal_paths):
-        if proposal_file is None:
-            continue
-        print(f"\n[INFO] Processando: {os.path.basename(proposal_path)}")
+def load_model_json(model, kind, text, gen_config, original_contents=None, ledger=None, stage="modelo", cancel=None,
+                    **ctx):
+    """Valida a resposta JSON (ver json_repair), reparando-a localmente.
+
+    Se o reparo local não bastar, faz um único pedido de correção: só a
+    resposta quebrada e o schema quando o problema é de sintaxe; os
+    conteúdos originais junto quando faltam partes que dependem do documento.
+    Levanta JsonRepairError se a correção também falhar.
+    """
+    try:
+        data, repairs = parse_response(text, kind, **ctx)
+        if repairs:
+            print(f"[INFO] {stage}: resposta reparada localmente ({summarize_repairs(repairs)}).")
+        return data
+    except JsonRepairError as e:
+        print(f"[AVISO] {stage}: resposta inválida ({e}); pedindo correção ao modelo.")
+        error = e
+    if error.syntax_only or original_contents is None:
+        # Sem documentos: o prefixo compartilhado (se houver) também é dispensável
+        # e a correção pode ir ao modelo (mais leve) da etapa de reparo
+        target = stage_model(getattr(model, "base_model", model), f"{stage}_reparo")
+        gen_config = stage_gen_config(gen_config, f"{stage}_reparo")
+        contents = [reparo_json_prompt, SCHEMA_PROMPTS[kind], describe_problems(error), text or ""]
+    else:
+        target = model
+        contents = list(original_contents) + [reparo_json_prompt, describe_problems(error), text or ""]
+    response = call_with_retries(
+        lambda: generate(target, contents, gen_config, ledger=ledger, stage=f"{stage}_reparo", cancel=cancel),
+        label=f"{stage}_reparo", cancel=cancel
+    )
+    data, repairs = parse_response(getattr(response, "text", None), kind, **ctx)
+    if repairs:
+        print(f"[INFO] {stage}: correção do modelo reparada localmente ({summarize_repairs(repairs)}).")
+    print(f"[OK] {stage}: resposta corrigida pelo modelo.")
+    return data
+
+
+def generate_json(model, contents, gen_config, kind, ledger=None, stage="modelo", cancel=None, **ctx):
+    """generate() com repetição de erros transitórios e validação da resposta JSON."""
+    response = call_with_retries(
+        lambda: generate(model, contents, gen_config, ledger=ledger, stage=stage, cancel=cancel),
+        label=stage, cancel=cancel
+    )
+    return load_model_json(model, kind, getattr(response, "text", None), gen_config,
+                           original_contents=contents, ledger=ledger, stage=stage, cancel=cancel, **ctx)
+
+
+def _proposal_stream_handler(on_header=None, on_pop=None):
+    """Cria o callback de streaming que emite o header e cada pop assim que fecham."""
+    scanner = IncrementalJsonScanner()
+
+    def _on_chunk(text):
+        for path, raw in scanner.feed(text):
+            if path == ("proposta", "header") and on_header:
+                on_header(parse_event(raw))
+            elif len(path) == 3 and path[:2] == ("proposta", "pops") and on_pop:
+                on_pop(path[2], parse_event(raw))
+
+    return _on_chunk
+
+
+def _proposal_contents(model, rfp_json, proposal_file, prompt):
+    if getattr(model, "prefix_contents", None) is not None:
+        # rfp_json e prompt já estão no prefixo compartilhado (ver context_cache)
+        return [proposal_file]
+    return [rfp_payload_for_proposals(rfp_json), proposal_file, prompt]
+
+
+def process_proposal_with_retry(model, rfp_json, proposal_file, prompt, gen_config,
+                                on_header=None, on_pop=None, ledger=None, hedger=None, cancel=None, timeout_s=None):
+    """Processa proposta com retry.
+
+    Apenas erros transitórios (429, 5xx, timeout) são repetidos, respeitando o
+    Retry-After da API. Se model for um SharedPrefixModel criado com
+    proposal_prefix(), só o documento é enviado a cada chamada. on_header(dict) e on_pop(indice, dict) são chamados
+    durante o streaming, à medida que o cabeçalho e cada POP se completam.
+    Com hedger (hedging.Hedger), uma chamada que demore além do histórico de
+    latência ganha uma cópia; vale a primeira resposta válida. timeout_s é o
+    timeout de cada requisição (ver cancellation.document_timeout) e cancel
+    (CancelToken) interrompe as chamadas em andamento e as novas tentativas.
+    """
+    contents = _proposal_contents(model, rfp_json, proposal_file, prompt)
+
+    def _attempt(hedge_cancel=None, hedge=False, sent=None):
         try:
-            start_time = time.time()
-            response = process_proposal_with_retry(model, rfp_json, proposal_file, prompt, gen_config)
-            results[proposal_path] = response.text
-            print(f"[OK] Concluido em {time.time() - start_time:.2f}s")
+            # Um parser novo por tentativa: o streaming recomeça do zero. A cópia
+            # não emite eventos, para não duplicar o header e os POPs
+            handler = _proposal_stream_handler(on_header, on_pop) if (on_header or on_pop) and not hedge else None
+            on_chunk = handler
+            if hedge_cancel is not None:
+                def on_chunk(text):
+                    if hedge_cancel.is_set():
+                        raise HedgeCancelled("chamada superada pela cópia")
+                    if handler is not None:
+                        handler(text)
+            return generate(
+                model,
+                contents,
+                gen_config,
+                on_chunk=on_chunk,
+                ledger=ledger,
+                stage="proposta_hedge" if hedge else "proposta",
+                cancel=cancel,
+                timeout_s=timeout_s,
+                on_start=sent
+            )
+        except (HedgeCancelled, RunCancelled):
+            raise
         except Exception as e:
-            print(f"[ERRO] Falha ao processar {proposal_path}: {str(e)}")
-            results[proposal_path] = None
-    return results
+            print(f"[ERRO] {str(e)}")
+            raise
+
+    if hedger is None:
+        return call_with_retries(_attempt, label="proposta", cancel=cancel)
 
+    def _is_valid(response):
+        try:
+            parse_response(getattr(response, "text", None), PROPOSTA)
+            return True
+        except JsonRepairError:
+            return False
+
+    return hedger.call(
+        lambda hedge_cancel, hedge, sent: call_with_retries(lambda: _attempt(hedge_cancel, hedge, sent),
+                                                      label="proposta_hedge" if hedge else "proposta",
+                                                      cancel=cancel),
+        part_size(proposal_file), is_valid=_is_valid, label="proposta"
+    )
+
+
+def proposal_prefix(rfp_json, prompt):
+    """Prefixo comum a todas as chamadas de proposta de uma execução."""
+    return [rfp_payload_for_proposals(rfp_json), prompt]
+
+
+def process_proposal(model, rfp_json, proposal_file, proposal_path, prompt, gen_config,
+                     on_header=None, on_pop=None, ledger=None, hedger=None, cancel=None, timeout_s=None):
+    """Processa uma proposta e devolve o JSON validado da resposta, como texto (ou None em caso de falha)."""
+    if isinstance(proposal_file, Future):
+        try:
+            proposal_file = proposal_file.result()
+        except Exception as e:
+            proposal_file = None
+            print(f"[ERRO] Upload de {proposal_path} falhou: {str(e)}")
+        if proposal_file is None:
+            print(f"[ERRO] Proposta {os.path.basename(proposal_path)} ignorada: arquivo não enviado")
+            return None
+    print(f"\n[INFO] Processando: {os.path.basename(proposal_path)}")
+    try:
+        start_time = time.time()
+        response = process_proposal_with_retry(model, rfp_json, proposal_file, prompt, gen_config,
+                                               on_header=on_header, on_pop=on_pop, ledger=ledger, hedger=hedger,
+                                               cancel=cancel, timeout_s=timeout_s)
+        data = load_model_json(model, PROPOSTA, response.text, gen_config,
+                               original_contents=_proposal_contents(model, rfp_json, proposal_file, prompt),
+                               ledger=ledger, stage="proposta", cancel=cancel)
+        print(f"[OK] {os.path.basename(proposal_path)} concluido em {time.time() - start_time:.2f}s")
+        return json.dumps(data, ensure_ascii=False)
+    except RunCancelled:
+        raise
+    except Exception as e:
+        print(f"[ERRO] Falha ao processar {proposal_path}: {str(e)}")
+        return None
+
+
+def process_all_proposals(model, rfp_json, proposal_files, proposal_paths, prompt, gen_config,
+                          max_workers=1, on_done=None, ledger=None, hedger=None, cancel=None, timeout_s=None):
+    """Processa todas as propostas.
+
+    proposal_files pode conter handles já enviados ou Futures de submit_uploads;
+    neste caso cada proposta é despachada assim que o seu upload termina.
+    Com max_workers > 1 as chamadas ao modelo são feitas em paralelo, com no
+    máximo max_workers requisições em andamento. O dicionário de resultados
+    preserva a ordem de entrada. Se informado, on_done(proposal_path, concluidas, total)
+    é chamado na thread chamadora a cada proposta finalizada. ledger, hedger,
+    cancel e timeout_s são repassados a process_proposal, como no pipeline.
+    """
+    jobs = [(f, p) for f, p in zip(proposal_files, proposal_paths) if f is not None]
+    results = {path: None for _, path in jobs}
+    total = len(jobs)
+    start_time = time.time()
+
+    if max_workers <= 1 or total <= 1:
+        for done, (proposal_file, proposal_path) in enumerate(jobs, start=1):
+            results[proposal_path] = process_proposal(model, rfp_json, proposal_file, proposal_path, prompt, gen_config,
+                                                      ledger=ledger, hedger=hedger, cancel=cancel,
+                                                      timeout_s=timeout_s)
+            if on_done:
+                on_done(proposal_path, done, total)
+        return results
+
+    finished = queue.Queue()
+    with ThreadPoolExecutor(max_workers=min(max_workers, total)) as executor:
+        def _dispatch(proposal_file, proposal_path):
+            future = executor.submit(process_proposal, model, rfp_json, proposal_file, proposal_path, prompt, gen_config,
+                                     ledger=ledger, hedger=hedger, cancel=cancel, timeout_s=timeout_s)
+            future.add_done_callback(lambda f, p=proposal_path: finished.put((p, f)))
+
+        for proposal_file, proposal_path in jobs:
+            if isinstance(proposal_file, Future):
+                proposal_file.add_done_callback(lambda uf, p=proposal_path: _dispatch(uf, p))
+            else:
+                _dispatch(proposal_file, proposal_path)
+
+        for done in range(1, total + 1):
+            proposal_path, future = finished.get()
+            results[proposal_path] = future.result()
+            if on_done:
+                on_done(proposal_path, done, total)
+
+    print(f"[OK] {total} propostas processadas em {time.time() - start_time:.2f}s")
+    return results
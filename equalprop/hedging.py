@@ -0,0 +1,299 @@
+"""
+Requisições "hedged" para cortar a cauda de latência das propostas.
+
+LatencyHistory guarda, por faixa de tamanho do documento (potências de 2 em
+bytes), as latências observadas em CACHE_DIR/latencias.sqlite. Além da
+resposta vencedora, entram as chamadas canceladas ainda em andamento como
+amostras censuradas ("levou pelo menos N s"): sem elas o histórico só veria
+as chamadas rápidas e o percentil ficaria baixo. O percentil é estimado por
+Kaplan-Meier. As amostras são gravadas em lotes, numa transação SQLite, e
+vários processos podem gravar ao mesmo tempo.
+
+Hedger.call dispara a chamada e, se ela passar do percentil configurado do
+histórico (contado desde o envio da requisição, depois da vaga do
+limitador), dispara uma cópia; vale a primeira resposta válida e a outra é
+cancelada (o streaming é interrompido no próximo pedaço). O número de cópias
+por execução é limitado e os contadores ficam em Hedger.stats().
+"""
+
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from equalprop.config import (
+    CACHE_DIR,
+    HEDGE_DEFAULT_DELAY_S,
+    HEDGE_MAX_PER_RUN,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+)
+
+_HISTORY_PATH = os.path.join(CACHE_DIR, "latencias.sqlite")
+_MAX_SAMPLES_PER_BUCKET = 50
+# Amostras acumuladas em memória antes de uma gravação
+_FLUSH_EVERY = 10
+
+# (latência em s, censurada): censurada = chamada cancelada antes de terminar
+Sample = Tuple[float, bool]
+
+
+class HedgeCancelled(Exception):
+    """Levantada dentro da chamada perdedora para interromper o streaming."""
+
+
+def part_size(part: Any) -> int:
+    """Tamanho aproximado, em bytes, do documento enviado numa chamada."""
+    if isinstance(part, str):
+        return len(part.encode("utf-8"))
+    if isinstance(part, dict):
+        inline = part.get("inline_data")
+        if isinstance(inline, dict):
+            return len(inline.get("data") or b"")
+    try:
+        return int(getattr(part, "size_bytes", 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _bucket(size_bytes: int) -> str:
+    return str(int(math.log2(size_bytes)) if size_bytes > 0 else 0)
+
+
+def _percentile(samples: List[Sample], pct: float) -> float:
+    """Percentil de Kaplan-Meier: amostras censuradas contam como "pelo menos" a latência.
+
+    Se as censuradas impedem a estimativa (cauda toda cancelada), devolve a
+    maior latência observada, que é um limite inferior do percentil.
+    """
+    # Em empates, o término vem antes da censura
+    ordered = sorted(samples, key=lambda s: (s[0], s[1]))
+    target = 1.0 - pct / 100.0
+    at_risk, survival = len(ordered), 1.0
+    for latency, censored in ordered:
+        if not censored:
+            survival *= 1.0 - 1.0 / at_risk
+            if survival <= target + 1e-9:
+                return latency
+        at_risk -= 1
+    return ordered[-1][0]
+
+
+class LatencyHistory:
+    """Latências observadas por faixa de tamanho, persistidas entre execuções."""
+
+    def __init__(self, path: str = _HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, float, bool]] = []
+        try:
+            self._samples: Dict[str, List[Sample]] = self._load()
+        except sqlite3.Error as e:
+            print(f"[AVISO] Histórico de latência indisponível: {e}")
+            self._samples = {}
+
+    @contextmanager
+    def _connect(self):
+        """Abre o banco, executa a transação e fecha a conexão ao final."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS latencies ("
+                    " bucket TEXT NOT NULL, latency REAL NOT NULL, censored INTEGER NOT NULL,"
+                    " recorded_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS latencies_bucket ON latencies (bucket, recorded_at)")
+                yield conn
+        finally:
+            conn.close()
+
+    def _load(self, conn=None) -> Dict[str, List[Sample]]:
+        if conn is None:
+            with self._connect() as conn:
+                return self._load(conn)
+        samples: Dict[str, List[Sample]] = {}
+        for bucket, latency, censored in conn.execute(
+                "SELECT bucket, latency, censored FROM latencies ORDER BY recorded_at"):
+            samples.setdefault(bucket, []).append((latency, bool(censored)))
+        return samples
+
+    def record(self, size_bytes: int, latency_s: float, censored: bool = False) -> None:
+        """Registra uma latência; censored indica chamada cancelada ainda em andamento."""
+        with self._lock:
+            bucket = _bucket(size_bytes)
+            samples = self._samples.setdefault(bucket, [])
+            samples.append((round(latency_s, 3), censored))
+            del samples[:-_MAX_SAMPLES_PER_BUCKET]
+            self._pending.append((bucket, round(latency_s, 3), censored))
+            if len(self._pending) < _FLUSH_EVERY:
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        """Grava as amostras pendentes e recarrega as dos demais processos."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            now = time.time()
+            try:
+                with self._connect() as conn:
+                    conn.executemany("INSERT INTO latencies (bucket, latency, censored, recorded_at)"
+                                     " VALUES (?, ?, ?, ?)",
+                                     [(b, lat, int(c), now) for b, lat, c in pending])
+                    for bucket in {b for b, _, _ in pending}:
+                        conn.execute(
+                            "DELETE FROM latencies WHERE bucket = ? AND rowid NOT IN (SELECT rowid FROM latencies"
+                            " WHERE bucket = ? ORDER BY recorded_at DESC, rowid DESC LIMIT ?)",
+                            (bucket, bucket, _MAX_SAMPLES_PER_BUCKET))
+                    self._samples = self._load(conn)
+            except sqlite3.Error as e:
+                print(f"[AVISO] Não foi possível gravar o histórico de latência: {e}")
+
+    def threshold(self, size_bytes: int, pct: float = HEDGE_PERCENTILE,
+                  min_samples: int = HEDGE_MIN_SAMPLES) -> Optional[float]:
+        """Percentil da faixa do documento (ou de todas as faixas); None sem amostras suficientes.
+
+        min_samples conta só as latências completas, não as censuradas.
+        """
+        with self._lock:
+            samples = list(self._samples.get(_bucket(size_bytes), []))
+            if _completed(samples) < min_samples:
+                samples = [v for values in self._samples.values() for v in values]
+        if _completed(samples) < min_samples:
+            return None
+        return _percentile(samples, pct)
+
+
+def _completed(samples: List[Sample]) -> int:
+    return sum(1 for _, censored in samples if not censored)
+
+
+_history: Optional[LatencyHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_history() -> LatencyHistory:
+    """Histórico único para o processo."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = LatencyHistory()
+        return _history
+
+
+class Hedger:
+    """Dispara cópias de chamadas lentas, com teto de cópias por execução."""
+
+    def __init__(self, max_extra: int = HEDGE_MAX_PER_RUN, history: Optional[LatencyHistory] = None,
+                 default_delay_s: float = HEDGE_DEFAULT_DELAY_S):
+        self.max_extra = max(0, int(max_extra))
+        self.history = history or get_history()
+        self.default_delay_s = default_delay_s
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "fired": 0, "won": 0, "skipped_cap": 0}
+
+    def delay_for(self, size_bytes: int) -> float:
+        threshold = self.history.threshold(size_bytes)
+        return self.default_delay_s if threshold is None else threshold
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self._stats["fired"] >= self.max_extra:
+                self._stats["skipped_cap"] += 1
+                return False
+            self._stats["fired"] += 1
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def call(self, attempt: Callable[[threading.Event, bool, Callable[[], None]], Any], size_bytes: int,
+             is_valid: Optional[Callable[[Any], bool]] = None, label: str = "chamada"):
+        """Executa attempt(cancelar, eh_copia, enviada) com hedging e devolve o primeiro resultado válido.
+
+        attempt deve consultar o Event cancelar (ex.: a cada pedaço do
+        streaming) e desistir quando ele for ligado, e chamar enviada() no
+        instante em que a requisição sai de fato (depois de obter a vaga do
+        limitador; de novo a cada nova tentativa). O prazo da cópia e as
+        latências do histórico contam a partir daí, sem a espera na fila nem
+        o backoff entre tentativas. Se nenhum resultado for válido, devolve o
+        último recebido; se todos falharem, levanta o erro da chamada original.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+        events: "queue.Queue" = queue.Queue()
+        cancels: List[threading.Event] = []
+        # Instante do último envio de cada chamada ainda em andamento
+        sent: Dict[bool, float] = {}
+
+        def _launch(hedge: bool):
+            cancel = threading.Event()
+            cancels.append(cancel)
+
+            def _sent():
+                events.put((hedge, "sent", time.monotonic()))
+
+            def _run():
+                try:
+                    events.put((hedge, "ok", attempt(cancel, hedge, _sent)))
+                except BaseException as e:
+                    events.put((hedge, "error", e))
+
+            threading.Thread(target=_run, name=f"hedge-{label}", daemon=True).start()
+
+        delay = self.delay_for(size_bytes)
+        _launch(False)
+        launched, finished, hedge_decided = 1, 0, False
+        errors, last_value = [], None
+        while True:
+            # O prazo da cópia só corre depois que a chamada original foi enviada
+            timeout = None
+            if not hedge_decided and False in sent:
+                timeout = max(0.0, delay - (time.monotonic() - sent[False]))
+            try:
+                hedge, kind, value = events.get(timeout=timeout)
+            except queue.Empty:
+                hedge_decided = True
+                if self._reserve():
+                    print(f"[INFO] {label}: sem resposta após {delay:.0f}s; disparando cópia da chamada.")
+                    _launch(True)
+                    launched += 1
+                continue
+            if kind == "sent":
+                sent[hedge] = value
+                continue
+            finished += 1
+            started = sent.pop(hedge, None)
+            elapsed = time.monotonic() - started if started is not None else 0.0
+            if kind == "ok" and started is not None:
+                self.history.record(size_bytes, elapsed)
+            if kind == "ok" and (is_valid is None or is_valid(value)):
+                for cancel in cancels:
+                    cancel.set()
+                # As chamadas canceladas levariam pelo menos o tempo já decorrido desde o envio
+                now = time.monotonic()
+                for other in sent.values():
+                    self.history.record(size_bytes, now - other, censored=True)
+                if hedge:
+                    with self._lock:
+                        self._stats["won"] += 1
+                    print(f"[OK] {label}: a cópia respondeu primeiro ({elapsed:.1f}s).")
+                return value
+            if kind == "ok":
+                last_value = value
+            elif not isinstance(value, HedgeCancelled):
+                errors.append((hedge, value))
+            if finished >= launched:
+                # Nenhuma chamada pendente: encerra com o que houver
+                if last_value is not None:
+                    return last_value
+                original = [e for h, e in errors if not h] or [e for _, e in errors]
+                raise original[0]
@@ -1,11 +1,34 @@
 ﻿import os
 import re
 import io
+import multiprocessing
+import hashlib
+import shutil
+import threading
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import PyPDF2
 from PyPDF2 import PdfWriter, PdfReader
+from PyPDF2.generic import IndirectObject, NameObject, NumberObject
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 
+from equalprop.config import (
+    PAGE_PRUNING,
+    PAGE_PRUNING_MIN_PAGES,
+    PAGE_PRUNING_MIN_SCORE,
+    PDF_SLIM,
+    PDF_SLIM_JPEG_QUALITY,
+    PDF_SLIM_MIN_MB,
+    PDF_SLIM_TARGET_DPI,
+    PREPARE_POOL_MIN_MB,
+    PREPARE_WORKERS,
+    TEXT_FAST_PATH,
+    TEXT_MAX_GARBAGE_RATIO,
+    TEXT_MIN_CHARS_PER_PAGE,
+)
+
 
 def sanitize_filename(filename: str) -> str:
     """Remove caracteres inválidos de nomes de arquivo"""
@@ -16,6 +39,64 @@ def sanitize_filename(filename: str) -> str:
     return filename.strip()
 
 
+_WRITE_CHUNK = 1024 * 1024
+
+
+def save_upload(src, dst_path: str, chunk_size: int = _WRITE_CHUNK) -> str:
+    """Grava src (bytes ou arquivo com read(), ex.: UploadedFile) em dst_path em blocos.
+
+    Nenhuma cópia inteira do conteúdo é criada: os blocos vão direto para o
+    disco e o SHA-256 é calculado no caminho e registrado no upload_cache,
+    que assim não precisa reler o arquivo. Devolve o digest.
+    """
+    # Import tardio: upload_cache carrega o backend do modelo
+    from equalprop.upload_cache import remember_sha256
+
+    h = hashlib.sha256()
+    with open(dst_path, 'wb') as dst:
+        if isinstance(src, (bytes, bytearray, memoryview)):
+            view = memoryview(src)
+            for start in range(0, len(view), chunk_size):
+                block = view[start:start + chunk_size]
+                h.update(block)
+                dst.write(block)
+        else:
+            if hasattr(src, 'seek'):
+                src.seek(0)
+            buf = memoryview(bytearray(chunk_size))
+            readinto = getattr(src, 'readinto', None)
+            while True:
+                if readinto is not None:
+                    block = buf[:readinto(buf) or 0]
+                else:
+                    block = src.read(chunk_size)
+                if not len(block):
+                    break
+                h.update(block)
+                dst.write(block)
+    digest = h.hexdigest()
+    remember_sha256(dst_path, digest)
+    return digest
+
+
+def link_or_copy(src_path: str, dst_path: str) -> None:
+    """Coloca src_path em dst_path sem passar os bytes pelo processo.
+
+    Mesmo arquivo: nada a fazer. Senão, um hard link (mesmo sistema de
+    arquivos) ou, em último caso, a cópia feita pelo kernel (shutil.copyfile).
+    Um dst_path existente é removido antes, nunca sobrescrito: se ele fosse um
+    link para o original do usuário, abrir com 'wb' o truncaria.
+    """
+    if os.path.abspath(src_path) == os.path.abspath(dst_path):
+        return
+    if os.path.lexists(dst_path):
+        os.remove(dst_path)
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copyfile(src_path, dst_path)
+
+
 def excel_to_pdf(excel_path: str, pdf_path: str) -> bool:
     """Converte Excel para PDF simples (texto tabular)"""
     try:
@@ -50,8 +131,185 @@ def excel_to_pdf(excel_path: str, pdf_path: str) -> bool:
         return False
 
 
-def process_files(file_paths, temp_dir):
-    """Processa arquivos selecionados; converte Excel em PDF e copia PDFs"""
+# slim_pdf troca os bytes codificados dos fluxos de imagem, o que a API pública do
+# PyPDF2 não oferece (EncodedStreamObject.set_data levanta erro). O acesso interno
+# fica restrito às duas funções abaixo e só roda na série verificada, fixada em
+# requirements.txt; em outra versão slim_pdf não altera o PDF.
+_SLIM_PYPDF2_SERIES = "3.0."
+
+
+def _slim_supported() -> bool:
+    return getattr(PyPDF2, "__version__", "").startswith(_SLIM_PYPDF2_SERIES)
+
+
+def _encoded_bytes(xobj) -> bytes:
+    """Conteúdo do fluxo como gravado no arquivo (ainda codificado)."""
+    return xobj._data
+
+
+def _replace_encoded_bytes(xobj, data: bytes) -> None:
+    """Troca o conteúdo codificado e descarta a versão decodificada em cache."""
+    xobj._data = data
+    if hasattr(xobj, 'decoded_self'):
+        xobj.decoded_self = None
+
+
+def _image_filter(xobj):
+    """Último filtro da cadeia (ex.: [/ASCII85Decode /DCTDecode] -> /DCTDecode)."""
+    filters = xobj.get('/Filter')
+    if isinstance(filters, list):
+        return filters[-1] if filters else None
+    return filters
+
+
+def _downsample_image(xobj, page_w_pt: float, page_h_pt: float, target_dpi: int, quality: int) -> bool:
+    """Reamostra uma imagem (DCT ou Flate, 8 bits, RGB/cinza) para target_dpi, em JPEG.
+
+    Sem interpretar o fluxo de conteúdo, supõe-se que a imagem ocupa no máximo
+    a página inteira, o que subestima a resolução efetiva (nunca reduz demais).
+    """
+    from PIL import Image
+
+    width, height = int(xobj.get('/Width', 0)), int(xobj.get('/Height', 0))
+    if not width or not height or page_w_pt <= 0 or page_h_pt <= 0:
+        return False
+    dpi = max(width / (page_w_pt / 72.0), height / (page_h_pt / 72.0))
+    if dpi <= target_dpi * 1.1:
+        return False
+    # Máscaras, decodificações customizadas e espaços de cor indexados ficam como estão
+    if any(k in xobj for k in ('/SMask', '/Mask', '/Decode', '/ImageMask')):
+        return False
+    colorspace = xobj.get('/ColorSpace')
+    mode = {'/DeviceRGB': 'RGB', '/DeviceGray': 'L'}.get(colorspace)
+    filt = _image_filter(xobj)
+    if mode is None or int(xobj.get('/BitsPerComponent', 8)) != 8 or filt not in ('/DCTDecode', '/FlateDecode'):
+        return False
+    raw = _encoded_bytes(xobj)
+    # get_data() desfaz os filtros anteriores; o DCT é devolvido ainda em JPEG
+    if filt == '/DCTDecode':
+        img = Image.open(io.BytesIO(xobj.get_data()))
+    else:
+        img = Image.frombytes(mode, (width, height), xobj.get_data())
+    scale = target_dpi / dpi
+    new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    img = img.convert(mode).resize(new_size, Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=quality, optimize=True)
+    data = buf.getvalue()
+    if len(data) >= len(raw):
+        return False
+    _replace_encoded_bytes(xobj, data)
+    xobj[NameObject('/Filter')] = NameObject('/DCTDecode')
+    xobj[NameObject('/Width')] = NumberObject(new_size[0])
+    xobj[NameObject('/Height')] = NumberObject(new_size[1])
+    xobj.pop('/DecodeParms', None)
+    return True
+
+
+def _slim_xobjects(resources, page_w_pt, page_h_pt, seen, done, stats, target_dpi, quality):
+    """Percorre as imagens de um dicionário de recursos (e de formulários aninhados).
+
+    target_dpi 0 desativa a reamostragem, mantendo só a deduplicação.
+    """
+    xobjects = resources.get('/XObject') if resources else None
+    if not xobjects:
+        return
+    xobjects = xobjects.get_object()
+    for name in list(xobjects.keys()):
+        ref = xobjects.raw_get(name)  # __getitem__ já resolveria a referência indireta
+        xobj = ref.get_object()
+        subtype = xobj.get('/Subtype')
+        if subtype == '/Form':
+            if id(xobj) not in done:
+                done.add(id(xobj))
+                _slim_xobjects(xobj.get('/Resources'), page_w_pt, page_h_pt, seen, done, stats, target_dpi, quality)
+            continue
+        if subtype != '/Image':
+            continue
+        digest = hashlib.sha256(_encoded_bytes(xobj)).hexdigest() + f":{xobj.get('/Width')}x{xobj.get('/Height')}"
+        first = seen.get(digest)
+        if first is not None and isinstance(ref, IndirectObject) and first is not ref:
+            # Imagem idêntica já vista: aponta para o mesmo objeto e o writer grava uma cópia só
+            if first.get_object() is not xobj:
+                xobjects[NameObject(name)] = first
+                stats["dedup"] += 1
+            continue
+        if isinstance(ref, IndirectObject):
+            seen[digest] = ref
+        if id(xobj) in done:
+            continue
+        done.add(id(xobj))
+        if target_dpi <= 0:
+            continue
+        try:
+            if _downsample_image(xobj, page_w_pt, page_h_pt, target_dpi, quality):
+                stats["resampled"] += 1
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"[AVISO] Imagem {name} mantida sem reamostragem: {e}")
+
+
+def slim_pdf(src_path: str, dst_path: str, target_dpi: int = PDF_SLIM_TARGET_DPI,
+             quality: int = PDF_SLIM_JPEG_QUALITY) -> bool:
+    """Grava em dst_path uma versão menor do PDF.
+
+    Reamostra imagens acima de target_dpi, deduplica imagens idênticas,
+    descarta objetos não referenciados pelas páginas (o PdfWriter só grava o
+    que é alcançável) e comprime os fluxos de conteúdo. O PyPDF2 não grava
+    object streams (PDF 1.5), então a tabela de objetos segue sem compressão.
+    Devolve False (sem gravar dst_path) quando o resultado não é menor ou
+    quando a versão instalada do PyPDF2 não é a verificada (_SLIM_PYPDF2_SERIES).
+    """
+    if not _slim_supported():
+        print(f"[AVISO] PyPDF2 {getattr(PyPDF2, '__version__', '?')} não verificado para a otimização; "
+              f"{os.path.basename(src_path)} segue sem otimizar.")
+        return False
+    try:
+        from PIL import Image  # noqa: F401
+        has_pillow = True
+    except ImportError:
+        has_pillow = False
+        print("[AVISO] Pillow não instalado; imagens não serão reamostradas.")
+    try:
+        reader = PdfReader(src_path)
+        writer = PdfWriter()
+        seen, done = {}, set()
+        stats = {"resampled": 0, "dedup": 0, "errors": 0}
+        for page in reader.pages:
+            box = page.mediabox
+            _slim_xobjects(page.get('/Resources'), float(box.width), float(box.height),
+                           seen, done, stats, target_dpi if has_pillow else 0, quality)
+            writer.add_page(page)
+        for page in writer.pages:
+            page.compress_content_streams()
+        buf = io.BytesIO()
+        writer.write(buf)
+    except Exception as e:
+        print(f"[AVISO] Não foi possível otimizar {os.path.basename(src_path)}: {e}")
+        return False
+    before, after = os.path.getsize(src_path), buf.tell()
+    name = os.path.basename(src_path)
+    if after >= before:
+        print(f"[INFO] {name}: otimização não reduziu o arquivo ({before / 1e6:.1f} MB), mantido o original.")
+        return False
+    # Grava ao lado e substitui: dst_path pode ser um link para o original
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(buf.getbuffer())
+    os.replace(tmp_path, dst_path)
+    print(f"[OK] {name}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+          f"(-{100 * (before - after) / before:.0f}%; {stats['resampled']} imagens reamostradas, "
+          f"{stats['dedup']} duplicadas removidas).")
+    return True
+
+
+def process_files(file_paths, temp_dir, slim: bool = PDF_SLIM):
+    """Processa arquivos selecionados; converte Excel em PDF e copia PDFs
+
+    Com slim, PDFs a partir de PDF_SLIM_MIN_MB são gravados já otimizados
+    (ver slim_pdf); os demais entram em temp_dir por link_or_copy, sem
+    ler o conteúdo (arquivos que já estão em temp_dir ficam onde estão).
+    """
     pdf_files = []
 
     for file_path in file_paths:
@@ -63,16 +321,271 @@ def process_files(file_paths, temp_dir):
 
         if file_name.lower().endswith(('.xlsx', '.xls')):
             pdf_path = os.path.join(temp_dir, f"{os.path.splitext(file_name)[0]}.pdf")
+            # Pode ser um link para um PDF original; remover em vez de sobrescrever
+            if os.path.lexists(pdf_path):
+                os.remove(pdf_path)
             if excel_to_pdf(file_path, pdf_path):
                 pdf_files.append(pdf_path)
                 print(f"[OK] Arquivo {file_name} convertido para PDF com sucesso.")
         else:
             pdf_path = os.path.join(temp_dir, file_name)
-            with open(file_path, 'rb') as src_file:
-                file_content = src_file.read()
-            with open(pdf_path, 'wb') as dst_file:
-                dst_file.write(file_content)
+            slimmed = (slim and os.path.getsize(file_path) >= PDF_SLIM_MIN_MB * 1e6
+                       and slim_pdf(file_path, pdf_path))
+            if not slimmed:
+                link_or_copy(file_path, pdf_path)
             pdf_files.append(pdf_path)
             print(f"[OK] Arquivo {file_name} aceito.")
 
     return pdf_files
+
+
+def extract_pdf_text(pdf_path: str):
+    """Extrai o texto de cada página com PyPDF2 (lista vazia em caso de falha)."""
+    try:
+        reader = PdfReader(pdf_path)
+        return [(page.extract_text() or '') for page in reader.pages]
+    except Exception as e:
+        print(f"[AVISO] Não foi possível ler o texto de {os.path.basename(pdf_path)}: {e}")
+        return []
+
+
+def _garbage_ratio(text: str) -> float:
+    """Fração de caracteres que não parecem texto legível (controle, uso privado, U+FFFD)."""
+    if not text:
+        return 1.0
+    bad = 0
+    for ch in text:
+        if ch in '\n\t ':
+            continue
+        cat = unicodedata.category(ch)
+        if ch == '\ufffd' or cat in ('Cc', 'Co', 'Cs', 'Cn'):
+            bad += 1
+    return bad / len(text)
+
+
+def text_layer_is_trustworthy(pages, min_chars_per_page: int = TEXT_MIN_CHARS_PER_PAGE,
+                              max_garbage_ratio: float = TEXT_MAX_GARBAGE_RATIO) -> bool:
+    """Decide se a camada de texto representa o documento.
+
+    Exige densidade mínima de caracteres por página (PDFs digitalizados têm
+    pouco ou nenhum texto), proporção baixa de caracteres ilegíveis e que a
+    extração não tenha quebrado as palavras letra a letra.
+    """
+    if not pages:
+        return False
+    text = '\n'.join(pages)
+    stripped = re.sub(r'\s+', '', text)
+    if len(stripped) < min_chars_per_page * len(pages):
+        return False
+    # Páginas quase vazias no meio do documento costumam ser imagens (tabelas digitalizadas)
+    empty_pages = sum(1 for p in pages if len(p.strip()) < min_chars_per_page // 4)
+    if empty_pages > len(pages) // 4:
+        return False
+    if _garbage_ratio(text) > max_garbage_ratio:
+        return False
+    tokens = text.split()
+    single = sum(1 for t in tokens if len(t) == 1)
+    return not tokens or single / len(tokens) < 0.5
+
+
+def _compact_document_text(pdf_path: str, pages, page_numbers=None) -> str:
+    parts = [f"[Conteúdo textual do documento PDF {os.path.basename(pdf_path)}]"]
+    page_numbers = page_numbers or range(1, len(pages) + 1)
+    for number, page in zip(page_numbers, pages):
+        page = re.sub(r'[ \t]+', ' ', page)
+        page = re.sub(r'\n\s*\n+', '\n', page).strip()
+        parts.append(f"--- Página {number} ---\n{page}")
+    return '\n'.join(parts)
+
+
+_CURRENCY_RE = re.compile(r'R\$\s*\d|\b\d{1,3}(?:\.\d{3})*,\d{2}\b')
+_QTY_UNIT_RE = re.compile(
+    r'\b\d+(?:[.,]\d+)?\s*(?:un|und|unid|unidades?|pc|pcs|kg|g|t|ton|m|m2|m3|ml|mm|cm|l|lt|litros?|'
+    r'cx|caixas?|sc|sacos?|barras?|gl|galoes|galao|rolos?|pares?|jg|conj|kit|vb|verba)\b'
+)
+# Cabeçalhos típicos de tabela de preços
+_TABLE_HEADER_WORDS = ('qtd', 'qtde', 'quant', 'quantidade', 'unitario', 'valor unit', 'preco', 'valor total',
+                       'subtotal', 'total geral', 'item', 'descricao', 'unidade')
+# Palavras de condições comerciais
+_COMMERCIAL_WORDS = ('validade', 'frete', 'pagamento', 'entrega', 'garantia', 'reajuste',
+                     'impostos', 'icms', 'ipi', 'difal', 'cif', 'fob', 'condicoes comerciais', 'faturamento',
+                     'boleto', 'ddl', 'a vista', 'proposta comercial', 'orcamento', 'cotacao')
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return text.lower()
+
+
+def score_page(text: str) -> float:
+    """Pontua o quanto a página parece tabela de preços ou condições comerciais.
+
+    Soma valores monetários, quantidades com unidade e a presença de
+    cabeçalhos de tabela e palavras de condições comerciais
+    (validade, frete, pagamento...). Catálogos e certificados ficam perto de zero.
+    """
+    if not text or not text.strip():
+        return 0.0
+    folded = _fold(text)
+    score = min(len(_CURRENCY_RE.findall(text)), 20) * 1.0
+    score += min(len(_QTY_UNIT_RE.findall(folded)), 20) * 0.25
+    score += sum(2.0 for w in _TABLE_HEADER_WORDS if re.search(rf'\b{w}\b', folded))
+    score += sum(2.0 for w in _COMMERCIAL_WORDS if re.search(rf'\b{w}\b', folded))
+    return score
+
+
+def _unscorable(text: str, min_chars: int) -> bool:
+    """Página sem camada de texto (digitalizada): não dá para pontuar pelo texto."""
+    return len(re.sub(r'\s+', '', text or '')) < min_chars
+
+
+def select_relevant_pages(pages, min_score: float = PAGE_PRUNING_MIN_SCORE,
+                          min_chars: int = TEXT_MIN_CHARS_PER_PAGE // 4):
+    """Escolhe os índices (base 0) das páginas a enviar, sempre com a capa.
+
+    A página seguinte a uma relevante também entra quando tem ao menos metade
+    da pontuação mínima (continuação de tabela). Páginas com menos de
+    min_chars caracteres de texto (digitalizadas, como uma tabela de preços
+    escaneada ou condições assinadas) não podem ser pontuadas e entram sempre.
+    Devolve None quando a poda não se aplica: sem texto para pontuar ou
+    nenhuma página pontuada além da capa relevante, casos em que o documento
+    deve seguir inteiro.
+    """
+    if not pages or not any(p.strip() for p in pages):
+        return None
+    scores = [score_page(p) for p in pages]
+    keep = {0}
+    for i, score in enumerate(scores):
+        if score >= min_score:
+            keep.add(i)
+            if i + 1 < len(scores) and scores[i + 1] >= min_score / 2:
+                keep.add(i + 1)
+    if keep == {0}:
+        return None
+    keep.update(i for i, p in enumerate(pages) if _unscorable(p, min_chars))
+    return sorted(keep)
+
+
+def build_pruned_pdf(pdf_path: str, out_path: str, page_indices) -> bool:
+    """Grava em out_path um PDF só com as páginas indicadas (base 0)."""
+    try:
+        reader = PdfReader(pdf_path)
+        writer = PdfWriter()
+        for i in page_indices:
+            writer.add_page(reader.pages[i])
+        with open(out_path, 'wb') as f:
+            writer.write(f)
+        return True
+    except Exception as e:
+        print(f"[AVISO] Falha ao gerar PDF reduzido de {os.path.basename(pdf_path)}: {e}")
+        return False
+
+
+def _prepare_document_worker(pdf_path: str, prune_dir=None):
+    pages = extract_pdf_text(pdf_path)
+    total = len(pages)
+    send_path, numbers = pdf_path, None
+    scanned = 0
+    if prune_dir and total >= PAGE_PRUNING_MIN_PAGES:
+        keep = select_relevant_pages(pages)
+        if keep and len(keep) < total:
+            out_path = os.path.join(prune_dir, os.path.basename(pdf_path))
+            if build_pruned_pdf(pdf_path, out_path, keep):
+                send_path = out_path
+                numbers = [i + 1 for i in keep]
+                scanned = sum(1 for i in keep if _unscorable(pages[i], TEXT_MIN_CHARS_PER_PAGE // 4))
+                pages = [pages[i] for i in keep]
+    text = None
+    if TEXT_FAST_PATH and text_layer_is_trustworthy(pages):
+        text = _compact_document_text(pdf_path, pages, numbers)
+    return {"pdf": send_path, "text": text, "pages": len(pages), "total_pages": total, "sem_texto": scanned}
+
+
+# Pool único do processo (ver _document_pool)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _document_pool():
+    """Pool de processos da preparação, criado no primeiro uso e reaproveitado.
+
+    Devolve None num processo daemônico, que não pode ter filhos.
+    """
+    global _pool
+    if multiprocessing.current_process().daemon:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: quem chama é uma thread do pipeline num processo com outras threads
+            # (Streamlit, JobEngine, servidor); fork copiaria travas mantidas por elas
+            _pool = ProcessPoolExecutor(max_workers=max(1, min(PREPARE_WORKERS, os.cpu_count() or 1)),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def prepare_documents(pdf_paths, prune_paths=(), prune_dir=None, min_pool_mb: float = PREPARE_POOL_MIN_MB):
+    """Prepara o que será enviado ao modelo para cada PDF.
+
+    Para os documentos em prune_paths (propostas), com PAGE_PRUNING ativo,
+    gera em prune_dir um PDF só com as páginas de preços/condições
+    comerciais e a capa. Em seguida verifica a camada de texto do que será
+    enviado. Devolve {caminho: {"pdf", "text", "pages", "total_pages"}};
+    "text" None indica que o documento deve seguir pela rota do PDF. Os
+    documentos a partir de min_pool_mb vão ao pool de processos, em paralelo
+    com os menores, lidos nesta thread.
+    """
+    pdf_paths = [p for p in pdf_paths if p]
+    prune_paths = set(prune_paths or ()) if PAGE_PRUNING and prune_dir else set()
+    if not pdf_paths:
+        return {}
+    if not TEXT_FAST_PATH and not prune_paths:
+        return {p: {"pdf": p, "text": None, "pages": None, "total_pages": None} for p in pdf_paths}
+    if prune_paths:
+        os.makedirs(prune_dir, exist_ok=True)
+    dirs = {p: prune_dir if p in prune_paths else None for p in pdf_paths}
+    large = [p for p in pdf_paths if os.path.getsize(p) >= min_pool_mb * 1024 * 1024]
+    pool = _document_pool() if len(large) >= 2 else None
+    if len(large) >= 2 and pool is None:
+        print("[INFO] Processo daemônico sem processos filhos; preparando documentos nesta thread.")
+    futures = {}
+    if pool is not None:
+        try:
+            futures = {p: pool.submit(_prepare_document_worker, p, dirs[p]) for p in large}
+        except Exception as e:
+            print(f"[AVISO] Pool de processos indisponível ({e}); preparando documentos nesta thread.")
+            _discard_pool(pool)
+            futures = {}
+    prepared = {p: _prepare_document_worker(p, dirs[p]) for p in pdf_paths if p not in futures}
+    for pdf_path, future in futures.items():
+        try:
+            prepared[pdf_path] = future.result()
+        except Exception as e:
+            print(f"[AVISO] Pool de processos falhou em {os.path.basename(pdf_path)} ({e}); "
+                  f"preparando nesta thread.")
+            _discard_pool(pool)
+            prepared[pdf_path] = _prepare_document_worker(pdf_path, dirs[pdf_path])
+    prepared = [prepared[p] for p in pdf_paths]
+    results = {}
+    for pdf_path, doc in zip(pdf_paths, prepared):
+        results[pdf_path] = doc
+        name = os.path.basename(pdf_path)
+        if doc["pdf"] != pdf_path:
+            print(f"[OK] {name}: {doc['pages']} de {doc['total_pages']} páginas relevantes "
+                  f"({os.path.getsize(pdf_path)} -> {os.path.getsize(doc['pdf'])} bytes).")
+            if doc["sem_texto"]:
+                print(f"[INFO] {name}: {doc['sem_texto']} página(s) sem texto mantida(s) sem pontuar.")
+        text = doc["text"]
+        if text is not None:
+            print(f"[OK] {name}: camada de texto confiável "
+                  f"({os.path.getsize(doc['pdf'])} bytes de PDF -> {len(text.encode('utf-8'))} bytes de texto).")
+        elif TEXT_FAST_PATH:
+            print(f"[INFO] {name}: sem camada de texto confiável, segue como PDF.")
+    return results
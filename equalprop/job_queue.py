@@ -0,0 +1,228 @@
+"""
+Fila persistente (SQLite) de relatórios do serviço compartilhado.
+
+Cada job guarda o usuário que o enviou, os caminhos dos PDFs (copiados para
+SERVICE_DIR/jobs/<id>/entrada), o estado (queued, running, done, error,
+cancelled), o progresso e o caminho do relatório. Como tudo fica no banco e
+em disco, a fila sobrevive a um reinício do servidor: jobs que estavam em
+execução sem sinal de vida há mais de SERVICE_STALE_S voltam para a fila
+(até SERVICE_MAX_ATTEMPTS tentativas).
+
+claim_next escolhe o próximo job de forma justa entre usuários: primeiro o
+usuário com menos jobs em execução, depois o que foi atendido há mais tempo
+e, dentro do usuário, o job mais antigo. Um usuário que envia vinte
+relatórios não bloqueia os demais.
+
+heartbeat e finish só alteram o job enquanto ele está em execução pelo
+mesmo processo que o reservou: um processo que ficou sem dar sinal de vida e
+teve o job devolvido à fila percebe isso no próximo sinal (JobLost) e não
+sobrescreve o resultado de quem o executa agora.
+"""
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from equalprop.config import SERVICE_DIR, SERVICE_MAX_ATTEMPTS, SERVICE_STALE_S
+from equalprop.io_utils import sanitize_filename, save_upload
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+CANCELLED = "cancelled"
+FINISHED = (DONE, ERROR, CANCELLED)
+
+_DB_PATH = os.path.join(SERVICE_DIR, "jobs.sqlite")
+
+
+class JobLost(RuntimeError):
+    """O job não está mais em execução por este processo (devolvido à fila ou encerrado)."""
+
+
+@contextmanager
+def _connect(immediate: bool = False):
+    """Abre o banco, executa a transação e fecha a conexão ao final."""
+    os.makedirs(SERVICE_DIR, exist_ok=True)
+    conn = sqlite3.connect(_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, user TEXT NOT NULL, status TEXT NOT NULL,"
+            " rfp_path TEXT NOT NULL, proposal_paths TEXT NOT NULL, out_dir TEXT NOT NULL,"
+            " report_xlsx TEXT, error TEXT, progress TEXT,"
+            " created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL,"
+            " worker TEXT, attempts INTEGER NOT NULL DEFAULT 0, cancel_requested INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, user, created_at)")
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def _row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["proposal_paths"] = json.loads(job["proposal_paths"] or "[]")
+    job["progress"] = json.loads(job["progress"] or "{}")
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+
+def job_dir(job_id: str) -> str:
+    return os.path.join(SERVICE_DIR, "jobs", job_id)
+
+
+def _write_input(directory: str, name: str, data, used: set) -> str:
+    """Grava um arquivo de entrada (bytes ou objeto com read()) com nome único e seguro."""
+    safe = sanitize_filename(os.path.basename(name or "")) or "arquivo.pdf"
+    base, ext = os.path.splitext(safe)
+    candidate, n = safe, 1
+    while candidate.lower() in used:
+        n += 1
+        candidate = f"{base}_{n}{ext}"
+    used.add(candidate.lower())
+    path = os.path.join(directory, candidate)
+    save_upload(data, path)
+    return path
+
+
+def enqueue(user: str, rfp: Tuple[str, Any], proposals: Iterable[Tuple[str, Any]]) -> str:
+    """Grava a RFP e as propostas ((nome, conteúdo) cada) e coloca o job na fila; devolve o ID."""
+    job_id = uuid.uuid4().hex[:12]
+    entrada = os.path.join(job_dir(job_id), "entrada")
+    os.makedirs(entrada, exist_ok=True)
+    used: set = set()
+    rfp_path = _write_input(entrada, rfp[0], rfp[1], used)
+    proposal_paths = [_write_input(entrada, name, data, used) for name, data in proposals]
+    if not proposal_paths:
+        raise ValueError("nenhuma proposta enviada")
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, user, status, rfp_path, proposal_paths, out_dir, progress, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user or "anonimo", QUEUED, rfp_path, json.dumps(proposal_paths),
+             os.path.join(job_dir(job_id), "saida"), json.dumps({"done": 0, "total": 0, "label": None}),
+             time.time()),
+        )
+    print(f"[INFO] Job {job_id} na fila ({user or 'anonimo'}, {len(proposal_paths)} propostas).")
+    return job_id
+
+
+def requeue_stale(stale_s: float = SERVICE_STALE_S, conn=None) -> int:
+    """Devolve à fila os jobs em execução sem sinal de vida (processo ou servidor caído)."""
+    if conn is None:
+        with _connect(immediate=True) as conn:
+            return requeue_stale(stale_s, conn)
+    limit = time.time() - stale_s
+    stale = conn.execute(
+        "SELECT id, attempts FROM jobs WHERE status = ? AND COALESCE(heartbeat_at, started_at, 0) < ?",
+        (RUNNING, limit),
+    ).fetchall()
+    for row in stale:
+        if row["attempts"] >= SERVICE_MAX_ATTEMPTS:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                         (ERROR, f"execução interrompida {row['attempts']} vezes", time.time(), row["id"]))
+        else:
+            conn.execute("UPDATE jobs SET status = ?, worker = NULL WHERE id = ?", (QUEUED, row["id"]))
+    if stale:
+        print(f"[AVISO] {len(stale)} job(s) sem sinal de vida devolvido(s) à fila.")
+    return len(stale)
+
+
+def claim_next(worker: str) -> Optional[Dict[str, Any]]:
+    """Reserva o próximo job para worker, com revezamento justo entre usuários."""
+    with _connect(immediate=True) as conn:
+        requeue_stale(conn=conn)
+        # Jobs com cancelamento pedido ainda na fila terminam sem executar
+        conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ? AND cancel_requested = 1",
+                     (CANCELLED, "cancelado antes de iniciar", time.time(), QUEUED))
+        row = conn.execute(
+            "SELECT j.id FROM jobs j WHERE j.status = ? ORDER BY"
+            " (SELECT COUNT(*) FROM jobs r WHERE r.user = j.user AND r.status = ?),"
+            " (SELECT COALESCE(MAX(s.started_at), 0) FROM jobs s WHERE s.user = j.user),"
+            " j.created_at LIMIT 1",
+            (QUEUED, RUNNING),
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1"
+            " WHERE id = ?",
+            (RUNNING, worker, now, now, row["id"]),
+        )
+        return _row(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+
+def heartbeat(job_id: str, worker: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+    """Registra sinal de vida (e o progresso, se informado); devolve True se o cancelamento foi pedido.
+
+    Levanta JobLost se o job não está mais em execução por worker.
+    """
+    with _connect() as conn:
+        if progress is not None:
+            cur = conn.execute("UPDATE jobs SET heartbeat_at = ?, progress = ? WHERE id = ? AND status = ? AND worker = ?",
+                               (time.time(), json.dumps(progress, ensure_ascii=False), job_id, RUNNING, worker))
+        else:
+            cur = conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                               (time.time(), job_id, RUNNING, worker))
+        if cur.rowcount == 0:
+            raise JobLost(f"job {job_id} não está mais em execução por {worker}")
+        row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return bool(row and row["cancel_requested"])
+
+
+def finish(job_id: str, worker: str, status: str, report_xlsx: Optional[str] = None,
+           error: Optional[str] = None) -> bool:
+    """Encerra o job; devolve False (sem alterar nada) se ele não está mais em execução por worker."""
+    with _connect() as conn:
+        cur = conn.execute("UPDATE jobs SET status = ?, report_xlsx = ?, error = ?, finished_at = ?"
+                           " WHERE id = ? AND status = ? AND worker = ?",
+                           (status, report_xlsx, error, time.time(), job_id, RUNNING, worker))
+    return cur.rowcount > 0
+
+
+def request_cancel(job_id: str) -> bool:
+    """Pede o cancelamento; o processo que executa o job o percebe no próximo sinal de vida."""
+    with _connect() as conn:
+        cur = conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)",
+                           (job_id, QUEUED, RUNNING))
+    return cur.rowcount > 0
+
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    with _connect() as conn:
+        return _row(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def list_jobs(user: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    with _connect() as conn:
+        if user:
+            rows = conn.execute("SELECT * FROM jobs WHERE user = ? ORDER BY created_at DESC LIMIT ?", (user, limit))
+        else:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [_row(r) for r in rows.fetchall()]
+
+
+def queue_position(job_id: str) -> Optional[int]:
+    """Quantos jobs na fila foram enviados antes deste (None se não está na fila)."""
+    with _connect() as conn:
+        row = conn.execute("SELECT created_at, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["status"] != QUEUED:
+            return None
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                            (QUEUED, row["created_at"])).fetchone()[0]
@@ -0,0 +1,207 @@
+"""
+Execução do pipeline em segundo plano, desacoplada da interface.
+
+JobEngine roda cada relatório (run_report_pipeline) num executor próprio,
+com até MAX_CONCURRENT_JOBS execuções simultâneas; as chamadas ao modelo de
+todas elas continuam passando pelo mesmo limitador (rate_limit). Cada Job
+tem um ID, uma lista de eventos de progresso numerados (o cliente pede os
+eventos posteriores ao último que viu) e o resultado final.
+
+A interface só envia e acompanha: se a página for recarregada ou a conexão
+cair, a execução continua e a sessão volta a ela pelo ID do job. O diretório
+de trabalho (cópias dos PDFs enviados) pertence ao job e é removido ao fim;
+o relatório fica em JOBS_DIR/<id> até o job expirar (JOB_RETENTION_S).
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from equalprop.cancellation import CancelToken, RunCancelled
+from equalprop.config import JOB_RETENTION_S, JOBS_DIR, MAX_CONCURRENT_JOBS, RUN_DEADLINE_S
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+CANCELLED = "cancelled"
+FINISHED = (DONE, ERROR, CANCELLED)
+
+
+class Job:
+    """Uma execução do relatório: estado, eventos de progresso e resultado."""
+
+    def __init__(self, rfp_path: str, proposal_paths: List[str], workdir: Optional[str] = None,
+                 deadline_s: Optional[float] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.rfp_name = os.path.basename(rfp_path)
+        self.proposal_names = [os.path.basename(p) for p in proposal_paths]
+        self.workdir = workdir
+        self.out_dir = os.path.join(JOBS_DIR, self.id)
+        self.cancel_token = CancelToken(deadline_s)
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.progress = {"done": 0, "total": 0, "label": None, "detail": None}
+        self._events: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+
+    def _emit(self, kind: str, **data) -> None:
+        with self._cond:
+            event = {"seq": len(self._events) + 1, "t": time.time(), "kind": kind, **data}
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def events(self, since: int = 0, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Eventos com seq > since; espera até timeout segundos se ainda não houver nenhum."""
+        with self._cond:
+            if timeout and len(self._events) <= since and self.status not in FINISHED:
+                self._cond.wait(timeout)
+            return list(self._events[since:])
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera o fim do job; devolve True se terminou."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.status not in FINISHED:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def cancel(self) -> None:
+        self.cancel_token.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado atual, serializável (para a interface ou uma API)."""
+        with self._cond:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "rfp_name": self.rfp_name,
+                "proposal_names": list(self.proposal_names),
+                "progress": dict(self.progress),
+                "error": self.error,
+                "report_xlsx": (self.result or {}).get("report_xlsx"),
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "events": len(self._events),
+            }
+
+    def _finish(self, status: str, result=None, error: Optional[str] = None) -> None:
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+        self._emit(status, error=error)
+
+
+class JobEngine:
+    """Executor de jobs compartilhado por todas as sessões do processo."""
+
+    def __init__(self, max_jobs: int = MAX_CONCURRENT_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_jobs), thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, model, gen_config, rfp_path: str, proposal_paths: List[str], workdir: Optional[str] = None,
+               deadline_s: Optional[float] = RUN_DEADLINE_S) -> Job:
+        """Agenda o relatório e devolve o Job imediatamente.
+
+        workdir, se informado, é o diretório com os arquivos de entrada; ele
+        passa a pertencer ao job e é removido quando a execução termina.
+        """
+        self.purge_expired()
+        job = Job(rfp_path, proposal_paths, workdir=workdir, deadline_s=deadline_s or None)
+        with self._lock:
+            self._jobs[job.id] = job
+        job._emit(QUEUED)
+        self._executor.submit(self._run, job, model, gen_config, rfp_path, list(proposal_paths))
+        return job
+
+    def _run(self, job: Job, model, gen_config, rfp_path, proposal_paths) -> None:
+        # Import tardio: o pipeline importa o restante do pacote
+        from equalprop.pipeline import run_report_pipeline
+
+        if job.cancel_token.cancelled:
+            job._finish(CANCELLED, error=job.cancel_token.reason)
+            return
+        with job._cond:
+            job.status = RUNNING
+        job._emit(RUNNING)
+        # Fora de out_dir: a consolidação limpa o diretório de saída antes de gravar
+        temp_dir = job.workdir or tempfile.mkdtemp(prefix=f"equalprop_{job.id}_")
+
+        def _on_progress(done, total, label):
+            with job._cond:
+                job.progress.update(done=done, total=total, label=label)
+            job._emit("progress", done=done, total=total, label=label)
+
+        def _on_detail(text):
+            with job._cond:
+                changed = job.progress.get("detail") != (text or None)
+                job.progress["detail"] = text or None
+            if changed:
+                job._emit("detail", text=text or None)
+
+        try:
+            result = run_report_pipeline(model, gen_config, rfp_path, proposal_paths, temp_dir,
+                                         on_progress=_on_progress, on_detail=_on_detail,
+                                         cancel=job.cancel_token, out_dir=job.out_dir)
+            job._finish(DONE, result=result)
+        except RunCancelled as e:
+            job._finish(CANCELLED, error=str(e))
+        except Exception as e:
+            print(f"[ERRO] Job {job.id} falhou: {e}")
+            job._finish(ERROR, error=str(e))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id or "")
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def purge_expired(self, retention_s: float = JOB_RETENTION_S) -> int:
+        """Esquece jobs terminados há mais de retention_s e apaga seus relatórios."""
+        now = time.time()
+        with self._lock:
+            expired = [j for j in self._jobs.values()
+                       if j.finished_at is not None and now - j.finished_at > retention_s]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.out_dir, ignore_errors=True)
+        return len(expired)
+
+
+_engine: Optional[JobEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> JobEngine:
+    """Motor único para o processo (sobrevive às reexecuções do script do Streamlit)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = JobEngine()
+        return _engine
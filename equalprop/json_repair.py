@@ -0,0 +1,308 @@
+"""
+Validação determinística e reparo local das respostas JSON do modelo.
+
+Antes de descartar uma resposta (e a seção do relatório que depende dela),
+parse_response tenta consertá-la localmente:
+
+- remove cercas de markdown e texto antes/depois do JSON;
+- remove vírgulas finais antes de '}' ou ']';
+- fecha arrays e objetos de respostas truncadas, descartando o último
+  elemento incompleto;
+- normaliza a semelhança dos POPs para o formato "NN%".
+
+Em seguida confere a estrutura esperada por cada tipo de resposta (os
+schemas descritos em equalprop.prompts). Só quando o reparo não basta é
+levantado JsonRepairError, com a lista de problemas, para que o chamador
+peça ao modelo apenas a correção.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from equalprop.prompts import classifica_condicomer_prompt, proposta_prompt, rfp_prompt
+
+RFP = "rfp"
+PROPOSTA = "proposta"
+CONDICOMER_CHAVES = "condicomer_chaves"
+
+# Schema de referência de cada tipo, enviado no pedido de correção
+SCHEMA_PROMPTS = {
+    RFP: rfp_prompt,
+    PROPOSTA: proposta_prompt,
+    CONDICOMER_CHAVES: classifica_condicomer_prompt,
+}
+
+# Problema de sintaxe: o JSON não pôde ser lido nem após o reparo local
+SYNTAX = "json_invalido"
+
+# Limite de pontos de corte testados ao fechar uma resposta truncada
+_MAX_CUTS = 200
+
+
+class JsonRepairError(ValueError):
+    """A resposta não pôde ser reparada localmente.
+
+    problems lista o que falhou; SYNTAX indica JSON ilegível, os demais
+    itens são partes obrigatórias do schema ausentes ou inválidas.
+    """
+
+    def __init__(self, problems: List[str], text: str = ""):
+        super().__init__("; ".join(problems))
+        self.problems = list(problems)
+        self.text = text
+
+    @property
+    def syntax_only(self) -> bool:
+        return self.problems == [SYNTAX]
+
+
+def strip_fences(text: str) -> str:
+    """Remove cercas de markdown e o que estiver antes/depois do JSON."""
+    t = (text or "").strip()
+    if t.startswith("```"):
+        t = t.split("\n", 1)[1] if "\n" in t else ""
+    if t.rstrip().endswith("```"):
+        t = t.rstrip()[:-3]
+    starts = [i for i in (t.find("{"), t.find("[")) if i >= 0]
+    if starts:
+        t = t[min(starts):]
+    return t.strip()
+
+
+def _remove_trailing_commas(text: str) -> str:
+    out = []
+    in_str = esc = False
+    n = len(text)
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == ",":
+            j = i + 1
+            while j < n and text[j] in " \t\r\n":
+                j += 1
+            if j < n and text[j] in "}]":
+                continue
+        out.append(ch)
+    return "".join(out)
+
+
+def _closers(stack: List[str]) -> str:
+    return "".join("}" if c == "{" else "]" for c in reversed(stack))
+
+
+def _close_truncated(text: str) -> Optional[Any]:
+    """Fecha uma resposta truncada; devolve o objeto decodificado ou None."""
+    stack: List[str] = []
+    cuts: List[Tuple[int, Tuple[str, ...]]] = []
+    in_str = esc = False
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append(ch)
+            cuts.append((i + 1, tuple(stack)))
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            cuts.append((i + 1, tuple(stack)))
+        elif ch == ",":
+            cuts.append((i, tuple(stack)))
+    if not stack and not in_str:
+        return None
+    # 1) Completar o que está aberto (um valor cortado no meio de uma string é
+    #    descartado, não completado); 2) descartar o último elemento incompleto
+    candidates = [] if in_str else [text + _closers(stack)]
+    for pos, st in reversed(cuts[-_MAX_CUTS:]):
+        if st:
+            candidates.append(text[:pos] + _closers(list(st)))
+    for candidate in candidates:
+        try:
+            return json.loads(_remove_trailing_commas(candidate))
+        except ValueError:
+            continue
+    return None
+
+
+def loads_lenient(text: str) -> Tuple[Any, List[str]]:
+    """Decodifica o JSON aplicando os reparos de sintaxe necessários.
+
+    Devolve (dados, reparos_aplicados); levanta JsonRepairError([SYNTAX]).
+    """
+    repairs: List[str] = []
+    try:
+        return json.loads(text), repairs
+    except (TypeError, ValueError):
+        pass
+    stripped = strip_fences(text or "")
+    if stripped != (text or "").strip():
+        repairs.append("cercas/texto fora do JSON removidos")
+    try:
+        return json.loads(stripped), repairs
+    except ValueError:
+        pass
+    no_commas = _remove_trailing_commas(stripped)
+    if no_commas != stripped:
+        repairs.append("vírgulas finais removidas")
+        try:
+            return json.loads(no_commas), repairs
+        except ValueError:
+            pass
+    closed = _close_truncated(no_commas)
+    if closed is not None:
+        repairs.append("resposta truncada fechada")
+        return closed, repairs
+    raise JsonRepairError([SYNTAX], text or "")
+
+
+def _missing(value: Any) -> bool:
+    """Valor ausente: None, vazio ou a string "null" que o modelo às vezes devolve."""
+    return value is None or (isinstance(value, str) and value.strip().lower() in ("", "null"))
+
+
+def normalize_percent(value: Any) -> Any:
+    """Converte 0.66, "0,66", 66, "66", "66 %" ou "66,0%" em "66%"; mantém o que não entender.
+
+    Sem o sinal de %, um número entre 0 e 1 (inclusive) é uma fração: 1.0 vira "100%".
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        number, has_sign = float(value), False
+    else:
+        s = str(value).strip().replace(" ", "")
+        has_sign = s.endswith("%")
+        try:
+            number = float(s.rstrip("%").replace(",", "."))
+        except ValueError:
+            return value
+    if not has_sign and 0 <= number <= 1:
+        number *= 100
+    if number.is_integer():
+        return f"{int(number)}%"
+    return f"{round(number, 1):g}%"
+
+
+def _validate_rfp(data: Any, repairs: List[str], problems: List[str], **_ctx) -> Any:
+    if isinstance(data, dict) and "rfp_json" not in data and (
+            "produtos_demandados" in data or "header" in data):
+        data = {"rfp_json": data}
+        repairs.append("raiz rfp_json adicionada")
+    body = data.get("rfp_json") if isinstance(data, dict) else None
+    if not isinstance(body, dict):
+        problems.append("rfp_json ausente ou não é objeto")
+        return data
+    produtos = body.get("produtos_demandados")
+    if isinstance(produtos, dict):
+        produtos = list(produtos.values())
+        repairs.append("produtos_demandados convertido em lista")
+    if not isinstance(produtos, list):
+        problems.append("rfp_json.produtos_demandados ausente ou não é lista")
+        return data
+    cleaned = [p for p in produtos if isinstance(p, dict)]
+    # O código casa os PDCs com os POPs das propostas; um código inventado aqui
+    # seria associado como se fosse real, então a falta dele vai ao modelo
+    sem_codigo = [i for i, p in enumerate(cleaned, start=1) if _missing(p.get("codigo"))]
+    if sem_codigo:
+        problems.append("rfp_json.produtos_demandados sem codigo (itens "
+                        + ", ".join(str(i) for i in sem_codigo) + ")")
+    body["produtos_demandados"] = cleaned
+    if not isinstance(body.get("header"), dict):
+        body["header"] = {}
+    return data
+
+
+def _validate_proposta(data: Any, repairs: List[str], problems: List[str], **_ctx) -> Any:
+    if isinstance(data, dict) and "proposta" not in data and ("pops" in data or "header" in data):
+        data = {"proposta": data}
+        repairs.append("raiz proposta adicionada")
+    body = data.get("proposta") if isinstance(data, dict) else None
+    if not isinstance(body, dict):
+        problems.append("proposta ausente ou não é objeto")
+        return data
+    if not isinstance(body.get("header"), dict):
+        body["header"] = {}
+    pops = body.get("pops")
+    if not isinstance(pops, list):
+        problems.append("proposta.pops ausente ou não é lista")
+        return data
+    body["pops"] = [p for p in pops if isinstance(p, dict)]
+    for pop in body["pops"]:
+        if "semelhanca" in pop:
+            fixed = normalize_percent(pop["semelhanca"])
+            if fixed != pop["semelhanca"]:
+                pop["semelhanca"] = fixed
+                repairs.append("semelhança normalizada")
+    cc = body.get("condicoes_comerciais")
+    if cc is None:
+        body["condicoes_comerciais"] = []
+    elif isinstance(cc, dict):
+        body["condicoes_comerciais"] = [{"chave": k, "valor": v} for k, v in cc.items()]
+        repairs.append("condicoes_comerciais convertido em lista")
+    return data
+
+
+def _validate_condicomer_chaves(data: Any, repairs: List[str], problems: List[str], names=None, **_ctx) -> Any:
+    mapping = data.get("mapeamento") if isinstance(data, dict) else None
+    if mapping is None and isinstance(data, dict) and data and all(isinstance(v, str) for v in data.values()):
+        data = {"mapeamento": data}
+        mapping = data["mapeamento"]
+        repairs.append("raiz mapeamento adicionada")
+    if not isinstance(mapping, dict):
+        problems.append("mapeamento ausente ou não é objeto")
+        return data
+    data["mapeamento"] = {str(k): v.strip() for k, v in mapping.items() if isinstance(v, str) and not _missing(v)}
+    if names:
+        missing = [n for n in names if n not in data["mapeamento"]]
+        if missing:
+            repairs.append(f"{len(missing)} nomes sem classificação mantidos como estão")
+    return data
+
+
+_VALIDATORS = {
+    RFP: _validate_rfp,
+    PROPOSTA: _validate_proposta,
+    CONDICOMER_CHAVES: _validate_condicomer_chaves,
+}
+
+
+def parse_response(text: str, kind: str, **ctx) -> Tuple[Any, List[str]]:
+    """Decodifica, repara e valida a resposta de um tipo (RFP, PROPOSTA, CONDICOMER_CHAVES).
+
+    ctx: names (nomes enviados em CONDICOMER_CHAVES).
+    Devolve (dados, reparos_aplicados); levanta JsonRepairError quando falta
+    alguma parte obrigatória ou o texto não é JSON mesmo após o reparo.
+    """
+    data, repairs = loads_lenient(text)
+    problems: List[str] = []
+    data = _VALIDATORS[kind](data, repairs, problems, **ctx)
+    if problems:
+        raise JsonRepairError(problems, text or "")
+    return data, repairs
+
+
+def describe_problems(error: JsonRepairError) -> str:
+    """Texto curto com os problemas, usado no pedido de correção ao modelo."""
+    if error.syntax_only:
+        return "A resposta não é um JSON válido (possivelmente truncada ou com texto fora do JSON)."
+    return "Partes obrigatórias ausentes ou inválidas: " + "; ".join(error.problems) + "."
+
+
+def summarize_repairs(repairs: List[str]) -> str:
+    seen: Dict[str, None] = {}
+    for r in repairs:
+        seen.setdefault(r, None)
+    return ", ".join(seen)
@@ -0,0 +1,120 @@
+"""
+Parser incremental de JSON para respostas em streaming.
+
+O IncrementalJsonScanner recebe o texto em pedaços (na ordem em que chegam
+do modelo) e informa cada objeto/array que se fecha, com o caminho até ele
+e o trecho JSON correspondente. Assim o cabeçalho de uma proposta pode ser
+usado antes de o restante da resposta chegar.
+"""
+
+import json
+from typing import Any, List, Tuple, Union
+
+PathItem = Union[str, int]
+
+
+class _Frame:
+    __slots__ = ("kind", "start", "key", "index", "expect_key")
+
+    def __init__(self, kind: str, start: int):
+        self.kind = kind            # 'object' | 'array'
+        self.start = start          # posição do '{' ou '[' no buffer
+        self.key = None             # chave corrente (objetos)
+        self.index = 0              # posição corrente (arrays)
+        self.expect_key = kind == "object"
+
+
+class IncrementalJsonScanner:
+    """Acompanha a estrutura de um documento JSON recebido em pedaços.
+
+    feed() devolve uma lista de (caminho, trecho_json) para cada objeto ou
+    array fechado no pedaço recebido. O caminho é uma tupla de chaves e
+    índices a partir da raiz, por exemplo ('proposta', 'pops', 2).
+    Texto antes da raiz (ex.: cercas de markdown) é ignorado.
+    """
+
+    def __init__(self):
+        self._buf: List[str] = []
+        self._text = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._done = False
+
+    @property
+    def text(self) -> str:
+        """Todo o texto recebido até agora."""
+        if self._buf:
+            self._text += "".join(self._buf)
+            self._buf = []
+        return self._text
+
+    @property
+    def complete(self) -> bool:
+        """True quando o objeto raiz já foi fechado."""
+        return self._done
+
+    def _path(self) -> Tuple[PathItem, ...]:
+        path: List[PathItem] = []
+        for frame in self._stack:
+            path.append(frame.key if frame.kind == "object" else frame.index)
+        return tuple(path)
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple[PathItem, ...], str]]:
+        events: List[Tuple[Tuple[PathItem, ...], str]] = []
+        if not chunk:
+            return events
+        self._buf.append(chunk)
+        text = self.text
+        stack = self._stack
+        i = self._pos
+        n = len(text)
+        while i < n and not self._done:
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = stack[-1] if stack else None
+                    if frame is not None and frame.kind == "object" and frame.expect_key:
+                        try:
+                            frame.key = json.loads(text[self._string_start:i + 1])
+                        except ValueError:
+                            frame.key = text[self._string_start + 1:i]
+                        frame.expect_key = False
+            elif ch == '"':
+                if stack:
+                    self._in_string = True
+                    self._string_start = i
+            elif ch in "{[":
+                stack.append(_Frame("object" if ch == "{" else "array", i))
+            elif ch in "}]" and stack:
+                frame = stack[-1]
+                raw = text[frame.start:i + 1]
+                path = tuple(self._path()[:-1])
+                stack.pop()
+                events.append((path, raw))
+                if not stack:
+                    self._done = True
+            elif ch == "," and stack:
+                frame = stack[-1]
+                if frame.kind == "object":
+                    frame.expect_key = True
+                else:
+                    frame.index += 1
+            i += 1
+        self._pos = i
+        return events
+
+
+def parse_event(raw: str) -> Any:
+    """Decodifica o trecho de um evento; devolve None se não for JSON válido."""
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
@@ -0,0 +1,64 @@
+"""
+Projeção e serialização compacta dos dados enviados ao modelo.
+
+Cada etapa recebe só os campos que usa, serializados sem escapes ASCII
+(acentos como "ç" ocupam 2 bytes em UTF-8 em vez dos 6 de "\\u00e7") e sem
+espaços. log_savings registra a economia em bytes e em tokens estimados.
+"""
+
+import json
+from typing import Any, Dict
+
+# Campos de cada PDC usados na associação com os POPs
+_PDC_FIELDS = ("codigo", "especificacoes_tecnicas", "quantidade_demandada")
+
+
+def compact_json(obj: Any) -> str:
+    """JSON sem escapes ASCII e sem espaços."""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _is_null(value: Any) -> bool:
+    # O modelo às vezes devolve a string "null"; no payload ela é só ruído
+    return value is None or (isinstance(value, str) and value.strip().lower() == "null")
+
+
+def _drop_nulls(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _drop_nulls(v) for k, v in value.items() if not _is_null(v)}
+    if isinstance(value, list):
+        return [_drop_nulls(v) for v in value]
+    return value
+
+
+def project_rfp_for_proposals(rfp_json: Any) -> Dict[str, Any]:
+    """Só os produtos demandados (código, especificações e quantidade), sem campos nulos.
+
+    O cabeçalho da RFP (obra, solicitante, datas) não participa da extração
+    das propostas.
+    """
+    if not isinstance(rfp_json, dict):
+        return rfp_json
+    body = rfp_json.get("rfp_json") if isinstance(rfp_json.get("rfp_json"), dict) else rfp_json
+    produtos = []
+    for pdc in body.get("produtos_demandados") or []:
+        if isinstance(pdc, dict):
+            produtos.append(_drop_nulls({k: pdc[k] for k in _PDC_FIELDS if k in pdc}))
+    return {"rfp_json": {"produtos_demandados": produtos}}
+
+
+def rfp_payload_for_proposals(rfp_json: Any) -> str:
+    """Texto do rfp_json enviado em cada chamada de proposta."""
+    return compact_json(project_rfp_for_proposals(rfp_json))
+
+
+def log_savings(label: str, original: Any, payload: str, calls: int = 1) -> None:
+    """Compara o payload com o json.dumps padrão do objeto original."""
+    before = len(json.dumps(original).encode("utf-8"))
+    after = len(payload.encode("utf-8"))
+    if before <= 0:
+        return
+    # Mesma estimativa grosseira de gemini_service._estimate_tokens (4 caracteres por token)
+    saved_tokens = (len(json.dumps(original)) - len(payload)) // 4
+    print(f"[INFO] Payload {label}: {before} -> {after} bytes (-{100 * (before - after) / before:.0f}%), "
+          f"~{saved_tokens} tokens a menos por chamada, ~{saved_tokens * calls} no total.")
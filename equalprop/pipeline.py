@@ -0,0 +1,381 @@
+"""
+Pipeline do relatório expresso como grafo de estágios.
+
+Dependências principais:
+    converter -> texto (poda de páginas + camada de texto) -> upload_rfp -> rfp -> prefixo
+    texto -> upload_<i>; prefixo + upload_<i> -> proposta_<i> -> cnpj_<i>
+    cnpj_* -> socios; proposta_* -> condicomer
+    rfp + proposta_* + socios + condicomer -> consolidar
+
+Cada proposta segue seu próprio caminho (upload, extração, consulta do QSA),
+então uploads, chamadas ao modelo e consultas à BrasilAPI se sobrepõem.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from equalprop.captura_socios import get_quadro_societario_for_list
+from equalprop.config import (
+    CONTEXT_CACHE_ENABLED,
+    CONTEXT_CACHE_MIN_PROPOSALS,
+    HEDGE_ENABLED,
+    MAX_CONCURRENT_PROPOSALS,
+    MAX_CONCURRENT_UPLOADS,
+    RUN_DEADLINE_S,
+    RUN_TOKEN_BUDGET,
+    stage_gen_config,
+)
+from equalprop.cancellation import CancelToken, RunCancelled, check, document_timeout
+from equalprop.condicomer_canon import canonicalize_conditions, known_canonical_names, learn, pivot_conditions
+from equalprop.context_cache import create_shared_prefix
+from equalprop.gemini_service import generate_json, process_proposal, proposal_prefix, stage_model, upload_pdf
+from equalprop.io_utils import prepare_documents, process_files
+from equalprop.hedging import Hedger
+from equalprop.json_repair import CONDICOMER_CHAVES, RFP
+from equalprop.payloads import compact_json, log_savings, rfp_payload_for_proposals
+from equalprop.prompts import classifica_condicomer_prompt, rfp_prompt, proposta_prompt
+from equalprop.reports.consolidate import consolidate_reports
+from equalprop.scheduler import Stage, run_stages
+from equalprop.socios_comum import match_common_partners
+from equalprop.usage import RunLedger
+
+# consolidate_reports muda o diretório de trabalho do processo; execuções
+# simultâneas (jobs, lote) consolidam uma de cada vez
+_consolidate_lock = threading.Lock()
+
+
+def _cnpj14(x):
+    if not x:
+        return None
+    s = ''.join(ch for ch in str(x) if ch.isdigit())
+    return s if len(s) == 14 else None
+
+
+def _header_cnpj(proposal_text):
+    try:
+        data = json.loads(proposal_text) if isinstance(proposal_text, str) else proposal_text
+        header = (data or {}).get('proposta', {}).get('header', {}) or {}
+        return _cnpj14(header.get('cnpj'))
+    except Exception:
+        return None
+
+
+def _count_pdcs(rfp_json):
+    if not isinstance(rfp_json, dict):
+        return 0
+    body = rfp_json.get("rfp_json") if isinstance(rfp_json.get("rfp_json"), dict) else rfp_json
+    produtos = body.get("produtos_demandados")
+    return len(produtos) if isinstance(produtos, list) else 0
+
+
+def _pop_matched(pop):
+    """Um POP conta como associado quando a resposta trouxe o produto oferecido."""
+    if not isinstance(pop, dict):
+        return False
+    return any(pop.get(k) not in (None, "null", "") for k in ("descricao", "preco_unitario"))
+
+
+def _lookup_qsa(pid, cnpj, cancel=None):
+    try:
+        return get_quadro_societario_for_list({pid: cnpj}, cancel=cancel).get(pid) if cnpj else None
+    except RunCancelled:
+        raise
+    except Exception as e:
+        print(f"Erro no scraping (6.2): {e}")
+        return None
+
+
+def build_report_stages(model, gen_config, rfp_path, proposal_paths, temp_dir,
+                        lookup_executor=None, streaming=None, ledger=None, cleanup=None, hedger=None, cancel=None,
+                        out_dir=None):
+    """Monta os estágios do relatório para uma RFP e suas propostas.
+
+    Com lookup_executor, a consulta do QSA de cada proposta é disparada assim
+    que o cabeçalho chega pelo streaming, antes do fim da extração. streaming,
+    se informado, é um dict {indice: [pdcs_associados, total_pdcs]} atualizado
+    durante a extração de cada proposta. ledger (RunLedger) contabiliza
+    todas as chamadas ao modelo e hedger (hedging.Hedger), se informado,
+    duplica as extrações de proposta mais lentas. Recursos que precisam ser liberados ao fim
+    da execução (cache de contexto) são acrescentados à lista cleanup. cancel
+    (CancelToken) é repassado às chamadas ao modelo, às consultas do QSA e à
+    consolidação. out_dir é o diretório dos relatórios (padrão: ./out).
+    """
+    early_lookups = {}
+    model_slots = threading.BoundedSemaphore(max(1, MAX_CONCURRENT_PROPOSALS))
+    upload_slots = threading.BoundedSemaphore(max(1, MAX_CONCURRENT_UPLOADS))
+    n = len(proposal_paths)
+    # Modelo e configuração de cada etapa (config.stage_settings / EQUALPROP_MODEL_PRESET)
+    proposal_model, proposal_config = stage_model(model, "proposta"), stage_gen_config(gen_config, "proposta")
+
+    def _convert(_inputs):
+        rfp_pdfs = process_files([rfp_path], temp_dir)
+        # Converter uma a uma para manter o índice de cada proposta
+        proposal_pdfs = [(process_files([p], temp_dir) or [None])[0] for p in proposal_paths]
+        if not rfp_pdfs or not any(proposal_pdfs):
+            raise RuntimeError("falha ao processar arquivos.")
+        return {"rfp": rfp_pdfs[0], "propostas": proposal_pdfs}
+
+    def _prepare(inputs):
+        converted = inputs["converter"]
+        # Só as propostas são podadas; a RFP segue com todas as páginas
+        return prepare_documents([converted["rfp"]] + converted["propostas"],
+                                 prune_paths=converted["propostas"],
+                                 prune_dir=os.path.join(temp_dir, "paginas_relevantes"))
+
+    def _upload_rfp(inputs):
+        doc = inputs["texto"][inputs["converter"]["rfp"]]
+        # Camada de texto confiável: envia o texto compacto no lugar do PDF
+        if doc["text"]:
+            return doc["text"]
+        check(cancel)
+        with upload_slots:
+            uploaded = upload_pdf(doc["pdf"])
+        if uploaded is None:
+            raise RuntimeError("falha no upload para a Gemini.")
+        return uploaded
+
+    def _upload_proposal(i):
+        def _run(inputs):
+            pdf_path = inputs["converter"]["propostas"][i]
+            if pdf_path is None:
+                return None
+            doc = inputs["texto"][pdf_path]
+            if doc["text"]:
+                return doc["text"]
+            with upload_slots:
+                return upload_pdf(doc["pdf"])
+        return _run
+
+    def _rfp(inputs):
+        with model_slots:
+            rfp_json = generate_json(stage_model(model, "rfp"), [rfp_prompt, inputs["upload_rfp"]],
+                                     stage_gen_config(gen_config, "rfp"), RFP,
+                                     ledger=ledger, stage="rfp", cancel=cancel)
+        log_savings("rfp_json das propostas", rfp_json, rfp_payload_for_proposals(rfp_json), calls=n)
+        return rfp_json
+
+    def _prefix(inputs):
+        # Com poucas propostas o custo de criar o cache não se paga
+        if not CONTEXT_CACHE_ENABLED or n < CONTEXT_CACHE_MIN_PROPOSALS:
+            return None
+        check(cancel)
+        shared = create_shared_prefix(proposal_model, proposal_prefix(inputs["rfp"], proposta_prompt))
+        if cleanup is not None:
+            cleanup.append(shared)
+        return shared
+
+    def _extract(i):
+        def _run(inputs):
+            pdf_path = inputs["converter"]["propostas"][i]
+            if pdf_path is None:
+                return None
+            gfile = inputs[f"upload_{i}"]
+            if gfile is None:
+                return (pdf_path, None)
+            total_pdcs = _count_pdcs(inputs["rfp"])
+            matched = set()
+            # Timeout da requisição pelo tamanho do que é enviado (texto ou PDF podado)
+            doc = inputs["texto"].get(pdf_path) or {}
+            if doc.get("text"):
+                size = len(doc["text"].encode("utf-8"))
+            else:
+                size = os.path.getsize(doc.get("pdf") or pdf_path)
+            timeout_s = document_timeout(doc.get("pages"), size)
+
+            def _on_header(header):
+                cnpj = _cnpj14((header or {}).get("cnpj")) if isinstance(header, dict) else None
+                if cnpj and lookup_executor is not None and i not in early_lookups:
+                    early_lookups[i] = (cnpj, lookup_executor.submit(_lookup_qsa, pdf_path, cnpj, cancel))
+
+            def _on_pop(index, pop):
+                if _pop_matched(pop):
+                    matched.add(index)
+                if streaming is not None:
+                    streaming[i] = [len(matched), total_pdcs]
+
+            if streaming is not None:
+                streaming[i] = [0, total_pdcs]
+            try:
+                with model_slots:
+                    text = process_proposal(inputs["prefixo"] or proposal_model, inputs["rfp"], gfile, pdf_path,
+                                            proposta_prompt, proposal_config,
+                                            on_header=_on_header, on_pop=_on_pop, ledger=ledger, hedger=hedger,
+                                            cancel=cancel, timeout_s=timeout_s)
+            finally:
+                if streaming is not None:
+                    streaming.pop(i, None)
+            return (pdf_path, text)
+        return _run
+
+    def _cnpj(i):
+        def _run(inputs):
+            extracted = inputs[f"proposta_{i}"]
+            if extracted is None:
+                return None
+            pid, text = extracted
+            cnpj = _header_cnpj(text)
+            early = early_lookups.get(i)
+            if early is not None and early[0] == cnpj:
+                return (pid, cnpj, early[1].result())
+            return (pid, cnpj, _lookup_qsa(pid, cnpj, cancel))
+        return _run
+
+    def _propostas_json(inputs):
+        extracted = [inputs[f"proposta_{i}"] for i in range(n)]
+        return {pid: text for pid, text in (e for e in extracted if e is not None)}
+
+    def _socios(inputs):
+        quadros_societarios = {}
+        for i in range(n):
+            entry = inputs[f"cnpj_{i}"]
+            if entry is not None:
+                quadros_societarios[entry[0]] = entry[2]
+        # Comparação local de nomes (ver socios_comum), sem chamada ao modelo
+        socio_comum, socios_matriz = match_common_partners(quadros_societarios)
+        return {"quadros_societarios": quadros_societarios, "socio_comum": socio_comum,
+                "socios_matriz": socios_matriz}
+
+    def _condicomer(inputs):
+        propostas_json = _propostas_json(inputs)
+        # Padronização local; só os nomes não reconhecidos vão ao modelo
+        mapping, leftovers = canonicalize_conditions(propostas_json)
+        local_count = len(mapping)
+        if leftovers:
+            # Inclui os padronizados aprendidos em execuções anteriores, para o modelo reusá-los
+            known = sorted(set(mapping.values()) | set(known_canonical_names()), key=str.lower)
+            try:
+                with model_slots:
+                    classified = generate_json(
+                        stage_model(model, "condicomer"),
+                        [classifica_condicomer_prompt,
+                         compact_json({"nomes": leftovers, "padronizados": known})],
+                        stage_gen_config(gen_config, "condicomer"), CONDICOMER_CHAVES, ledger=ledger, stage="condicomer",
+                        cancel=cancel, names=leftovers
+                    )["mapeamento"]
+                confirmed = {k: v for k, v in classified.items() if k in leftovers}
+                learn(confirmed)
+                mapping.update(confirmed)
+            except RunCancelled:
+                raise
+            except Exception as e:
+                print(f"[AVISO] Classificação de {len(leftovers)} condições comerciais falhou; "
+                      f"nomes mantidos como vieram: {e}")
+        print(f"[INFO] Condições comerciais: {local_count} nomes padronizados localmente, "
+              f"{len(leftovers)} enviados ao modelo.")
+        return pivot_conditions(propostas_json, mapping)
+
+    def _consolidate(inputs):
+        propostas_json = _propostas_json(inputs)
+        cnpjs_by_id = {pid: _header_cnpj(text) for pid, text in propostas_json.items()}
+        socios = inputs["socios"]
+        # Proteger o diretório de trabalho contra mudanças internas
+        with _consolidate_lock:
+            cwd_before = os.getcwd()
+            try:
+                _, relatorio_final_xlsx = consolidate_reports(
+                    inputs["rfp"], propostas_json, inputs["condicomer"],
+                    socios["quadros_societarios"], socios["socio_comum"], out_dir=out_dir, cancel=cancel
+                )
+            finally:
+                try:
+                    os.chdir(cwd_before)
+                except Exception:
+                    pass
+        usage_json = None
+        if ledger is not None and relatorio_final_xlsx:
+            usage_json = ledger.write_json(os.path.join(os.path.dirname(relatorio_final_xlsx), "relatorio_uso.json"))
+        return {
+            "rfp_json": inputs["rfp"],
+            "propostas_json": propostas_json,
+            "proposals_order": list(propostas_json.keys()),
+            "cnpjs_by_id": cnpjs_by_id,
+            "socios_em_comum": socios["socios_matriz"],
+            "report_xlsx": relatorio_final_xlsx,
+            "usage_json": usage_json,
+        }
+
+    stages = [
+        Stage("converter", _convert, label="Arquivos convertidos para PDF"),
+        Stage("texto", _prepare, ["converter"], label="Páginas relevantes e camadas de texto verificadas"),
+        Stage("upload_rfp", _upload_rfp, ["converter", "texto"], label="Requisição de compra preparada"),
+        Stage("rfp", _rfp, ["upload_rfp"], label="Requisição de compra analisada"),
+        Stage("prefixo", _prefix, ["rfp"], label="Contexto comum das propostas preparado"),
+    ]
+    for i, path in enumerate(proposal_paths):
+        fname = os.path.basename(path)
+        stages.append(Stage(f"upload_{i}", _upload_proposal(i), ["converter", "texto"],
+                            label=f"Proposta preparada: {fname}"))
+        stages.append(Stage(f"proposta_{i}", _extract(i), ["converter", "texto", "rfp", "prefixo", f"upload_{i}"],
+                            label=f"Proposta processada: {fname}"))
+        stages.append(Stage(f"cnpj_{i}", _cnpj(i), [f"proposta_{i}"], label=f"Quadro societário capturado: {fname}"))
+    stages.append(Stage("socios", _socios, [f"cnpj_{i}" for i in range(n)], label="Sócios em comum verificados"))
+    stages.append(Stage("condicomer", _condicomer, [f"proposta_{i}" for i in range(n)],
+                        label="Condições comerciais padronizadas"))
+    stages.append(Stage("consolidar", _consolidate,
+                        ["rfp", "socios", "condicomer"] + [f"proposta_{i}" for i in range(n)],
+                        label="Relatório final gerado"))
+    return stages
+
+
+def run_report_pipeline(model, gen_config, rfp_path, proposal_paths, temp_dir, on_progress=None, on_detail=None,
+                        ledger=None, cancel=None, out_dir=None):
+    """Executa o pipeline completo e devolve o dict produzido pelo estágio final.
+
+    on_progress(concluidos, total, label) é chamado a cada estágio finalizado;
+    on_detail(texto) recebe periodicamente quantos PDCs já foram associados
+    em cada proposta ainda em extração. O resumo de uso (tokens, tempo, custo)
+    fica em result["usage"] e em relatorio_uso.json ao lado do relatório;
+    os contadores de hedging ficam em result["usage"]["hedging"].
+
+    cancel (CancelToken) permite interromper a execução de outra thread; sem
+    ele, é criado um com o prazo RUN_DEADLINE_S. Interrompida, a execução
+    levanta RunCancelled sem esperar as chamadas em andamento.
+    """
+    if cancel is None:
+        cancel = CancelToken(RUN_DEADLINE_S or None)
+    if ledger is None:
+        ledger = RunLedger(token_budget=RUN_TOKEN_BUDGET)
+    hedger = Hedger() if HEDGE_ENABLED else None
+    streaming = {}
+    cleanup = []
+
+    def _on_stage_done(stage, done, total):
+        if on_progress:
+            on_progress(done, total, stage.label)
+
+    def _on_poll():
+        parts = []
+        for i, (matched, total_pdcs) in sorted(streaming.copy().items()):
+            parts.append(f"{os.path.basename(proposal_paths[i])}: {matched} de {total_pdcs} PDCs associados")
+        on_detail("; ".join(parts))
+
+    lookup_executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        stages = build_report_stages(model, gen_config, rfp_path, proposal_paths, temp_dir,
+                                     lookup_executor=lookup_executor, streaming=streaming, ledger=ledger,
+                                     cleanup=cleanup, hedger=hedger, cancel=cancel, out_dir=out_dir)
+        results = run_stages(stages, max_workers=min(32, 2 * len(proposal_paths) + 4),
+                             on_stage_done=_on_stage_done, on_poll=_on_poll if on_detail else None,
+                             cancel=cancel)
+    except RunCancelled as e:
+        print(f"[AVISO] Execução interrompida: {e}")
+        raise
+    finally:
+        lookup_executor.shutdown(wait=not cancel.cancelled, cancel_futures=True)
+        for resource in cleanup:
+            resource.close()
+        if hedger is not None:
+            hedger.history.flush()
+    result = results["consolidar"]
+    result["usage"] = ledger.summary()
+    totals = result["usage"]["totals"]
+    print(f"[OK] Execução concluída: {totals['calls']} chamadas, {totals['total_tokens']} tokens, "
+          f"~US$ {totals['estimated_cost_usd']:.4f}, {result['usage']['wall_time_s']:.1f}s")
+    if hedger is not None:
+        hedging = result["usage"]["hedging"] = hedger.stats()
+        if hedging["fired"] or hedging["skipped_cap"]:
+            print(f"[INFO] Hedging: {hedging['fired']} cópias disparadas, {hedging['won']} venceram, "
+                  f"{hedging['skipped_cap']} não disparadas pelo limite por execução.")
+    return result
@@ -278,3 +278,31 @@ Use exatamente o formato abaixo.
 }
 
 """
+
+reparo_json_prompt = """
+Uma resposta anterior sua não passou na validação e precisa ser corrigida.
+Abaixo seguem o problema encontrado e a resposta anterior.
+
+Corrija apenas o que está quebrado (JSON inválido, truncado ou partes obrigatórias ausentes),
+mantendo todos os valores que já estavam corretos, e devolva o JSON completo no schema original.
+
+Responda APENAS com JSON válido (sem markdown, sem comentários, sem texto fora do JSON).
+"""
+
+classifica_condicomer_prompt = """
+Você receberá (como JSON) nomes de condições comerciais extraídos de propostas que não puderam ser
+classificados automaticamente ("nomes") e os nomes padronizados já em uso ("padronizados").
+
+Para cada item de "nomes", informe o nome padronizado equivalente:
+- Use um dos nomes de "padronizados" quando for a mesma condição (ex.: "prazo p/ pagto" → "Condições de pagamento").
+- Caso contrário, crie um nome padronizado novo, curto, apenas com a primeira letra maiúscula (ex.: "Pedido mínimo").
+
+Responda APENAS com JSON válido (sem markdown, sem comentários, sem texto fora do JSON).
+FORMATO DE SAÍDA (exato):
+{
+"mapeamento": {
+"nome recebido 1": "Nome padronizado",
+"nome recebido 2": "Nome padronizado"
+}
+}
+"""
@@ -0,0 +1,268 @@
+"""
+Limitador de taxa adaptativo, compartilhado por todo o processo.
+
+- Baldes de tokens para requisições por minuto (RPM) e tokens por minuto (TPM).
+- Limite de concorrência AIMD: cresce aditivamente a cada sucesso rápido e
+  cai pela metade a cada 429. Nas etapas com alvo de latência
+  (config.stage_settings; só as sem documento anexado, cuja duração não
+  depende do tamanho do arquivo), uma chamada acima do alvo ou um timeout
+  cortam 10%.
+- Classificação de erros: 429, 5xx e timeouts são repetidos com backoff que
+  respeita o Retry-After informado pela API; os demais falham na hora.
+
+Como as sessões do Streamlit compartilham o processo, get_limiter() devolve
+uma instância única para que sessões concorrentes não estourem a cota juntas.
+"""
+
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from equalprop.config import (
+    MAX_MODEL_CONCURRENCY,
+    MAX_RETRIES,
+    RATE_LIMIT_RPM,
+    RATE_LIMIT_TPM,
+)
+
+RATE_LIMIT = "rate_limit"
+SERVER = "server"
+TIMEOUT = "timeout"
+FATAL = "fatal"
+RETRIABLE = (RATE_LIMIT, SERVER, TIMEOUT)
+
+
+class TokenBucket:
+    """Balde de tokens com reposição contínua (rate_per_min por minuto)."""
+
+    def __init__(self, rate_per_min: float, capacity: Optional[float] = None):
+        self.rate = max(rate_per_min, 1e-6) / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_min)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Bloqueia até haver saldo e devolve o tempo esperado, em segundos."""
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return waited
+                delay = (amount - self._level) / self.rate
+            delay = min(delay, 5.0)
+            time.sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """Debita (positivo) ou devolve (negativo) saldo; o saldo pode ficar negativo."""
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level - amount)
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("code", "status_code", "status"):
+        value = getattr(exc, attr, None)
+        value = getattr(value, "value", value)
+        if isinstance(value, int):
+            return value
+    match = re.match(r"\s*(\d{3})\b", str(exc))
+    return int(match.group(1)) if match else None
+
+
+def classify_error(exc: BaseException) -> str:
+    """Classifica a exceção em rate_limit, server, timeout ou fatal."""
+    name = type(exc).__name__
+    text = str(exc).lower()
+    code = _status_code(exc)
+    if code == 429 or name in ("ResourceExhausted", "TooManyRequests") or "quota" in text or "rate limit" in text:
+        return RATE_LIMIT
+    if name in ("DeadlineExceeded", "TimeoutError", "ReadTimeout", "ConnectTimeout") or "timed out" in text \
+            or "deadline" in text or code == 504:
+        return TIMEOUT
+    if (code is not None and 500 <= code < 600) or name in (
+            "InternalServerError", "ServiceUnavailable", "BadGateway", "ServerError", "ConnectionError"):
+        return SERVER
+    return FATAL
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Extrai o atraso sugerido pela API (RetryInfo, cabeçalho Retry-After ou texto)."""
+    for detail in getattr(exc, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            seconds = getattr(delay, "seconds", 0) + getattr(delay, "nanos", 0) / 1e9
+            if seconds > 0:
+                return seconds
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            return float(value)
+    except (TypeError, ValueError):
+        pass
+    match = re.search(r"retry(?:[_ ]?delay|[_ -]?after| in)[\"':= {]*(?:seconds:\s*)?(\d+(?:\.\d+)?)", str(exc), re.I)
+    return float(match.group(1)) if match else None
+
+
+class _Slot:
+    """Resultado de uma chamada, preenchido pelo chamador dentro de AdaptiveLimiter.slot()."""
+
+    def __init__(self):
+        self.tokens = None
+
+
+class AdaptiveLimiter:
+    """Controla RPM, TPM e o número de chamadas simultâneas ao modelo."""
+
+    def __init__(self, rpm: float, tpm: float, max_concurrency: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._cooldown_until = 0.0
+        self._cond = threading.Condition()
+        self._stats = {"calls": 0, "rate_limited": 0, "server_errors": 0, "timeouts": 0, "throttled_s": 0.0}
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(1, int(self._limit))
+
+    def _enter(self) -> float:
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                pause = self._cooldown_until - time.monotonic()
+                if pause <= 0 and self._in_flight < self.concurrency_limit:
+                    self._in_flight += 1
+                    return time.monotonic() - start
+                self._cond.wait(timeout=pause if pause > 0 else None)
+
+    def _exit(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _on_success(self, latency: float, latency_target_s: Optional[float]):
+        with self._cond:
+            if latency_target_s and latency > latency_target_s:
+                self._limit = max(1.0, self._limit * 0.9)
+            else:
+                self._limit = min(float(self.max_concurrency), self._limit + 1.0 / max(self._limit, 1.0))
+            self._cond.notify_all()
+
+    def _on_failure(self, exc: BaseException, latency_target_s: Optional[float]):
+        kind = classify_error(exc)
+        with self._cond:
+            if kind == RATE_LIMIT:
+                self._stats["rate_limited"] += 1
+                self._limit = max(1.0, self._limit / 2)
+                pause = retry_after_seconds(exc) or 5.0
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + pause)
+                print(f"[AVISO] Cota do modelo atingida; pausando novas chamadas por {pause:.1f}s "
+                      f"(concorrência agora {self.concurrency_limit}).")
+            elif kind == SERVER:
+                self._stats["server_errors"] += 1
+            elif kind == TIMEOUT:
+                self._stats["timeouts"] += 1
+                if latency_target_s:
+                    self._limit = max(1.0, self._limit * 0.9)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, estimated_tokens: int = 0, latency_target_s: Optional[float] = None):
+        """Reserva uma vaga para uma chamada ao modelo.
+
+        Dentro do bloco, o chamador pode informar slot.tokens com o total real
+        de tokens da resposta para corrigir a estimativa usada no balde TPM.
+        latency_target_s é o alvo de latência da etapa; None (chamadas com
+        documento) faz o limite reagir só aos 429.
+        """
+        waited = self._enter()
+        try:
+            waited += self.requests.acquire(1)
+            waited += self.tokens.acquire(estimated_tokens)
+        except BaseException:
+            self._exit()
+            raise
+        with self._cond:
+            self._stats["calls"] += 1
+            self._stats["throttled_s"] += waited
+        slot = _Slot()
+        start = time.monotonic()
+        try:
+            yield slot
+        except Exception as e:
+            self._on_failure(e, latency_target_s)
+            raise
+        else:
+            self._on_success(time.monotonic() - start, latency_target_s)
+            if slot.tokens is not None:
+                self.tokens.adjust(slot.tokens - min(estimated_tokens, self.tokens.capacity))
+        finally:
+            self._exit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            data = dict(self._stats)
+            data["concurrency_limit"] = self.concurrency_limit
+            data["in_flight"] = self._in_flight
+        return data
+
+
+_limiter: Optional[AdaptiveLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> AdaptiveLimiter:
+    """Instância única do limitador para o processo."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter(RATE_LIMIT_RPM, RATE_LIMIT_TPM, MAX_MODEL_CONCURRENCY)
+        return _limiter
+
+
+def call_with_retries(fn: Callable[[], object], max_attempts: int = MAX_RETRIES, label: str = "chamada",
+                      cancel=None):
+    """Executa fn() repetindo apenas erros transitórios (429, 5xx, timeout).
+
+    O intervalo respeita o Retry-After da API quando existir; caso contrário
+    usa backoff exponencial com jitter (2, 4, 8... até 60 s). Com cancel
+    (CancelToken), a espera é interrompida e nenhuma nova tentativa é feita
+    depois que a execução for cancelada.
+    """
+    attempt = 1
+    while True:
+        if cancel is not None:
+            cancel.check()
+        try:
+            return fn()
+        except Exception as e:
+            kind = classify_error(e)
+            if kind not in RETRIABLE or attempt >= max_attempts:
+                raise
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = random.uniform(0, min(60.0, 2.0 ** attempt)) + 1.0
+            print(f"[AVISO] {label}: erro {kind} na tentativa {attempt}/{max_attempts}; "
+                  f"nova tentativa em {delay:.1f}s ({e})")
+            if cancel is not None:
+                cancel.sleep(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
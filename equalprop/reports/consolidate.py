@@ -14,7 +14,8 @@ from .relatorio_condicomer import generate_condicomer_report
 from .relatorio_socios import generate_socios_report
 
 
-def consolidate_reports(rfp_json=None, propostas_json=None, condicomer_padronizadas=None, quadros_societarios=None, socio_comum=None, out_dir=None):
+def consolidate_reports(rfp_json=None, propostas_json=None, condicomer_padronizadas=None, quadros_societarios=None, socio_comum=None, out_dir=None,
+                        cancel=None):
     """Gera e consolida relatorios em CSV e Excel.
 
     Ordem:
@@ -24,6 +25,8 @@ def consolidate_reports(rfp_json=None, propostas_json=None, condicomer_padroniza
     4) relatorio_condicomer.csv
     5) relatorio_socios.csv
     6) comparacao_produtos.csv
+
+    Com cancel (CancelToken), a execução interrompida para antes do próximo relatório.
     """
     # Preparar out_dir e entrar nele para nao misturar com execucoes anteriores
     if out_dir is None:
@@ -49,6 +52,8 @@ def consolidate_reports(rfp_json=None, propostas_json=None, condicomer_padroniza
     generated_files = {}
 
     def _safe_generate(generator, filename, *args, **kwargs):
+        if cancel is not None:
+            cancel.check()
         target = os.path.abspath(filename)
         try:
             generator(*args, filename=target, **kwargs)
@@ -226,6 +231,8 @@ def consolidate_reports(rfp_json=None, propostas_json=None, condicomer_padroniza
     with open(csv_path, 'w', newline='', encoding='utf-8') as arquivo:
         csv.writer(arquivo).writerows(linhas_consolidadas)
 
+    if cancel is not None:
+        cancel.check()
     workbook = openpyxl.Workbook()
     sheet = workbook.active
     for row in linhas_consolidadas:
@@ -0,0 +1,162 @@
+"""
+Cache persistente (SQLite) das respostas do modelo.
+
+Todas as chamadas usam temperature 0.0 e saída JSON, então entradas idênticas
+podem reaproveitar a resposta anterior. A chave combina o nome do modelo, a
+configuração de geração e o hash de cada parte do conteúdo (texto dos prompts
+de equalprop.prompts, payloads JSON e o SHA-256 dos documentos enviados).
+O tamanho total é limitado por RESPONSE_CACHE_MAX_MB com descarte LRU.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from equalprop import upload_cache
+from equalprop.config import CACHE_DIR, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_MB
+
+_DB_PATH = os.path.join(CACHE_DIR, "responses.sqlite")
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+class CachedResponse:
+    """Resposta servida pelo cache; imita o atributo .text da resposta do Gemini."""
+
+    from_cache = True
+    usage_metadata = None
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+@contextmanager
+def _connect():
+    """Abre o banco, executa a transação e fecha a conexão ao final."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(_DB_PATH, timeout=30)
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            yield conn
+    finally:
+        conn.close()
+
+
+def _sha256(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _part_digest(part: Any) -> str:
+    """Hash estável de uma parte do conteúdo enviado ao modelo."""
+    if isinstance(part, str):
+        return "text:" + _sha256(part)
+    if isinstance(part, dict):
+        inline = part.get("inline_data")
+        if isinstance(inline, dict):
+            return "inline:" + _sha256(inline.get("data") or "")
+        return "json:" + _sha256(json.dumps(part, sort_keys=True, ensure_ascii=False, default=str))
+    digest = upload_cache.digest_for(part)
+    if digest:
+        return "file:" + digest
+    name = getattr(part, "name", None) or getattr(part, "uri", None)
+    if name:
+        return "remote:" + str(name)
+    return "repr:" + _sha256(repr(part))
+
+
+def _config_repr(gen_config: Any) -> Any:
+    if gen_config is None:
+        return None
+    if dataclasses.is_dataclass(gen_config):
+        return dataclasses.asdict(gen_config)
+    if isinstance(gen_config, dict):
+        return gen_config
+    to_dict = getattr(type(gen_config), "to_dict", None)
+    if callable(to_dict):
+        try:
+            return to_dict(gen_config)
+        except Exception:
+            pass
+    fields = {}
+    for attr in dir(gen_config):
+        if attr.startswith("_"):
+            continue
+        value = getattr(gen_config, attr, None)
+        if not callable(value):
+            fields[attr] = value
+    return fields
+
+
+def make_key(model_name: str, contents, gen_config) -> str:
+    """Chave do cache para (modelo, conteúdo, configuração de geração)."""
+    payload = {
+        "model": model_name,
+        "config": _config_repr(gen_config),
+        "parts": [_part_digest(p) for p in contents],
+    }
+    return _sha256(json.dumps(payload, sort_keys=True, default=str))
+
+
+def get(key: str) -> Optional[str]:
+    """Devolve o texto em cache para a chave (ou None) e atualiza o acesso LRU."""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    try:
+        with _connect() as conn:
+            row = conn.execute("SELECT text FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+    except sqlite3.Error as e:
+        print(f"[AVISO] Cache de respostas indisponível: {e}")
+        row = None
+    with _stats_lock:
+        _stats["hits" if row is not None else "misses"] += 1
+    return row[0] if row is not None else None
+
+
+def put(key: str, text: str) -> None:
+    """Armazena a resposta e descarta as menos usadas se o limite for excedido."""
+    if not RESPONSE_CACHE_ENABLED or not text:
+        return
+    now = time.time()
+    max_bytes = int(RESPONSE_CACHE_MAX_MB * 1024 * 1024)
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, text, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, text, len(text.encode("utf-8")), now, now),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            evicted = 0
+            while total > max_bytes:
+                row = conn.execute("SELECT key, size FROM responses ORDER BY last_access LIMIT 1").fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+                total -= row[1]
+                evicted += 1
+    except sqlite3.Error as e:
+        print(f"[AVISO] Falha ao gravar no cache de respostas: {e}")
+        return
+    with _stats_lock:
+        _stats["stores"] += 1
+        _stats["evictions"] += evicted
+
+
+def stats() -> Dict[str, int]:
+    """Contadores de acertos/falhas do processo atual."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,120 @@
+"""
+Escalonador de estágios em grafo de dependências (DAG).
+
+Cada Stage declara de quais estágios depende; run_stages dispara cada um
+assim que todas as suas entradas ficam prontas, de modo que etapas de rede
+independentes (uploads, chamadas ao modelo, consultas de CNPJ) se sobrepõem.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from equalprop.cancellation import RunCancelled
+
+
+class Stage:
+    """Nó do pipeline.
+
+    func recebe um dict {nome_dependencia: resultado} e devolve o resultado
+    do estágio. label é o texto mostrado ao usuário quando o estágio termina.
+    """
+
+    def __init__(self, name: str, func: Callable[[Dict[str, Any]], Any],
+                 deps: Iterable[str] = (), label: Optional[str] = None):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.label = label or name
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={self.deps!r})"
+
+
+def _check_graph(stages: List[Stage]) -> None:
+    names = [s.name for s in stages]
+    if len(names) != len(set(names)):
+        raise ValueError("Estágios com nomes duplicados")
+    known = set(names)
+    for s in stages:
+        missing = [d for d in s.deps if d not in known]
+        if missing:
+            raise ValueError(f"Estágio {s.name!r} depende de estágios inexistentes: {missing}")
+    # Ordenação topológica apenas para detectar ciclos
+    deps = {s.name: set(s.deps) for s in stages}
+    resolved = set()
+    while deps:
+        ready = [n for n, d in deps.items() if d <= resolved]
+        if not ready:
+            raise ValueError(f"Ciclo de dependências entre: {sorted(deps)}")
+        for n in ready:
+            resolved.add(n)
+            del deps[n]
+
+
+def run_stages(stages: Iterable[Stage], max_workers: int = 8,
+               on_stage_done: Optional[Callable[[Stage, int, int], None]] = None,
+               on_poll: Optional[Callable[[], None]] = None,
+               poll_interval: float = 1.0, cancel=None) -> Dict[str, Any]:
+    """Executa os estágios respeitando as dependências e devolve {nome: resultado}.
+
+    on_stage_done(stage, concluidos, total) é chamado na thread chamadora a
+    cada estágio finalizado; on_poll(), se informado, a cada poll_interval
+    segundos enquanto houver estágios em execução. Se um estágio levantar
+    exceção, nenhum novo estágio é disparado e a exceção é propagada.
+    Com cancel (CancelToken), a execução interrompida não dispara novos
+    estágios, levanta RunCancelled em até meio segundo e não espera os
+    estágios em andamento (que param por conta própria ao consultar cancel);
+    uma falha em qualquer estágio também cancela os demais.
+    """
+    stages = list(stages)
+    _check_graph(stages)
+    pending = {s.name: s for s in stages}
+    results: Dict[str, Any] = {}
+    running = {}
+    total = len(stages)
+    done = 0
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    abandoned = False
+    if cancel is not None:
+        poll_interval = min(poll_interval, 0.5)
+    try:
+        def _submit_ready():
+            if cancel is not None:
+                cancel.check()
+            for name, stage in list(pending.items()):
+                if all(d in results for d in stage.deps):
+                    inputs = {d: results[d] for d in stage.deps}
+                    running[executor.submit(stage.func, inputs)] = stage
+                    del pending[name]
+
+        _submit_ready()
+        while running:
+            finished, _ = wait(list(running), timeout=poll_interval if (on_poll or cancel) else None,
+                               return_when=FIRST_COMPLETED)
+            if cancel is not None:
+                cancel.check()
+            if on_poll:
+                on_poll()
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    results[stage.name] = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+                done += 1
+                if on_stage_done:
+                    on_stage_done(stage, done, total)
+            _submit_ready()
+    except BaseException as e:
+        if cancel is not None:
+            # Falha (ou interrupção do chamador) encerra também o que está em andamento
+            cancel.cancel(str(e) if isinstance(e, RunCancelled) else f"execução abortada: {e!r}")
+            abandoned = True
+        raise
+    finally:
+        executor.shutdown(wait=not abandoned, cancel_futures=True)
+
+    return results
@@ -0,0 +1,266 @@
+"""
+Serviço compartilhado: API HTTP local + processos de trabalho sobre a fila SQLite.
+
+Uso: python -m equalprop.server
+
+Rotas (JSON, exceto o download):
+    POST   /jobs                   multipart/form-data com "rfp" (um PDF) e "propostas"
+                                   (um ou mais PDFs); usuário no cabeçalho X-EqualProp-User
+                                   ou no campo "usuario". Responde 202 com {"id": ...}.
+    GET    /jobs?usuario=...       jobs mais recentes (de um usuário, se informado)
+    GET    /jobs/<id>              estado, progresso e posição na fila
+    GET    /jobs/<id>/relatorio    relatorio_consolidado.xlsx do job concluído
+    DELETE /jobs/<id>              pede o cancelamento
+
+SERVICE_WORKERS processos executam os relatórios (um por vez cada), de modo
+que a API continua respondendo com a fila cheia. Cada processo envia sinal de
+vida e progresso ao banco a cada poucos segundos e consulta, no mesmo passo,
+se o cancelamento foi pedido.
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default as _email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from equalprop import job_queue
+from equalprop.config import SERVICE_HOST, SERVICE_MAX_UPLOAD_MB, SERVICE_PORT, SERVICE_STALE_S, SERVICE_WORKERS
+
+_HEARTBEAT_S = max(1.0, min(5.0, SERVICE_STALE_S / 6))
+_IDLE_POLL_S = 1.0
+_JOB_PATH = re.compile(r"^/jobs/([0-9a-f]{12})(/relatorio)?/?$")
+
+
+# =========================
+# ------- WORKERS ---------
+# =========================
+def _run_job(job, model, gen_config, worker):
+    # Imports tardios: só os processos de trabalho carregam o pipeline
+    from equalprop.cancellation import CancelToken, RunCancelled
+    from equalprop.config import RUN_DEADLINE_S
+    from equalprop.pipeline import run_report_pipeline
+
+    job_id = job["id"]
+    print(f"[INFO] {worker}: iniciando job {job_id} ({job['user']}).")
+    cancel = CancelToken(RUN_DEADLINE_S or None)
+    progress = dict(job["progress"] or {})
+    stop = threading.Event()
+
+    def _watch():
+        # Sinal de vida + progresso; o pedido de cancelamento volta na mesma consulta
+        while not stop.wait(_HEARTBEAT_S):
+            try:
+                if job_queue.heartbeat(job_id, worker, dict(progress)):
+                    cancel.cancel("cancelado pela API")
+            except job_queue.JobLost as e:
+                # Devolvido à fila por falta de sinal de vida: outro processo o executa
+                print(f"[AVISO] {worker}: {e}; interrompendo.")
+                cancel.cancel("job devolvido à fila")
+                return
+            except Exception as e:
+                print(f"[AVISO] {worker}: falha ao registrar sinal de vida de {job_id}: {e}")
+
+    def _on_progress(done, total, label):
+        progress.update(done=done, total=total, label=label)
+
+    watcher = threading.Thread(target=_watch, name=f"heartbeat-{job_id}", daemon=True)
+    watcher.start()
+    # Pasta de trabalho própria: se o job voltar à fila, o novo processo não usa a mesma
+    temp_dir = os.path.join(job_queue.job_dir(job_id), f"trabalho-{worker}")
+    os.makedirs(temp_dir, exist_ok=True)
+
+    def _finish(status, **fields):
+        if not job_queue.finish(job_id, worker, status, **fields):
+            print(f"[AVISO] {worker}: job {job_id} não pertence mais a este processo; resultado descartado.")
+            return False
+        return True
+
+    try:
+        result = run_report_pipeline(model, gen_config, job["rfp_path"], job["proposal_paths"], temp_dir,
+                                     on_progress=_on_progress, cancel=cancel, out_dir=job["out_dir"])
+        stop.set()
+        try:
+            job_queue.heartbeat(job_id, worker, dict(progress))
+        except job_queue.JobLost:
+            pass
+        if _finish(job_queue.DONE, report_xlsx=result.get("report_xlsx")):
+            print(f"[OK] {worker}: job {job_id} concluído.")
+    except RunCancelled as e:
+        _finish(job_queue.CANCELLED, error=str(e))
+    except Exception as e:
+        print(f"[ERRO] {worker}: job {job_id} falhou: {e}")
+        _finish(job_queue.ERROR, error=str(e))
+    finally:
+        stop.set()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def worker_main(index: int, stop_event=None):
+    """Laço de um processo de trabalho: reserva um job da fila, executa, repete."""
+    from equalprop.config import build_gen_config, setup_gemini_client
+
+    worker = f"worker-{index}-{os.getpid()}"
+    model = setup_gemini_client()
+    gen_config = build_gen_config(temperature=0.0, response_mime_type="application/json")
+    print(f"[OK] {worker} pronto.")
+    while stop_event is None or not stop_event.is_set():
+        try:
+            job = job_queue.claim_next(worker)
+        except Exception as e:
+            print(f"[AVISO] {worker}: fila indisponível: {e}")
+            job = None
+        if job is None:
+            time.sleep(_IDLE_POLL_S)
+            continue
+        _run_job(job, model, gen_config, worker)
+
+
+def start_workers(n: int = SERVICE_WORKERS):
+    """Inicia n processos de trabalho; devolve (processos, evento_de_parada)."""
+    ctx = multiprocessing.get_context("spawn")
+    # Não daemônicos: cada processo abre o pool de preparação dos documentos
+    # (io_utils.prepare_documents); quem chama encerra com stop_event e join/terminate
+    stop_event = ctx.Event()
+    processes = []
+    for i in range(max(1, n)):
+        p = ctx.Process(target=worker_main, args=(i, stop_event), name=f"equalprop-worker-{i}", daemon=False)
+        p.start()
+        processes.append(p)
+    return processes, stop_event
+
+
+# =========================
+# --------- HTTP ----------
+# =========================
+def _public(job):
+    """Campos do job expostos pela API."""
+    data = {k: job[k] for k in ("id", "user", "status", "progress", "error", "created_at", "started_at",
+                                 "finished_at", "attempts", "cancel_requested")}
+    data["propostas"] = [os.path.basename(p) for p in job["proposal_paths"]]
+    data["relatorio"] = f"/jobs/{job['id']}/relatorio" if job["status"] == job_queue.DONE and job["report_xlsx"] else None
+    return data
+
+
+def _parse_multipart(content_type: str, body: bytes):
+    """Devolve ({campo: [valor_texto]}, {campo: [(nome_arquivo, bytes)]})."""
+    message = BytesParser(policy=_email_policy).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\nMIME-Version: 1.0\r\n\r\n" + body
+    )
+    fields, files = {}, {}
+    if not message.is_multipart():
+        return fields, files
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if not name:
+            continue
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True) or b""
+        if filename:
+            files.setdefault(name, []).append((filename, payload))
+        else:
+            fields.setdefault(name, []).append(payload.decode("utf-8", "replace"))
+    return fields, files
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "EqualProp"
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send_json(status, {"erro": message})
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            return self._error(404, "rota inexistente")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return self._error(400, "corpo vazio")
+        if length > SERVICE_MAX_UPLOAD_MB * 1024 * 1024:
+            return self._error(413, f"envio acima de {SERVICE_MAX_UPLOAD_MB:.0f} MB")
+        content_type = self.headers.get("Content-Type", "")
+        if not content_type.startswith("multipart/form-data"):
+            return self._error(415, "use multipart/form-data")
+        fields, files = _parse_multipart(content_type, self.rfile.read(length))
+        rfp = (files.get("rfp") or [None])[0]
+        proposals = files.get("propostas") or []
+        if rfp is None or not proposals:
+            return self._error(400, "envie um arquivo 'rfp' e ao menos um arquivo 'propostas'")
+        user = (self.headers.get("X-EqualProp-User") or (fields.get("usuario") or [""])[0]).strip() or "anonimo"
+        job_id = job_queue.enqueue(user, rfp, proposals)
+        self._send_json(202, {"id": job_id, "status": job_queue.QUEUED, "url": f"/jobs/{job_id}"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") == "/jobs":
+            user = (parse_qs(url.query).get("usuario") or [None])[0]
+            return self._send_json(200, [_public(j) for j in job_queue.list_jobs(user)])
+        match = _JOB_PATH.match(url.path)
+        if not match:
+            return self._error(404, "rota inexistente")
+        job = job_queue.get(match.group(1))
+        if job is None:
+            return self._error(404, "job inexistente")
+        if not match.group(2):
+            data = _public(job)
+            data["posicao_na_fila"] = job_queue.queue_position(job["id"])
+            return self._send_json(200, data)
+        path = job.get("report_xlsx")
+        if job["status"] != job_queue.DONE or not path or not os.path.exists(path):
+            return self._error(409, f"relatório indisponível (job {job['status']})")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        self.send_header("Content-Disposition", 'attachment; filename="relatorio_consolidado.xlsx"')
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_DELETE(self):
+        match = _JOB_PATH.match(urlparse(self.path).path)
+        if not match or match.group(2):
+            return self._error(404, "rota inexistente")
+        if job_queue.get(match.group(1)) is None:
+            return self._error(404, "job inexistente")
+        if not job_queue.request_cancel(match.group(1)):
+            return self._error(409, "job já finalizado")
+        self._send_json(202, {"id": match.group(1), "cancelamento": "pedido"})
+
+    def log_message(self, fmt, *args):
+        print(f"[INFO] HTTP {self.address_string()} {fmt % args}")
+
+
+def serve(host: str = SERVICE_HOST, port: int = SERVICE_PORT, workers: int = SERVICE_WORKERS):
+    """Retoma a fila, inicia os processos de trabalho e atende a API até Ctrl+C."""
+    job_queue.requeue_stale()
+    processes, stop_event = start_workers(workers)
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    print(f"[OK] EqualProp em http://{host}:{port} com {len(processes)} processo(s) de trabalho.")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("[INFO] Encerrando serviço...")
+    finally:
+        httpd.server_close()
+        stop_event.set()
+        for p in processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,146 @@
+"""
+Detecção local de sócios em comum entre as propostas.
+
+Substitui a chamada ao modelo da etapa 6.3: cada linha do QSA ("Nome,
+qualificação") tem a qualificação removida e o nome normalizado (sem
+acentos, minúsculas, sem partículas como da/de/dos e com variações de
+grafia como Souza/Sousa unificadas). Um índice de trigramas
+limita as comparações aos pares de nomes de propostas diferentes que
+compartilham boa parte dos trigramas; só esses pares são pontuados.
+
+Dois nomes são considerados o mesmo sócio quando idênticos após a
+normalização, quando o coeficiente de Dice dos trigramas atinge
+SOCIO_MATCH_THRESHOLD (grafias quase idênticas) ou quando um contém todos os
+nomes do outro com o mesmo primeiro e último nome (nome do meio omitido).
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from equalprop.config import SOCIO_MATCH_THRESHOLD
+
+_PARTICLES = {"da", "de", "di", "do", "du", "das", "dos", "e", "del", "della"}
+# Sufixos de sócios pessoa jurídica que não ajudam a distinguir nomes; só são
+# removidos do fim de nomes de empresa, nunca de pessoas ("Maria de Sá")
+_COMPANY_SUFFIXES = {"ltda", "sa", "eireli", "me", "epp"}
+# Sufixos que sozinhos indicam empresa ("sa" não: Sá é sobrenome)
+_UNAMBIGUOUS_SUFFIXES = {"ltda", "eireli", "me", "epp"}
+_COMPANY_WORDS = {"participacoes", "holding", "empreendimentos", "comercio", "industria", "servicos",
+                  "investimentos", "incorporacoes", "construtora", "engenharia", "administradora"}
+# S.A. / S/A / S. A. (a forma "SA", sem pontuação, é ambígua)
+_SA_RE = re.compile(r"\bs\s*[./]\s*a\b\.?")
+
+
+def partner_name(line: Any) -> str:
+    """Devolve só o nome de uma linha do QSA ("João da Silva, Sócio-Administrador")."""
+    return str(line or "").split(",", 1)[0].strip()
+
+
+# Variações de grafia comuns em nomes brasileiros (Souza/Sousa, Luiz/Luis, Thiago/Tiago...)
+_SPELLING = (("ph", "f"), ("th", "t"), ("y", "i"), ("w", "v"), ("z", "s"), ("k", "c"))
+
+
+def _spelling_key(token: str) -> str:
+    for old, new in _SPELLING:
+        token = token.replace(old, new)
+    # Letras dobradas (Mattos/Matos, Rossi/Rosi)
+    return "".join(c for i, c in enumerate(token) if i == 0 or c != token[i - 1])
+
+
+def _is_company(folded: str, tokens: List[str]) -> bool:
+    """Nome de sócio pessoa jurídica: sufixo inequívoco, S.A./S/A pontuado ou palavra típica de empresa."""
+    if not tokens:
+        return False
+    if tokens[-1] in _UNAMBIGUOUS_SUFFIXES or _SA_RE.search(folded):
+        return True
+    return any(t in _COMPANY_WORDS for t in tokens)
+
+
+def normalize_name(name: str) -> str:
+    """Minúsculas, sem acentos, pontuação nem partículas (da/de/dos...), grafia unificada.
+
+    Em nomes de empresa, os sufixos societários finais (Ltda, S.A., EPP...)
+    também saem; nomes de pessoas mantêm todos os sobrenomes.
+    """
+    text = unicodedata.normalize("NFKD", str(name or ""))
+    folded = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = "".join(c if c.isalnum() else " " for c in _SA_RE.sub(" sa ", folded))
+    tokens = [t for t in text.split() if t not in _PARTICLES]
+    if _is_company(folded, tokens):
+        while len(tokens) > 1 and tokens[-1] in _COMPANY_SUFFIXES:
+            tokens.pop()
+    return " ".join(_spelling_key(t) for t in tokens)
+
+
+def _trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _same_partner(a: str, b: str, grams_a: Set[str], grams_b: Set[str], threshold: float) -> Tuple[bool, float]:
+    if a == b:
+        return True, 1.0
+    score = 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+    if score >= threshold:
+        return True, score
+    ta, tb = a.split(), b.split()
+    short, long_ = (ta, tb) if len(ta) <= len(tb) else (tb, ta)
+    if len(short) >= 2 and short[0] == long_[0] and short[-1] == long_[-1] and set(short) <= set(long_):
+        return True, score
+    return False, score
+
+
+def match_common_partners(quadros_societarios: Dict[str, Optional[List[str]]],
+                          threshold: float = SOCIO_MATCH_THRESHOLD):
+    """Compara os sócios de todas as propostas.
+
+    Devolve (socio_comum, matriz):
+    - socio_comum: {id: "sim" | "não" | None}, no formato esperado por
+      generate_socios_report; None para propostas sem QSA.
+    - matriz: {id_a: {id_b: [[nome_em_a, nome_em_b], ...]}}, simétrica, só
+      com os pares de propostas que compartilham algum sócio.
+    """
+    entries = []  # (id, nome_original, nome_normalizado, trigramas)
+    socio_comum: Dict[str, Optional[str]] = {}
+    for pid, linhas in (quadros_societarios or {}).items():
+        names = [partner_name(l) for l in (linhas or []) if partner_name(l)]
+        socio_comum[pid] = "não" if names else None
+        for name in names:
+            norm = normalize_name(name)
+            if norm:
+                entries.append((pid, name, norm, _trigrams(norm)))
+
+    index: Dict[str, List[int]] = defaultdict(list)
+    for idx, (_, _, _, grams) in enumerate(entries):
+        for g in grams:
+            index[g].append(idx)
+
+    matriz: Dict[str, Dict[str, List[List[str]]]] = defaultdict(lambda: defaultdict(list))
+    compared = 0
+    for i, (pid, name, norm, grams) in enumerate(entries):
+        shared: Dict[int, int] = defaultdict(int)
+        for g in grams:
+            for j in index[g]:
+                if j > i and entries[j][0] != pid:
+                    shared[j] += 1
+        # Bloqueio: só pares que dividem ao menos metade dos trigramas do nome menor
+        for j, count in shared.items():
+            other_pid, other_name, other_norm, other_grams = entries[j]
+            if count * 2 < min(len(grams), len(other_grams)):
+                continue
+            compared += 1
+            same, _score = _same_partner(norm, other_norm, grams, other_grams, threshold)
+            if same:
+                socio_comum[pid] = socio_comum[other_pid] = "sim"
+                matriz[pid][other_pid].append([name, other_name])
+                matriz[other_pid][pid].append([other_name, name])
+
+    per_proposal = defaultdict(int)
+    for entry in entries:
+        per_proposal[entry[0]] += 1
+    total_pairs = (len(entries) ** 2 - sum(c * c for c in per_proposal.values())) // 2
+    print(f"[INFO] Sócios em comum: {compared} de {total_pairs} pares de nomes comparados; "
+          f"{sum(1 for v in socio_comum.values() if v == 'sim')} propostas com sócio em comum.")
+    return socio_comum, {pid: dict(row) for pid, row in matriz.items()}
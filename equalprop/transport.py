@@ -0,0 +1,105 @@
+"""
+Escolha do transporte de cada documento enviado ao modelo.
+
+Arquivos pequenos (até INLINE_MAX_MB) seguem inline na própria requisição,
+economizando o round trip do upload. Os grandes vão pela Files API no
+protocolo resumable, em blocos de UPLOAD_CHUNK_MB: uma queda no meio do
+envio retoma do último byte confirmado pelo servidor em vez de recomeçar.
+
+A parte inline leva os bytes crus do PDF, lidos uma vez do disco; a própria
+biblioteca cliente os codifica ao serializar, sem uma cópia base64 33% maior
+mantida pelo processo. Como só arquivos até INLINE_MAX_MB seguem inline, essa
+cópia em memória é limitada.
+"""
+
+import mmap
+import os
+
+import requests
+
+from equalprop.config import INLINE_MAX_MB, MAX_RETRIES, UPLOAD_CHUNK_MB
+
+INLINE = "inline"
+FILES_API = "files_api"
+
+_UPLOAD_URL = "https://generativelanguage.googleapis.com/upload/v1beta/files"
+# O protocolo exige blocos múltiplos de 256 KiB (exceto o último)
+_CHUNK_GRANULARITY = 256 * 1024
+
+
+def choose_transport(size_bytes: int, inline_max_mb: float = INLINE_MAX_MB) -> str:
+    """Devolve INLINE para arquivos pequenos e FILES_API para os demais."""
+    return INLINE if size_bytes <= inline_max_mb * 1024 * 1024 else FILES_API
+
+
+def make_inline_part(path: str, mime_type: str = "application/pdf"):
+    """Monta a parte inline_data com os bytes do arquivo (o Blob exige bytes)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return {"inline_data": {"mime_type": mime_type, "data": data}}
+
+
+def _query_offset(upload_url: str) -> int:
+    """Pergunta ao servidor quantos bytes da sessão resumable já foram recebidos."""
+    r = requests.post(upload_url, headers={"X-Goog-Upload-Command": "query"}, timeout=30)
+    r.raise_for_status()
+    return int(r.headers.get("X-Goog-Upload-Size-Received", "0"))
+
+
+def resumable_upload(path: str, mime_type: str = "application/pdf", chunk_mb: int = UPLOAD_CHUNK_MB,
+                     max_resumes: int = MAX_RETRIES):
+    """Envia o arquivo à Files API em blocos e devolve o handle (get_file do backend).
+
+    Cada bloco é lido do mmap sob demanda. Em erro de rede, a sessão é
+    consultada e o envio continua do deslocamento confirmado, até
+    max_resumes retomadas.
+    """
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY não definida para o upload resumable")
+    size = os.path.getsize(path)
+    chunk_size = max(1, int(chunk_mb * 1024 * 1024) // _CHUNK_GRANULARITY) * _CHUNK_GRANULARITY
+    start = requests.post(
+        _UPLOAD_URL,
+        params={"key": api_key},
+        headers={
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(size),
+            "X-Goog-Upload-Header-Content-Type": mime_type,
+        },
+        json={"file": {"display_name": os.path.basename(path)}},
+        timeout=30,
+    )
+    start.raise_for_status()
+    upload_url = start.headers["X-Goog-Upload-URL"]
+
+    offset, resumes, response = 0, 0, None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        while response is None:
+            end = min(offset + chunk_size, size)
+            command = "upload, finalize" if end >= size else "upload"
+            try:
+                r = requests.post(
+                    upload_url,
+                    headers={"X-Goog-Upload-Command": command, "X-Goog-Upload-Offset": str(offset)},
+                    data=mm[offset:end],
+                    timeout=120,
+                )
+                r.raise_for_status()
+            except requests.RequestException as e:
+                resumes += 1
+                if resumes > max_resumes:
+                    raise
+                offset = _query_offset(upload_url)
+                print(f"[AVISO] Upload de {os.path.basename(path)} interrompido ({e}); "
+                      f"retomando a partir de {offset} de {size} bytes.")
+                continue
+            offset = end
+            if end >= size:
+                response = r
+    name = response.json()["file"]["name"]
+    # Import tardio: o backend importa este módulo
+    from equalprop.backend import get_backend
+
+    return get_backend().get_file(name)
@@ -1,13 +1,9 @@
 ﻿import os
-import json
 import tempfile
+import time
 import streamlit as st
-import csv
-from equalprop.io_utils import sanitize_filename, process_files
-from equalprop.prompts import rfp_prompt, proposta_prompt, padroniza_condicomer_prompt, socio_comum_prompt
-from equalprop.gemini_service import upload_pdfs_to_gemini, process_all_proposals
-from equalprop.captura_socios import get_quadro_societario_for_list
-from equalprop.reports.consolidate import consolidate_reports
+from equalprop.io_utils import sanitize_filename, save_upload
+from equalprop.jobs import CANCELLED, DONE, FINISHED, get_engine
 
 
 
@@ -72,6 +68,11 @@ def _ensure_state():
     st.session_state.setdefault("prop_add_upl_version", 0)
 
 def _reset_all():
+    # Interrompe o job em andamento: chamadas abandonadas, nenhuma nova disparada
+    job_id = st.session_state.get("job_id")
+    if job_id:
+        get_engine().cancel(job_id)
+    st.query_params.pop("job", None)
     for k in list(st.session_state.keys()):
         if k.startswith(("_", "FormSubmitter")):
             continue
@@ -128,6 +129,47 @@ def _join_names(files):
         return "; ".join([f.name for f in files])
     return files.name
 
+def _job_names(job):
+    """Nomes dos arquivos do job (a sessão pode ter sido recriada após reconectar)."""
+    if st.session_state.get("rfp_file") and st.session_state.get("proposal_files"):
+        return _join_names(st.session_state["rfp_file"]), _join_names(st.session_state["proposal_files"])
+    return job.rfp_name, "; ".join(job.proposal_names)
+
+def _submit_job(model, gen_config):
+    """Grava os arquivos enviados num diretório do job e agenda o relatório.
+
+    Cada arquivo vai ao disco em blocos (save_upload), sem cópia inteira em
+    memória; o pipeline usa esse mesmo diretório e não copia os PDFs de novo.
+    """
+    workdir = tempfile.mkdtemp(prefix="equalprop_upload_")
+    rfp = st.session_state["rfp_file"]
+    rfp_path = os.path.join(workdir, sanitize_filename(rfp.name))
+    save_upload(rfp, rfp_path)
+
+    proposal_paths = []
+    for p in st.session_state["proposal_files"]:
+        p_path = os.path.join(workdir, sanitize_filename(p.name))
+        save_upload(p, p_path)
+        proposal_paths.append(p_path)
+
+    job = get_engine().submit(model, gen_config, rfp_path, proposal_paths, workdir=workdir)
+    st.session_state["job_id"] = job.id
+    # O ID na URL permite voltar ao job depois de recarregar a página
+    st.query_params["job"] = job.id
+    return job
+
+def _reattach():
+    """Retoma o job indicado na URL quando a sessão foi recriada."""
+    job_id = st.query_params.get("job")
+    if not job_id or st.session_state.get("job_id") == job_id:
+        return
+    job = get_engine().get(job_id)
+    if job is None:
+        st.query_params.pop("job", None)
+        return
+    st.session_state["job_id"] = job.id
+    st.session_state["stage"] = "running"
+
 def _dangerize(button_label, key, width=True):
     clicked = st.button(button_label, key=key, use_container_width=width)
     st.markdown("""
@@ -145,21 +187,6 @@ def _render_blue_progress(ph, pct: int):
         unsafe_allow_html=True
     )
 
-def _merge_results(acc, part):
-    """Tenta mesclar resultados parciais em um único objeto."""
-    if acc is None:
-        return part
-    try:
-        if isinstance(acc, dict) and isinstance(part, dict):
-            acc.update(part)
-            return acc
-        if isinstance(acc, list) and isinstance(part, list):
-            acc.extend(part)
-            return acc
-    except:
-        pass
-    return part  # fallback simples
-
 
 # =========================
 # --------- MAIN ----------
@@ -167,6 +194,7 @@ def _merge_results(acc, part):
 def main(model, gen_config):
     st.set_page_config(page_title="Equalizador de Propostas", page_icon="??", layout="wide")
     _ensure_state()
+    _reattach()
     _header()
 
     # ---------- TELA 1 (IDLE) ----------
@@ -212,6 +240,7 @@ def main(model, gen_config):
         c1, c2 = st.columns([0.18, 0.18])
         with c1:
             if st.button("Gerar relatório", key="btn_run", use_container_width=True):
+                _submit_job(model, gen_config)
                 st.session_state["stage"] = "running"
                 st.rerun()
         with c2:
@@ -221,9 +250,14 @@ def main(model, gen_config):
 
     # ---------- TELA 3 (RUNNING) ----------
     if st.session_state["stage"] == "running":
+        job = get_engine().get(st.session_state.get("job_id"))
+        if job is None:
+            _reset_all()
+            return
         # Linhas com nomes (cinza)
-        _selected_line_muted("Requisição de compra (um PDF)", _join_names(st.session_state["rfp_file"]))
-        _selected_line_muted("Propostas comerciais (de um a vinte PDFs)", _join_names(st.session_state["proposal_files"]))
+        rfp_name, proposal_names = _job_names(job)
+        _selected_line_muted("Requisição de compra (um PDF)", rfp_name)
+        _selected_line_muted("Propostas comerciais (de um a vinte PDFs)", proposal_names)
 
         # Linha "Aguarde..." + Interromper
         c1, c2 = st.columns([0.7, 0.3], vertical_alignment="center")
@@ -237,200 +271,57 @@ def main(model, gen_config):
         # Placeholders visíveis (linha de status + barra azul)
         status_ph = st.empty()      # linha da tarefa atual
         bar_ph = st.empty()         # barra de progresso AZUL
+        detail_ph = st.empty()      # PDCs associados nas propostas em extração
+
+        # ========= ACOMPANHAMENTO =========
+        # O pipeline roda no motor de jobs (equalprop.jobs); aqui só se desenha o
+        # estado atual e a página é refeita a cada segundo, sem prender a thread do
+        # script. Se a conexão cair, o job continua e a página volta a ele pelo ID.
+        snap = job.snapshot()
+        progress = snap["progress"]
+        if progress["label"]:
+            status_ph.markdown(f'<p class="body-18">{progress["label"]} ({progress["done"]} de {progress["total"]})</p>',
+                               unsafe_allow_html=True)
+        else:
+            status_ph.markdown('<p class="body-18">Processando arquivos...</p>', unsafe_allow_html=True)
+        _render_blue_progress(bar_ph, 5 + int(95 * progress["done"] / max(progress["total"], 1)))
+        if progress["detail"]:
+            detail_ph.markdown(f'<p class="body-18">{progress["detail"]}</p>', unsafe_allow_html=True)
+        else:
+            detail_ph.empty()
+        if snap["status"] not in FINISHED:
+            time.sleep(1)
+            st.rerun()
 
-        # ========= PIPELINE =========
-        try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # 1) Salvar arquivos
-                status_ph.markdown('<p class="body-18">Processando arquivos...</p>', unsafe_allow_html=True)
-                _render_blue_progress(bar_ph, 5)
-
-                rfp = st.session_state["rfp_file"]
-                rfp_paths = []
-                safe_name = sanitize_filename(rfp.name)
-                rfp_path = os.path.join(temp_dir, safe_name)
-                with open(rfp_path, "wb") as f:
-                    f.write(rfp.getvalue())
-                rfp_paths.append(rfp_path)
-
-                proposal_paths = []
-                for p in st.session_state["proposal_files"]:
-                    safe = sanitize_filename(p.name)
-                    p_path = os.path.join(temp_dir, safe)
-                    with open(p_path, "wb") as f:
-                        f.write(p.getvalue())
-                    proposal_paths.append(p_path)
-
-                # 2) Converter p/ PDF
-                status_ph.markdown('<p class="body-18">Convertendo arquivos para PDF...</p>', unsafe_allow_html=True)
-                _render_blue_progress(bar_ph, 15)
-                rfp_pdfs = process_files(rfp_paths, temp_dir)
-                proposal_pdfs = process_files(proposal_paths, temp_dir)
-                if not rfp_pdfs or not proposal_pdfs:
-                    status_ph.markdown('<p class="body-18">Erro: falha ao processar arquivos.</p>', unsafe_allow_html=True)
-                    _render_blue_progress(bar_ph, 0)
-                    return
-
-                # 3) Upload Gemini
-                status_ph.markdown('<p class="body-18">Subindo arquivos para a Gemini...</p>', unsafe_allow_html=True)
-                _render_blue_progress(bar_ph, 20)
-                rfp_gemini_files = upload_pdfs_to_gemini(rfp_pdfs)
-                proposal_gemini_files = upload_pdfs_to_gemini(proposal_pdfs)
-                if not rfp_gemini_files or not proposal_gemini_files:
-                    status_ph.markdown('<p class="body-18">Erro: falha no upload para a Gemini.</p>', unsafe_allow_html=True)
-                    _render_blue_progress(bar_ph, 0)
-                    return
-
-                # 4) Extrair PDCs e Cabeçalho da RFP
-                status_ph.markdown('<p class="body-18">Analisando a requisição de compra...</p>', unsafe_allow_html=True)
-                _render_blue_progress(bar_ph, 30)
-
-                response = model.generate_content(
-                    contents=[rfp_prompt, rfp_gemini_files[0]],
-                    generation_config=gen_config
-                )
+        if snap["status"] == DONE:
+            result = job.result
+            st.session_state["proposals_order"] = result["proposals_order"]
+            st.session_state["cnpjs_by_id"] = result["cnpjs_by_id"]
+            st.session_state["report_xlsx"] = result["report_xlsx"]
 
-                # Processa a resposta mantendo compatibilidade
-                rfp_json = json.loads(response.text)
-
-                # 5) Processar propostas **uma por vez** mostrando o nome do PDF
-                n = len(proposal_pdfs)
-                aggregated_results = None
-                for i, (gfile, pdf_path) in enumerate(zip(proposal_gemini_files, proposal_pdfs), start=1):
-                    fname = os.path.basename(pdf_path)
-                    status_ph.markdown(
-                        f'<p class="body-18">Processando proposta: <span class="value">{fname}</span></p>',
-                        unsafe_allow_html=True
-                    )
-                    # Progresso dentro do intervalo 60?90
-                    pct = 40 + int(30 * (i-1) / max(n, 1))
-                    _render_blue_progress(bar_ph, pct)
-
-                    partial = process_all_proposals(
-                        model,
-                        rfp_json,
-                        [gfile],          # uma proposta por vez
-                        [pdf_path],
-                        proposta_prompt,
-                        gen_config
-                    )
-                    aggregated_results = _merge_results(aggregated_results, partial)
-
-                propostas_json = aggregated_results
-
-                # 6 capturar quadro societario
-                # 6.1 Registrar ordem dos IDs das propostas e mapear CNPJ por ID
-                ordered_ids = list(propostas_json.keys()) if isinstance(propostas_json, dict) else []
-
-                def _cnpj14(x):
-                    if not x:
-                        return None
-                    s = ''.join(ch for ch in str(x) if ch.isdigit())
-                    return s if len(s) == 14 else None
-
-                cnpjs_by_id = {}
-                if isinstance(propostas_json, dict):
-                    for pid, value in propostas_json.items():
-                        try:
-                            data = json.loads(value) if isinstance(value, str) else value
-                            header = (data or {}).get('proposta', {}).get('header', {}) or {}
-                            cnpjs_by_id[pid] = _cnpj14(header.get('cnpj'))
-                        except Exception:
-                            cnpjs_by_id[pid] = None
-
-                st.session_state["proposals_order"] = ordered_ids
-                st.session_state["cnpjs_by_id"] = cnpjs_by_id
-
-                # 6.2 scraping do portal da transparencia
-                status_ph.markdown('<p class="body-18">Capturando quadros societários...</p>', unsafe_allow_html=True)
-                _render_blue_progress(bar_ph, 85)
-
-                quadros_societarios = {}
-                try:
-                    quadros_societarios = get_quadro_societario_for_list(cnpjs_by_id)
-                except Exception as e:
-                    print(f"Erro no scraping (6.2): {e}")
-                    quadros_societarios = {}
-
-                # 6.3 Checar se há socios em comum
-                status_ph.markdown('<p class="body-18">Checando se há socios em comum...</p>', unsafe_allow_html=True)
-                _render_blue_progress(bar_ph, 88)
-
-                socio_comum = {}
-                try:
-                    socio_response = model.generate_content(
-                        contents=[socio_comum_prompt, json.dumps(quadros_societarios, ensure_ascii=False)],
-                        generation_config=gen_config
-                    )
-
-                    if socio_response and hasattr(socio_response, "text") and socio_response.text:
-                        socio_comum = json.loads(socio_response.text)
-                    else:
-                        raise ValueError("Resposta vazia ou inválida do modelo")
-
-                except json.JSONDecodeError as e:
-                    print(f"Erro ao decodificar JSON (6.3): {e}")
-                    print(f"Conteúdo recebido: {socio_response.text if socio_response else 'Nenhuma resposta'}")
-                    socio_comum = {}
-                except Exception as e:
-                    print(f"Erro na verificação de socios em comum (6.3): {e}")
-                    socio_comum = {}
-
-                # 7) Padronizar condições comerciais
-                status_ph.markdown('<p class="body-18">Padronizando condições comerciais...</p>', unsafe_allow_html=True)
-                _render_blue_progress(bar_ph, 90)
-
-                try:
-                    response = model.generate_content(
-                        contents=[padroniza_condicomer_prompt, json.dumps(propostas_json, ensure_ascii=False)],
-                        generation_config=gen_config
-                    )
-
-                    # Verifica se a resposta foi bem-sucedida e tem conteúdo
-                    if response and hasattr(response, 'text') and response.text:
-                        condicomer_padronizadas = json.loads(response.text)
-                    else:
-                        raise ValueError("Resposta vazia ou inválida do modelo")
-                        
-                except json.JSONDecodeError as e:
-                    print(f"Erro ao decodificar JSON: {e}")
-                    print(f"Conteúdo recebido: {response.text if response else 'Nenhuma resposta'}")
-                    condicomer_padronizadas = {}  # Ou algum valor padrão
-                except Exception as e:
-                    print(f"Erro inesperado: {e}")
-                    condicomer_padronizadas = {}
-
-
-                # 8) Gerar relatório final (EXCEL apenas)
-                status_ph.markdown('<p class="body-18">Gerando relatório final (Excel)...</p>', unsafe_allow_html=True)
-                _render_blue_progress(bar_ph, 92)
-                # Proteger o diretório de trabalho do Streamlit contra mudanças internas
-                cwd_before = os.getcwd()
-                try:
-                    _, relatorio_final_xlsx = consolidate_reports(rfp_json, propostas_json, condicomer_padronizadas, quadros_societarios, socio_comum)
-                finally:
-                    try:
-                        os.chdir(cwd_before)
-                    except Exception:
-                        pass
-
-                st.session_state["report_xlsx"] = relatorio_final_xlsx
-
-                status_ph.markdown('<p class="body-18">Concluído.</p>', unsafe_allow_html=True)
-                _render_blue_progress(bar_ph, 100)
-
-                st.session_state["stage"] = "done"
-                st.rerun()
+            status_ph.markdown('<p class="body-18">Concluído.</p>', unsafe_allow_html=True)
+            _render_blue_progress(bar_ph, 100)
 
-        except Exception as e:
-            status_ph.markdown(f'<p class="body-18">Erro: {e}</p>', unsafe_allow_html=True)
+            st.session_state["stage"] = "done"
+            st.rerun()
+        elif snap["status"] == CANCELLED:
+            status_ph.markdown(f'<p class="body-18">Execução interrompida: {snap["error"]}</p>', unsafe_allow_html=True)
+            _render_blue_progress(bar_ph, 0)
+        else:
+            status_ph.markdown(f'<p class="body-18">Erro: {snap["error"]}</p>', unsafe_allow_html=True)
             _render_blue_progress(bar_ph, 0)
         return
 
     # ---------- TELA 4 (DONE) ----------
     if st.session_state["stage"] == "done":
-        _selected_line_muted("Requisição de compra (um PDF)", _join_names(st.session_state["rfp_file"]))
-        _selected_line_muted("Propostas comerciais (de um a vinte PDFs)", _join_names(st.session_state["proposal_files"]))
+        job = get_engine().get(st.session_state.get("job_id"))
+        if job is not None:
+            rfp_name, proposal_names = _job_names(job)
+        else:
+            rfp_name = _join_names(st.session_state["rfp_file"])
+            proposal_names = _join_names(st.session_state["proposal_files"])
+        _selected_line_muted("Requisição de compra (um PDF)", rfp_name)
+        _selected_line_muted("Propostas comerciais (de um a vinte PDFs)", proposal_names)
 
         xlsx_path = st.session_state.get("report_xlsx")
         if not xlsx_path or not os.path.exists(xlsx_path):
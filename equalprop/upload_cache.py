@@ -0,0 +1,194 @@
+"""
+Cache persistente de uploads para a Files API do Gemini.
+
+Cada PDF é identificado pelo SHA-256 do seu conteúdo. O índice (SQLite em
+CACHE_DIR/uploads.sqlite, compartilhado pelos processos de trabalho do
+serviço) guarda o nome remoto do arquivo e o instante em que ele expira na
+Files API, para que reexecuções com os mesmos documentos não reenviem nenhum
+byte. Entradas vencidas ou excedentes são removidas do índice e o arquivo
+remoto correspondente é apagado.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from equalprop.backend import get_backend
+from equalprop.config import CACHE_DIR, UPLOAD_CACHE_TTL_HOURS, UPLOAD_CACHE_MAX_ENTRIES
+
+_DB_PATH = os.path.join(CACHE_DIR, "uploads.sqlite")
+_COLUMNS = ("digest", "transport", "name", "uri", "created_at", "expires_at")
+# Margem mínima de validade para reaproveitar um arquivo remoto (uma chamada longa cabe nela)
+_MIN_REMAINING_S = 15 * 60
+_lock = threading.Lock()
+# SHA-256 já conhecidos por arquivo (dispositivo, inode, tamanho, mtime): o digest
+# calculado ao gravar o upload (io_utils.save_upload) evita reler o PDF aqui
+_known_digests: Dict[tuple, str] = {}
+_MAX_KNOWN_DIGESTS = 4096
+
+
+def _file_key(path: str) -> tuple:
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def remember_sha256(path: str, digest: str) -> None:
+    """Registra o digest de um arquivo recém-gravado para file_sha256 não relê-lo."""
+    key = _file_key(path)
+    with _lock:
+        if len(_known_digests) >= _MAX_KNOWN_DIGESTS:
+            _known_digests.pop(next(iter(_known_digests)))
+        _known_digests[key] = digest
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Calcula o SHA-256 do arquivo lendo em blocos (uma vez por arquivo)."""
+    key = _file_key(path)
+    with _lock:
+        known = _known_digests.get(key)
+    if known is not None:
+        return known
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    remember_sha256(path, h.hexdigest())
+    return h.hexdigest()
+
+
+@contextmanager
+def _connect():
+    """Abre o banco, executa a transação e fecha a conexão ao final."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                " digest TEXT PRIMARY KEY, transport TEXT NOT NULL, name TEXT, uri TEXT,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS uploads_name ON uploads (name)")
+            yield conn
+    finally:
+        conn.close()
+
+
+def _entry(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    return dict(row) if row is not None else None
+
+
+def _expires_at(uploaded_file) -> float:
+    """Instante (epoch) em que o arquivo remoto deixa de existir."""
+    ttl_limit = time.time() + UPLOAD_CACHE_TTL_HOURS * 3600
+    expiration = getattr(uploaded_file, "expiration_time", None)
+    try:
+        if expiration is not None:
+            return min(expiration.timestamp(), ttl_limit)
+    except Exception:
+        pass
+    return ttl_limit
+
+
+def _delete_remote(entry: Dict[str, Any]) -> None:
+    name = entry.get("name")
+    if not name:
+        return
+    try:
+        get_backend().delete_file(name)
+        print(f"[INFO] Arquivo remoto {name} removido do Gemini.")
+    except Exception as e:
+        # Arquivo já expirado ou removido: nada a fazer
+        print(f"[AVISO] Não foi possível remover {name}: {e}")
+
+
+def evict(digest: str) -> None:
+    """Remove a entrada do índice e apaga o arquivo remoto correspondente."""
+    with _connect() as conn:
+        entry = _entry(conn.execute("SELECT * FROM uploads WHERE digest = ?", (digest,)).fetchone())
+        # Outro processo pode ter removido a mesma entrada: só quem a apagou remove o arquivo remoto
+        if entry is None or conn.execute("DELETE FROM uploads WHERE digest = ?", (digest,)).rowcount == 0:
+            return
+    _delete_remote(entry)
+
+
+def purge_expired() -> int:
+    """Descarta entradas vencidas e, se preciso, as mais antigas além do limite."""
+    with _connect() as conn:
+        removed: List[Dict[str, Any]] = [_entry(r) for r in conn.execute(
+            "SELECT * FROM uploads WHERE expires_at < ?", (time.time() + _MIN_REMAINING_S,)).fetchall()]
+        stale = {e["digest"] for e in removed}
+        fresh = conn.execute("SELECT * FROM uploads ORDER BY created_at").fetchall()
+        fresh = [_entry(r) for r in fresh if r["digest"] not in stale]
+        removed.extend(fresh[:max(0, len(fresh) - UPLOAD_CACHE_MAX_ENTRIES)])
+        removed = [e for e in removed
+                   if conn.execute("DELETE FROM uploads WHERE digest = ?", (e["digest"],)).rowcount > 0]
+    for entry in removed:
+        _delete_remote(entry)
+    return len(removed)
+
+
+def lookup(digest: str):
+    """Devolve o handle remoto válido para o conteúdo, ou None.
+
+    Retorna também a marca "inline" quando o backend recusou uploads deste
+    arquivo anteriormente, para que o chamador vá direto ao inline_data.
+    """
+    with _connect() as conn:
+        entry = _entry(conn.execute("SELECT * FROM uploads WHERE digest = ?", (digest,)).fetchone())
+    if not entry:
+        return None
+    if entry.get("transport") == "inline":
+        return "inline"
+    if entry.get("expires_at", 0) - time.time() < _MIN_REMAINING_S:
+        evict(digest)
+        return None
+    try:
+        remote = get_backend().get_file(entry["name"])
+    except Exception as e:
+        print(f"[AVISO] Arquivo em cache {entry.get('name')} indisponível: {e}")
+        evict(digest)
+        return None
+    state = getattr(getattr(remote, "state", None), "name", "ACTIVE")
+    if state != "ACTIVE":
+        evict(digest)
+        return None
+    return remote
+
+
+def store(digest: str, uploaded_file=None, inline: bool = False) -> None:
+    """Registra o upload (ou a preferência por inline_data) para o conteúdo."""
+    now = time.time()
+    if inline:
+        entry = {"transport": "inline", "name": None, "uri": None, "created_at": now,
+                 "expires_at": now + UPLOAD_CACHE_TTL_HOURS * 3600}
+    else:
+        entry = {
+            "transport": "files",
+            "name": getattr(uploaded_file, "name", None),
+            "uri": getattr(uploaded_file, "uri", None),
+            "created_at": now,
+            "expires_at": _expires_at(uploaded_file),
+        }
+        if not entry["name"]:
+            return
+    entry["digest"] = digest
+    with _connect() as conn:
+        conn.execute(f"INSERT OR REPLACE INTO uploads ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                     tuple(entry[c] for c in _COLUMNS))
+    purge_expired()
+
+
+def digest_for(uploaded_file) -> Optional[str]:
+    """Devolve o SHA-256 do conteúdo associado a um handle remoto, se conhecido."""
+    name = getattr(uploaded_file, "name", None)
+    if not name:
+        return None
+    with _connect() as conn:
+        row = conn.execute("SELECT digest FROM uploads WHERE name = ?", (name,)).fetchone()
+    return row["digest"] if row is not None else None
@@ -0,0 +1,130 @@
+"""
+Contabilidade de uso do modelo por execução.
+
+Cada chamada registra tokens (prompt, saída e raciocínio) lidos de
+usage_metadata, tempo de parede, status de cache e erros num RunLedger.
+O resumo pode ser gravado como JSON ao lado do relatório. Um orçamento
+opcional de tokens impede o disparo de novas chamadas quando a próxima,
+pela média observada até aqui, o ultrapassaria.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from equalprop.config import MODEL_PRICES_USD_PER_MTOK
+
+
+class BudgetExceeded(RuntimeError):
+    """Levantada quando uma nova chamada estouraria o orçamento de tokens da execução."""
+
+
+def _usage_counts(usage_metadata) -> Dict[str, int]:
+    def _get(name):
+        try:
+            return int(getattr(usage_metadata, name, 0) or 0)
+        except (TypeError, ValueError):
+            return 0
+    return {
+        "prompt_tokens": _get("prompt_token_count"),
+        "output_tokens": _get("candidates_token_count"),
+        "thinking_tokens": _get("thoughts_token_count"),
+        "cached_tokens": _get("cached_content_token_count"),
+        "total_tokens": _get("total_token_count"),
+    }
+
+
+def _price_for(model_name: str):
+    name = (model_name or "").split("/")[-1]
+    # Procura o prefixo mais específico (ex.: gemini-2.5-flash-lite antes de gemini-2.5-flash)
+    for prefix in sorted(MODEL_PRICES_USD_PER_MTOK, key=len, reverse=True):
+        if name.startswith(prefix):
+            return MODEL_PRICES_USD_PER_MTOK[prefix]
+    return None
+
+
+class RunLedger:
+    """Registro das chamadas ao modelo de uma execução do pipeline."""
+
+    def __init__(self, token_budget: Optional[int] = None):
+        self.token_budget = token_budget or None
+        self.started_at = time.time()
+        self._calls: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _billed_calls(self):
+        return [c for c in self._calls if not c["cached"] and not c["error"]]
+
+    def tokens_used(self) -> int:
+        with self._lock:
+            return sum(c["total_tokens"] for c in self._calls)
+
+    def check_budget(self, stage: str = "") -> None:
+        """Levanta BudgetExceeded se a próxima chamada provavelmente estourar o orçamento."""
+        if not self.token_budget:
+            return
+        with self._lock:
+            used = sum(c["total_tokens"] for c in self._calls)
+            billed = self._billed_calls()
+            estimate = used / len(billed) if billed else 0
+        if used + estimate > self.token_budget:
+            raise BudgetExceeded(
+                f"Orçamento de {self.token_budget} tokens atingido ({used} usados); "
+                f"chamada '{stage}' não disparada."
+            )
+
+    def record(self, stage: str, model_name: str, usage_metadata=None, elapsed_s: float = 0.0,
+               cached: bool = False, error: Optional[str] = None, **extra) -> None:
+        entry = {
+            "stage": stage,
+            "model": model_name,
+            "elapsed_s": round(elapsed_s, 3),
+            "cached": cached,
+            "error": error,
+        }
+        entry.update(_usage_counts(usage_metadata))
+        entry.update(extra)
+        with self._lock:
+            self._calls.append(entry)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = [dict(c) for c in self._calls]
+        totals = {"calls": 0, "cache_hits": 0, "errors": 0, "elapsed_s": 0.0,
+                  "prompt_tokens": 0, "output_tokens": 0, "thinking_tokens": 0,
+                  "cached_tokens": 0, "total_tokens": 0, "estimated_cost_usd": 0.0}
+        stages: Dict[str, Dict[str, Any]] = {}
+        for c in calls:
+            per_stage = stages.setdefault(c["stage"], {"calls": 0, "errors": 0, "cache_hits": 0, "elapsed_s": 0.0,
+                                                       "total_tokens": 0, "estimated_cost_usd": 0.0})
+            cost = 0.0
+            price = _price_for(c["model"])
+            if price and not c["cached"]:
+                cost = (c["prompt_tokens"] * price["input"]
+                        + (c["output_tokens"] + c["thinking_tokens"]) * price["output"]) / 1_000_000
+            for bucket in (totals, per_stage):
+                bucket["calls"] += 1
+                bucket["cache_hits"] += int(c["cached"])
+                bucket["elapsed_s"] += c["elapsed_s"]
+                bucket["total_tokens"] += c["total_tokens"]
+                bucket["estimated_cost_usd"] += cost
+            per_stage["errors"] += int(bool(c["error"]))
+            totals["errors"] += int(bool(c["error"]))
+            for k in ("prompt_tokens", "output_tokens", "thinking_tokens", "cached_tokens"):
+                totals[k] += c[k]
+        for bucket in [totals] + list(stages.values()):
+            bucket["elapsed_s"] = round(bucket["elapsed_s"], 3)
+            bucket["estimated_cost_usd"] = round(bucket["estimated_cost_usd"], 6)
+        return {
+            "wall_time_s": round(time.time() - self.started_at, 3),
+            "token_budget": self.token_budget,
+            "totals": totals,
+            "stages": stages,
+            "calls": calls,
+        }
+
+    def write_json(self, path: str) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        return path
@@ -0,0 +1,160 @@
+"""
+Configuração comum dos testes.
+
+Caches, fila e fitas ficam num diretório temporário, o backend é o replay
+(sem rede nem chave de API) e o cache de respostas fica desligado, como
+pede o replay. As variáveis precisam estar definidas antes do primeiro
+import de equalprop.config.
+
+O modelo roteirizado responde a uma RFP com um PDC e a duas propostas
+(identificadas por um marcador no texto do PDF); gravado por trás do
+RecordingModel, ele produz fitas pequenas para o ReplayBackend.
+"""
+
+import json
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="equalprop_testes_")
+os.environ["EQUALPROP_CACHE_DIR"] = os.path.join(_TMP, "cache")
+os.environ["EQUALPROP_SERVICE_DIR"] = os.path.join(_TMP, "servico")
+os.environ["EQUALPROP_BACKEND"] = "replay"
+os.environ["EQUALPROP_RESPONSE_CACHE"] = "0"
+os.environ["EQUALPROP_REPLAY_LATENCY_SCALE"] = "0"
+os.environ["EQUALPROP_HEDGE"] = "0"
+
+import pytest  # noqa: E402
+
+from equalprop import pipeline  # noqa: E402
+from equalprop.backend import Cassette, ReplayBackend, set_backend  # noqa: E402
+from equalprop.config import stage_settings  # noqa: E402
+from equalprop.prompts import classifica_condicomer_prompt, rfp_prompt  # noqa: E402
+
+MODEL_NAME = stage_settings("proposta")["model"]
+
+RFP_JSON = {"rfp_json": {
+    "header": {"Obra": "Edifício Sul", "Solicitante": "Ana Costa"},
+    "produtos_demandados": [
+        {"codigo": "PDC1", "especificacoes_tecnicas": {"bitola": {"valor": "10 mm", "unidade": None}},
+         "quantidade_demandada": {"valor": 100, "unidade": "m"}},
+    ],
+}}
+
+# Marcador no texto do PDF de cada proposta -> (CNPJ, empresa, preço)
+PROPOSALS = {
+    "FORNECEDOR ALFA": ("11.222.333/0001-81", "Alfa Aços Ltda", 12.5),
+    "FORNECEDOR BETA": ("44.555.666/0001-99", "Beta Metais S.A.", 11.9),
+}
+QSA = {
+    "11222333000181": ["Carlos Pereira Lima, Sócio-Administrador", "Maria de Sá, Sócia"],
+    "44555666000199": ["Carlos Lima, Diretor", "Maria Silva, Sócia"],
+}
+
+
+def _proposal_json(cnpj, empresa, preco):
+    return {"proposta": {
+        "header": {"empresa": empresa, "cnpj": cnpj, "representante": "null", "tel": "null", "cel": "null",
+                   "email": "null"},
+        "pops": [{"codigo_pdc": "PDC1", "quantidade": 100, "unidade": "m", "preco_unitario": preco,
+                  "preco_unitario_ajustado": preco, "semelhanca": "0.9", "descricao": "Vergalhão CA-50 10 mm",
+                  "num_ordem": 1, "reasoning": "bitola e quantidade iguais"}],
+        "condicoes_comerciais": [{"chave": "Frete", "valor": "CIF"},
+                                 {"chave": "Seguro da carga", "valor": "incluso"}],
+    }}
+
+
+def report_answer(contents):
+    """Resposta roteirizada de cada etapa do relatório, pelo prompt enviado."""
+    texts = [c for c in contents if isinstance(c, str)]
+    if rfp_prompt in texts:
+        return RFP_JSON
+    if classifica_condicomer_prompt in texts:
+        return {"mapeamento": {"Seguro da carga": "Seguro"}}
+    joined = "\n".join(texts)
+    for marker, fields in PROPOSALS.items():
+        if marker in joined:
+            return _proposal_json(*fields)
+    raise AssertionError("chamada inesperada ao modelo")
+
+
+class ScriptedResponse:
+    """Resposta no formato do SDK (text, usage_metadata e iteração em pedaços)."""
+
+    def __init__(self, text, chunk_size=40):
+        self.text = text
+        self.usage_metadata = None
+        self._chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+
+    def __iter__(self):
+        for piece in self._chunks:
+            yield type("Chunk", (), {"text": piece})()
+
+
+class ScriptedModel:
+    """Modelo que responde conforme o prompt: answer(contents) -> objeto JSON."""
+
+    def __init__(self, answer=report_answer, model_name=MODEL_NAME):
+        self.answer = answer
+        self.model_name = model_name
+        self.calls = []
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls.append(list(contents))
+        return ScriptedResponse(json.dumps(self.answer(contents), ensure_ascii=False))
+
+
+@pytest.fixture
+def scripted_model():
+    return ScriptedModel
+
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path):
+    """ReplayBackend com fitas em tmp_path/fitas e QSA fixo no lugar da BrasilAPI."""
+    backend = ReplayBackend(Cassette(str(tmp_path / "fitas")), latency_scale=0, failure_rate=0)
+    set_backend(backend)
+
+    def _qsa(ids_cnpjs, cancel=None):
+        return {pid: QSA.get(cnpj) for pid, cnpj in ids_cnpjs.items()}
+
+    monkeypatch.setattr(pipeline, "get_quadro_societario_for_list", _qsa)
+    yield backend
+    set_backend(None)
+
+
+def write_pdf(path, lines):
+    """PDF de uma página com as linhas dadas (camada de texto verdadeira)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    c = canvas.Canvas(path, pagesize=A4)
+    y = 800
+    for line in lines:
+        c.drawString(40, y, line)
+        y -= 16
+    c.save()
+    return path
+
+
+def _document_lines(title):
+    return [title] + [f"Item {i}: vergalhao CA-50 10 mm, 100 m, entrega em obra, frete CIF." for i in range(1, 13)]
+
+
+def write_documents(directory, proposals_dir=None):
+    """Grava rfp.pdf e um PDF por proposta roteirizada; devolve (rfp, [propostas])."""
+    proposals_dir = proposals_dir or directory
+    rfp = write_pdf(os.path.join(directory, "rfp.pdf"), _document_lines("REQUISICAO DE COMPRA PDC1"))
+    proposals = [write_pdf(os.path.join(proposals_dir, f"proposta_{i}.pdf"), _document_lines(marker))
+                 for i, marker in enumerate(PROPOSALS, start=1)]
+    return rfp, proposals
+
+
+@pytest.fixture
+def make_pdf():
+    return write_pdf
+
+
+@pytest.fixture
+def make_documents():
+    return write_documents
@@ -0,0 +1,85 @@
+"""Lote sobre uma árvore temporária de pastas de RFP, com o modelo servido por fitas."""
+
+import json
+import os
+
+import pytest
+
+from equalprop import __main__ as cli
+from equalprop import condicomer_canon
+from equalprop.backend import RecordingModel
+from equalprop.batch import REPORT_NAME, _out_dir_for, find_rfp_folders, plan_batch, run_batch
+from equalprop.config import build_gen_config
+
+
+@pytest.fixture
+def tree(tmp_path, make_documents, make_pdf):
+    root = tmp_path / "rfps"
+    make_documents(str(root / "obra_a"), str(root / "obra_a" / "propostas"))
+    make_documents(str(root / "clientes" / "obra b"), str(root / "clientes" / "obra b" / "Propostas"))
+    # Sem propostas ou sem a pasta propostas/: ignoradas
+    make_pdf(str(root / "vazia" / "rfp.pdf"), ["RFP"])
+    (root / "vazia" / "propostas").mkdir()
+    make_pdf(str(root / "sem_pasta" / "rfp.pdf"), ["RFP"])
+    return root
+
+
+@pytest.fixture(autouse=True)
+def _learned_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(condicomer_canon, "_DB_PATH", str(tmp_path / "sinonimos.sqlite"))
+
+
+def test_find_rfp_folders(tree):
+    found = find_rfp_folders(str(tree))
+    assert [os.path.relpath(folder, tree) for folder, _, _ in found] == [os.path.join("clientes", "obra b"), "obra_a"]
+    folder, rfp, proposals = found[1]
+    assert rfp == os.path.join(folder, "rfp.pdf")
+    assert [os.path.basename(p) for p in proposals] == ["proposta_1.pdf", "proposta_2.pdf"]
+
+
+def test_out_dir_for(tree, tmp_path):
+    out = str(tmp_path / "saida")
+    assert _out_dir_for(str(tree), str(tree / "clientes" / "obra b"), out) == os.path.join(out, "clientes__obra b")
+    assert _out_dir_for(str(tree), str(tree), out) == os.path.join(out, "rfps")
+
+
+def test_batch_with_replay_and_skip_done(tree, tmp_path, offline, scripted_model):
+    out = str(tmp_path / "saida")
+    scripted = scripted_model()
+    # Primeira passada grava as fitas; as seguintes usam só o replay
+    summary = run_batch(RecordingModel(scripted, offline.cassette), build_gen_config(), str(tree), out, max_rfps=2)
+    assert (summary["rfps"], summary["concluidas"], summary["falhas"]) == (2, 2, 0)
+    calls = len(scripted.calls)
+    for item in summary["itens"]:
+        assert os.path.exists(os.path.join(item["saida"], REPORT_NAME))
+
+    replay = offline.model(scripted.model_name)
+    summary = run_batch(replay, build_gen_config(), str(tree), out, skip_done=True)
+    assert summary["rfps"] == 0 and len(summary["puladas"]) == 2
+
+    os.remove(os.path.join(out, "obra_a", REPORT_NAME))
+    summary = run_batch(replay, build_gen_config(), str(tree), out, skip_done=True)
+    assert [os.path.basename(i["pasta"]) for i in summary["itens"]] == ["obra_a"]
+    assert summary["concluidas"] == 1 and summary["puladas"] == [str(tree / "clientes" / "obra b")]
+    assert os.path.exists(os.path.join(out, "obra_a", REPORT_NAME))
+    assert len(scripted.calls) == calls
+    with open(os.path.join(out, "resumo_lote.json"), encoding="utf-8") as f:
+        assert json.load(f)["concluidas"] == 1
+
+
+def test_dry_run_lists_without_running(tree, tmp_path, capsys, monkeypatch):
+    out = tmp_path / "saida"
+    (out / "obra_a").mkdir(parents=True)
+    (out / "obra_a" / REPORT_NAME).write_bytes(b"")
+    pending, skipped = plan_batch(str(tree), str(out), skip_done=True)
+    assert [os.path.basename(p[0]) for p in pending] == ["obra b"] and skipped == [str(tree / "obra_a")]
+
+    def _no_model():
+        raise AssertionError("a simulação não configura o modelo")
+
+    monkeypatch.setattr("equalprop.config.setup_gemini_client", _no_model)
+    assert cli.main(["batch", str(tree), "--saida", str(out), "--pular-concluidos", "--simular"]) == 0
+    printed = capsys.readouterr().out
+    assert "1 RFP(s) a processar, 1 pulada(s)" in printed
+    assert f"2 proposta(s) -> {out / 'clientes__obra b'}" in printed
+    assert sorted(os.listdir(out)) == ["obra_a"]
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from equalprop import condicomer_canon
+from equalprop.condicomer_canon import KeyCanonicalizer, canonicalize_conditions, learn, pivot_conditions
+
+
+@pytest.fixture(autouse=True)
+def _learned_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(condicomer_canon, "_DB_PATH", str(tmp_path / "sinonimos.sqlite"))
+
+
+def _proposal(*pairs):
+    return json.dumps({"proposta": {"condicoes_comerciais": [{"chave": k, "valor": v} for k, v in pairs]}})
+
+
+def test_exact_and_token_matches():
+    canon = KeyCanonicalizer()
+    assert canon.canonical("Cond. Pagto") == "Condições de pagamento"
+    assert canon.canonical("Prazo de pagamento 28 DDL") == "Condições de pagamento"
+    assert canon.canonical("Seguro da carga") is None
+
+
+def test_learned_names_are_persisted():
+    assert KeyCanonicalizer().canonical("Seguro da carga") is None
+    learn({"Seguro da carga": "Seguro"})
+    assert KeyCanonicalizer().canonical("seguro-da-carga") == "Seguro"
+
+
+def test_canonicalize_and_pivot():
+    propostas = {
+        "a.pdf": _proposal(("Frete", "CIF"), ("Validade", "30 dias"), ("chave", None)),
+        "b.pdf": _proposal(("Tipo de frete", "FOB"), ("Seguro da carga", "incluso"), ("null", "x")),
+    }
+    mapping, leftovers = canonicalize_conditions(propostas)
+    assert mapping == {"Frete": "Frete", "Validade": "Validade da proposta", "Tipo de frete": "Frete"}
+    assert leftovers == ["chave", "Seguro da carga"]
+    rows = {r["chave"]: r for r in pivot_conditions(propostas, mapping)["condicoes_comerciais"]}
+    assert rows["Frete"] == {"chave": "Frete", "proposta_1": "CIF", "proposta_2": "FOB"}
+    assert rows["Validade da proposta"]["proposta_2"] is None
+    assert rows["Seguro da carga"]["proposta_2"] == "incluso"
+
+
+def test_known_names_include_learned_ones():
+    assert "Seguro" not in condicomer_canon.known_canonical_names()
+    learn({"Seguro da carga": "Seguro"})
+    assert "Seguro" in condicomer_canon.known_canonical_names()
+    assert "Frete" in condicomer_canon.known_canonical_names()
@@ -0,0 +1,34 @@
+"""Configurações de geração por etapa aceitas pelo SDK fixado."""
+
+import google.generativeai as genai
+import pytest
+
+from equalprop import config
+
+
+def _prepare(gen_config):
+    model = genai.GenerativeModel(config.DEFAULT_MODEL)
+    return model._prepare_request(contents="ok", generation_config=gen_config, safety_settings=None,
+                                  tools=None, tool_config=None)
+
+
+@pytest.mark.parametrize("preset", sorted(config.STAGE_PRESETS))
+@pytest.mark.parametrize("stage", ["rfp", "proposta", "proposta_hedge", "condicomer", "rfp_reparo"])
+def test_stage_configs_pass_through_the_sdk(monkeypatch, preset, stage):
+    monkeypatch.setattr(config, "MODEL_PRESET", preset)
+    request = _prepare(config.build_gen_config(stage=stage))
+    assert request.generation_config.response_mime_type == "application/json"
+    expected = config.stage_settings(stage)["max_output_tokens"]
+    assert request.generation_config.max_output_tokens == (expected or 0)
+
+
+def test_thinking_override_is_dropped_on_legacy_sdk(monkeypatch, capsys):
+    monkeypatch.setenv("EQUALPROP_THINKING_RFP", "0")
+    monkeypatch.setattr(config, "_thinking_warned", False)
+    gen_config = config.build_gen_config(stage="rfp")
+    if config.SDK_SUPPORTS_THINKING:
+        assert config.gen_config_value(gen_config, "thinking_config") == {"thinking_budget": 0}
+    else:
+        assert config.gen_config_value(gen_config, "thinking_config") is None
+        assert "thinking_budget=0 ignorado" in capsys.readouterr().out
+    _prepare(gen_config)
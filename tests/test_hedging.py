@@ -0,0 +1,54 @@
+"""Hedging das chamadas de proposta: prazo e latência contados desde o envio."""
+
+import threading
+import time
+
+from equalprop.hedging import Hedger, LatencyHistory
+
+
+def _hedger(tmp_path, delay_s):
+    return Hedger(max_extra=1, history=LatencyHistory(str(tmp_path / "latencias.sqlite")), default_delay_s=delay_s)
+
+
+def test_queue_wait_does_not_fire_a_copy_nor_enter_the_history(tmp_path):
+    hedger = _hedger(tmp_path, delay_s=0.2)
+
+    def attempt(cancel, hedge, sent):
+        time.sleep(0.4)  # espera pela vaga do limitador
+        sent()
+        time.sleep(0.05)
+        return "ok"
+
+    assert hedger.call(attempt, 1000) == "ok"
+    assert hedger.stats()["fired"] == 0
+    [(latency, censored)] = hedger.history._samples["9"]
+    assert latency < 0.3 and not censored
+
+
+def test_slow_service_fires_a_copy_and_censors_the_loser(tmp_path):
+    hedger = _hedger(tmp_path, delay_s=0.1)
+    release = threading.Event()
+
+    def attempt(cancel, hedge, sent):
+        sent()
+        if hedge:
+            return "copia"
+        cancel.wait(2)
+        release.set()
+        raise RuntimeError("cancelada")
+
+    assert hedger.call(attempt, 1000) == "copia"
+    assert hedger.stats()["won"] == 1
+    assert sorted(c for _, c in hedger.history._samples["9"]) == [False, True]
+    assert release.wait(2)
+
+
+def test_attempt_never_sent_is_not_recorded(tmp_path):
+    hedger = _hedger(tmp_path, delay_s=0.05)
+
+    def attempt(cancel, hedge, sent):
+        time.sleep(0.2)
+        return "cache"
+
+    assert hedger.call(attempt, 1000) == "cache"
+    assert hedger.stats()["fired"] == 0 and hedger.history._samples == {}
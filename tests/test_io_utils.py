@@ -0,0 +1,79 @@
+"""Poda de páginas das propostas longas."""
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from equalprop import io_utils
+
+COVER = "Proposta comercial Fornecedor Alfa " * 8
+CATALOG = "Catálogo técnico do vergalhão, norma ABNT NBR 7480, ensaio de dobramento. " * 6
+PRICES = "\n".join(["Item Descrição Qtd Unidade Valor unitário Valor total"]
+                   + [f"{i} Vergalhão CA-50 10 mm 100 m R$ 12,50 R$ 1.250,00" for i in range(1, 8)]
+                   + ["Frete CIF, validade 30 dias, pagamento 28 ddl"])
+
+
+def test_pages_without_text_are_always_kept():
+    # Página 3 digitalizada (sem camada de texto): pode ser a tabela de preços
+    pages = [COVER, CATALOG, "", PRICES, CATALOG, "  \n"]
+    assert io_utils.select_relevant_pages(pages) == [0, 2, 3, 5]
+
+
+def test_nothing_scored_keeps_the_whole_document():
+    assert io_utils.select_relevant_pages([COVER, CATALOG, "", CATALOG]) is None
+
+
+def _pdf(path, pages):
+    c = canvas.Canvas(str(path), pagesize=A4)
+    for text in pages:
+        y = 800
+        for line in text.splitlines() or [""]:
+            for start in range(0, len(line), 90):
+                c.drawString(40, y, line[start:start + 90])
+                y -= 14
+        c.showPage()
+    c.save()
+    return str(path)
+
+
+def test_pruned_pdf_keeps_the_scanned_page(tmp_path):
+    pdf = _pdf(tmp_path / "proposta.pdf", [COVER, CATALOG, "", PRICES, CATALOG, CATALOG])
+    (tmp_path / "podados").mkdir()
+    doc = io_utils._prepare_document_worker(pdf, str(tmp_path / "podados"))
+    assert (doc["pages"], doc["total_pages"], doc["sem_texto"]) == (3, 6, 1)
+    assert doc["pdf"] != pdf
+    # Com uma página sem texto, o recorte segue como PDF para o modelo ler a imagem
+    assert doc["text"] is None
+
+
+def _two_proposals(tmp_path):
+    return [_pdf(tmp_path / f"proposta_{i}.pdf", [COVER, CATALOG, PRICES, CATALOG]) for i in (1, 2)]
+
+
+def test_small_documents_skip_the_process_pool(tmp_path, monkeypatch):
+    def _no_pool():
+        raise AssertionError("documentos pequenos não usam o pool")
+
+    monkeypatch.setattr(io_utils, "_document_pool", _no_pool)
+    paths = _two_proposals(tmp_path)
+    docs = io_utils.prepare_documents(paths, prune_paths=paths, prune_dir=str(tmp_path / "podados"))
+    assert [docs[p]["pages"] for p in paths] == [2, 2]
+
+
+def test_pool_is_reused_and_matches_the_sequential_result(tmp_path):
+    paths = _two_proposals(tmp_path)
+    prune_dir = str(tmp_path / "podados")
+    expected = io_utils.prepare_documents(paths, prune_paths=paths, prune_dir=prune_dir)
+    assert io_utils.prepare_documents(paths, prune_paths=paths, prune_dir=prune_dir, min_pool_mb=0) == expected
+    pool = io_utils._pool
+    assert pool is not None
+    io_utils.prepare_documents(paths, prune_paths=paths, prune_dir=prune_dir, min_pool_mb=0)
+    assert io_utils._pool is pool
+
+
+def test_daemonic_process_prepares_in_thread(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(io_utils.multiprocessing, "current_process", lambda: type("P", (), {"daemon": True})())
+    monkeypatch.setattr(io_utils, "_pool", None)
+    paths = _two_proposals(tmp_path)
+    docs = io_utils.prepare_documents(paths, prune_paths=paths, prune_dir=str(tmp_path / "podados"), min_pool_mb=0)
+    assert len(docs) == 2 and io_utils._pool is None
+    assert "Processo daemônico" in capsys.readouterr().out
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from equalprop import job_queue
+
+
+@pytest.fixture(autouse=True)
+def _queue_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "SERVICE_DIR", str(tmp_path))
+    monkeypatch.setattr(job_queue, "_DB_PATH", str(tmp_path / "jobs.sqlite"))
+
+
+def _enqueue(user):
+    job_id = job_queue.enqueue(user, ("rfp.pdf", b"%PDF rfp"), [("proposta.pdf", b"%PDF p")])
+    # created_at distinto para a ordem dentro do usuário
+    time.sleep(0.01)
+    return job_id
+
+
+def _set(job_id, **fields):
+    with job_queue._connect() as conn:
+        for name, value in fields.items():
+            conn.execute(f"UPDATE jobs SET {name} = ? WHERE id = ?", (value, job_id))
+
+
+def test_claim_next_alternates_between_users():
+    a1, a2, a3 = _enqueue("ana"), _enqueue("ana"), _enqueue("ana")
+    b1 = _enqueue("bruno")
+    first = job_queue.claim_next("w1")
+    second = job_queue.claim_next("w2")
+    # Com um job da Ana em execução, o próximo é o do Bruno, mesmo enviado depois
+    assert (first["id"], second["id"]) == (a1, b1)
+    assert job_queue.claim_next("w3")["id"] == a2
+    assert job_queue.claim_next("w4")["id"] == a3
+    assert job_queue.claim_next("w5") is None
+
+
+def test_queued_job_with_cancel_request_never_runs():
+    job_id = _enqueue("ana")
+    assert job_queue.request_cancel(job_id)
+    assert job_queue.claim_next("w1") is None
+    assert job_queue.get(job_id)["status"] == job_queue.CANCELLED
+
+
+def test_requeue_stale_and_attempt_limit(monkeypatch):
+    job_id = _enqueue("ana")
+    assert job_queue.claim_next("w1")["attempts"] == 1
+    _set(job_id, heartbeat_at=time.time() - 3600)
+    assert job_queue.requeue_stale(stale_s=60) == 1
+    job = job_queue.get(job_id)
+    assert (job["status"], job["worker"]) == (job_queue.QUEUED, None)
+
+    monkeypatch.setattr(job_queue, "SERVICE_MAX_ATTEMPTS", 2)
+    assert job_queue.claim_next("w2")["attempts"] == 2
+    _set(job_id, heartbeat_at=time.time() - 3600)
+    job_queue.requeue_stale(stale_s=60)
+    assert job_queue.get(job_id)["status"] == job_queue.ERROR
+
+
+def test_stale_worker_cannot_finish_a_reclaimed_job():
+    job_id = _enqueue("ana")
+    job_queue.claim_next("w1")
+    assert job_queue.heartbeat(job_id, "w1", {"done": 1, "total": 4, "label": None}) is False
+    _set(job_id, heartbeat_at=time.time() - 3600)
+    assert job_queue.claim_next("w2")["id"] == job_id
+
+    with pytest.raises(job_queue.JobLost):
+        job_queue.heartbeat(job_id, "w1")
+    assert not job_queue.finish(job_id, "w1", job_queue.ERROR, error="processo antigo")
+    assert job_queue.finish(job_id, "w2", job_queue.DONE, report_xlsx="r.xlsx")
+    job = job_queue.get(job_id)
+    assert (job["status"], job["report_xlsx"], job["worker"]) == (job_queue.DONE, "r.xlsx", "w2")
+
+
+def test_heartbeat_reports_cancel_request():
+    job_id = _enqueue("ana")
+    job_queue.claim_next("w1")
+    assert job_queue.request_cancel(job_id)
+    assert job_queue.heartbeat(job_id, "w1") is True
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from equalprop.json_repair import (
+    CONDICOMER_CHAVES,
+    PROPOSTA,
+    RFP,
+    SYNTAX,
+    JsonRepairError,
+    loads_lenient,
+    normalize_percent,
+    parse_response,
+)
+
+
+def test_valid_json_needs_no_repair():
+    data, repairs = parse_response(json.dumps({"rfp_json": {"header": {}, "produtos_demandados": [
+        {"codigo": "PDC1"}]}}), RFP)
+    assert data["rfp_json"]["produtos_demandados"] == [{"codigo": "PDC1"}]
+    assert repairs == []
+
+
+def test_fences_and_trailing_commas():
+    data, repairs = loads_lenient('Segue:\n```json\n{"a": [1, 2,], }\n```')
+    assert data == {"a": [1, 2]}
+    assert "vírgulas finais removidas" in repairs
+
+
+def test_truncated_response_drops_value_cut_mid_string():
+    text = '{"proposta": {"header": {"cnpj": "1"}, "pops": [{"codigo_pdc": "PDC1"}, {"codigo_pdc": "PDC2", "descricao": "Tub'
+    data, repairs = parse_response(text, PROPOSTA)
+    assert data["proposta"]["pops"] == [{"codigo_pdc": "PDC1"}, {"codigo_pdc": "PDC2"}]
+    assert data["proposta"]["condicoes_comerciais"] == []
+    assert "resposta truncada fechada" in repairs
+
+
+def test_unreadable_text_is_syntax_error():
+    with pytest.raises(JsonRepairError) as info:
+        parse_response("não é JSON", PROPOSTA)
+    assert info.value.problems == [SYNTAX]
+    assert info.value.syntax_only
+
+
+def test_missing_codigo_is_a_problem_not_invented():
+    text = json.dumps({"rfp_json": {"produtos_demandados": [{"codigo": "PDC1"}, {"codigo": "null"}, {}]}})
+    with pytest.raises(JsonRepairError) as info:
+        parse_response(text, RFP)
+    assert info.value.problems == ["rfp_json.produtos_demandados sem codigo (itens 2, 3)"]
+    assert not info.value.syntax_only
+
+
+def test_missing_root_is_added_and_semelhanca_normalized():
+    data, repairs = parse_response(json.dumps({"pops": [{"semelhanca": 0.66}, {"semelhanca": "80 %"}]}), PROPOSTA)
+    assert [p["semelhanca"] for p in data["proposta"]["pops"]] == ["66%", "80%"]
+    assert "raiz proposta adicionada" in repairs
+
+
+def test_null_strings_are_kept_in_proposals():
+    # Os relatórios tratam "null" como ausente; o reparo não converte valores
+    data, _ = parse_response(json.dumps({"proposta": {"header": {"cnpj": "null"}, "pops": []}}), PROPOSTA)
+    assert data["proposta"]["header"]["cnpj"] == "null"
+
+
+def test_condicomer_mapping_drops_missing_values():
+    data, repairs = parse_response(json.dumps({"Frete FOB": "Frete", "Obs. gerais": "null"}), CONDICOMER_CHAVES,
+                                   names=["Frete FOB", "Obs. gerais"])
+    assert data == {"mapeamento": {"Frete FOB": "Frete"}}
+    assert "1 nomes sem classificação mantidos como estão" in repairs
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0.5, "50%"), (66, "66%"), ("66,5 %", "66.5%"), ("alta", "alta"), (None, None),
+    (1.0, "100%"), (1, "100%"), ("0.9", "90%"), ("0,66", "66%"), ("1%", "1%"), ("0.5%", "0.5%"), (0, "0%"),
+])
+def test_normalize_percent(value, expected):
+    assert normalize_percent(value) == expected
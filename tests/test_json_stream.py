@@ -0,0 +1,39 @@
+from equalprop.json_stream import IncrementalJsonScanner, parse_event
+
+
+def _feed_all(scanner, text, size):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(scanner.feed(text[i:i + size]))
+    return events
+
+
+def test_reports_closed_containers_with_path():
+    text = '{"proposta": {"header": {"cnpj": "1"}, "pops": [{"a": 1}, {"b": "}"}]}}'
+    events = _feed_all(IncrementalJsonScanner(), text, 1)
+    paths = [path for path, _ in events]
+    assert paths == [("proposta", "header"), ("proposta", "pops", 0), ("proposta", "pops", 1),
+                     ("proposta", "pops"), ("proposta",), ()]
+    assert parse_event(events[0][1]) == {"cnpj": "1"}
+    assert parse_event(events[2][1]) == {"b": "}"}
+
+
+def test_chunking_does_not_change_events():
+    text = '{"x": [1, [2, 3], {"k\\"q": "v\\\\"}], "y": {}}'
+    expected = _feed_all(IncrementalJsonScanner(), text, len(text))
+    for size in (1, 2, 3, 7):
+        assert _feed_all(IncrementalJsonScanner(), text, size) == expected
+
+
+def test_ignores_text_before_root_and_stops_after_it():
+    scanner = IncrementalJsonScanner()
+    events = scanner.feed('```json\n{"a": {"b": 1}}\n```{"c": {}}')
+    assert [path for path, _ in events] == [("a",), ()]
+    assert scanner.complete
+
+
+def test_incomplete_document():
+    scanner = IncrementalJsonScanner()
+    assert [p for p, _ in scanner.feed('{"pops": [{"a": 1}, {"b"')] == [("pops", 0)]
+    assert not scanner.complete
+    assert parse_event('{"b"') is None
@@ -0,0 +1,30 @@
+import json
+
+from equalprop.payloads import compact_json, project_rfp_for_proposals, rfp_payload_for_proposals
+
+RFP_JSON = {"rfp_json": {
+    "header": {"Obra": "Edifício Sul", "Solicitante": "Ana"},
+    "produtos_demandados": [
+        {"codigo": "PDC1", "especificacoes_tecnicas": {"bitola": {"valor": 10, "unidade": "null"}},
+         "quantidade_demandada": {"valor": 5, "unidade": None}, "observacao": "ignorada"},
+        "lixo",
+    ],
+}}
+
+
+def test_projection_keeps_only_pdc_fields_without_nulls():
+    assert project_rfp_for_proposals(RFP_JSON) == {"rfp_json": {"produtos_demandados": [
+        {"codigo": "PDC1", "especificacoes_tecnicas": {"bitola": {"valor": 10}},
+         "quantidade_demandada": {"valor": 5}},
+    ]}}
+
+
+def test_payload_is_compact_utf8():
+    payload = rfp_payload_for_proposals(RFP_JSON)
+    assert " " not in payload
+    assert json.loads(payload) == project_rfp_for_proposals(RFP_JSON)
+    assert compact_json({"condição": "ç"}) == '{"condição":"ç"}'
+
+
+def test_non_dict_is_passed_through():
+    assert project_rfp_for_proposals(None) is None
@@ -0,0 +1,64 @@
+"""
+Pipeline completo servido por uma fita pequena (ReplayBackend), sem rede.
+
+A fita é gravada no próprio teste: o modelo roteirizado (conftest) responde
+por trás do RecordingModel e, em seguida, a mesma execução roda só com as
+fitas.
+"""
+
+import json
+import os
+
+import pytest
+
+from equalprop import condicomer_canon, pipeline
+from equalprop.backend import RecordingModel
+from equalprop.config import build_gen_config
+
+
+def _by_name(propostas_json):
+    return {os.path.basename(pid): text for pid, text in propostas_json.items()}
+
+
+@pytest.fixture
+def documents(tmp_path, make_documents):
+    return make_documents(str(tmp_path / "entrada"))
+
+
+def _run(model, documents, tmp_path, monkeypatch, name):
+    # Cada execução começa sem sinônimos aprendidos, para fazer as mesmas chamadas
+    monkeypatch.setattr(condicomer_canon, "_DB_PATH", str(tmp_path / f"sinonimos_{name}.sqlite"))
+    rfp, proposals = documents
+    temp_dir = tmp_path / f"trabalho_{name}"
+    temp_dir.mkdir()
+    return pipeline.run_report_pipeline(model, build_gen_config(), rfp, proposals, str(temp_dir),
+                                        out_dir=str(tmp_path / f"saida_{name}"))
+
+
+def test_replay_reproduces_recorded_run(offline, documents, tmp_path, scripted_model, monkeypatch):
+    scripted = scripted_model()
+    recorded = _run(RecordingModel(scripted, offline.cassette), documents, tmp_path, monkeypatch, "gravacao")
+    tapes = os.listdir(tmp_path / "fitas" / "chamadas")
+    # RFP, duas propostas e a classificação de "Seguro da carga"
+    assert len(scripted.calls) == len(tapes) == 4
+
+    replayed = _run(offline.model(scripted.model_name), documents, tmp_path, monkeypatch, "replay")
+    assert len(scripted.calls) == 4
+    assert _by_name(replayed["propostas_json"]) == _by_name(recorded["propostas_json"])
+    assert sorted(replayed["cnpjs_by_id"].values()) == ["11222333000181", "44555666000199"]
+    assert os.path.exists(replayed["report_xlsx"])
+
+    socios = replayed["socios_em_comum"]
+    pairs = [names for row in socios.values() for found in row.values() for names in found]
+    # "Carlos Lima" é "Carlos Pereira Lima"; "Maria de Sá" não é "Maria Silva"
+    assert sorted(pairs) == [["Carlos Lima", "Carlos Pereira Lima"], ["Carlos Pereira Lima", "Carlos Lima"]]
+
+    usage = replayed["usage"]
+    assert sorted(c["stage"] for c in usage["calls"]) == ["condicomer", "proposta", "proposta", "rfp"]
+    with open(replayed["usage_json"], encoding="utf-8") as f:
+        assert json.load(f)["totals"]["calls"] == 4
+
+
+def test_replay_without_tape_fails(offline, documents, tmp_path, monkeypatch, scripted_model):
+    with pytest.raises(Exception, match="sem fita"):
+        _run(offline.model(scripted_model().model_name), documents, tmp_path, monkeypatch, "vazio")
@@ -0,0 +1,56 @@
+"""Limite de concorrência adaptativo: o que reduz e o que não reduz o limite."""
+
+import pytest
+
+from equalprop import config
+from equalprop.rate_limit import AdaptiveLimiter
+
+
+class _TooMany(Exception):
+    code = 429
+
+
+class _Timeout(Exception):
+    pass
+
+
+_Timeout.__name__ = "DeadlineExceeded"
+
+
+def _limiter():
+    return AdaptiveLimiter(rpm=10_000, tpm=10_000_000, max_concurrency=8)
+
+
+def test_slow_document_call_keeps_the_limit():
+    limiter = _limiter()
+    for _ in range(5):
+        limiter._on_success(400.0, config.stage_settings("proposta")["latency_target_s"])
+    assert limiter.concurrency_limit == 8
+
+
+def test_slow_small_call_cuts_the_limit():
+    limiter = _limiter()
+    limiter._on_success(400.0, config.stage_settings("condicomer")["latency_target_s"])
+    assert limiter.concurrency_limit == 7
+
+
+@pytest.mark.parametrize("target, expected", [(None, 8), (60, 7)])
+def test_timeouts_cut_only_with_a_latency_target(target, expected):
+    limiter = _limiter()
+    with pytest.raises(_Timeout):
+        with limiter.slot(0, target):
+            raise _Timeout("deadline")
+    assert limiter.concurrency_limit == expected
+
+
+def test_rate_limit_always_halves():
+    limiter = _limiter()
+    limiter._on_failure(_TooMany("429 quota"), None)
+    assert limiter.concurrency_limit == 4
+
+
+def test_stage_latency_target_override(monkeypatch):
+    assert config.stage_settings("rfp")["latency_target_s"] is None
+    assert config.stage_settings("proposta_reparo")["latency_target_s"] == config.LATENCY_TARGET_S
+    monkeypatch.setenv("EQUALPROP_LATENCY_TARGET_PROPOSTA", "600")
+    assert config.stage_settings("proposta_hedge")["latency_target_s"] == 600
@@ -0,0 +1,32 @@
+from equalprop.socios_comum import match_common_partners, normalize_name, partner_name
+
+
+def test_partner_name_drops_qualification():
+    assert partner_name("João da Silva, Sócio-Administrador") == "João da Silva"
+
+
+def test_person_names_keep_every_surname():
+    assert normalize_name("Maria de Sá") == "maria sa"
+    assert normalize_name("Ana Sá") != normalize_name("Ana")
+
+
+def test_company_suffixes_are_stripped_only_at_the_end():
+    assert normalize_name("Construtora Alfa Ltda") == normalize_name("Construtora Alfa")
+    assert normalize_name("XYZ Participações S.A.") == normalize_name("XYZ PARTICIPACOES")
+    assert normalize_name("ABC Comércio Ltda - ME") == "abc comercio"
+
+
+def test_spelling_variants_match():
+    assert normalize_name("Thiago Souza") == normalize_name("Tiago Sousa")
+
+
+def test_match_common_partners():
+    socio_comum, matriz = match_common_partners({
+        "a.pdf": ["Maria de Sá, Sócia", "Carlos Pereira Lima, Administrador"],
+        "b.pdf": ["Maria Silva, Sócia", "Carlos Lima, Sócio"],
+        "c.pdf": ["Ana Costa, Sócia"],
+        "d.pdf": None,
+    })
+    assert socio_comum == {"a.pdf": "sim", "b.pdf": "sim", "c.pdf": "não", "d.pdf": None}
+    assert matriz["a.pdf"]["b.pdf"] == [["Carlos Pereira Lima", "Carlos Lima"]]
+    assert matriz["b.pdf"]["a.pdf"] == [["Carlos Lima", "Carlos Pereira Lima"]]
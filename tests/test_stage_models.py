@@ -0,0 +1,66 @@
+"""Modelos de etapa seguem o backend atual."""
+
+from equalprop import config, gemini_service
+from equalprop.backend import Cassette, ReplayBackend, set_backend
+
+
+def test_stage_model_follows_set_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "MODEL_PRESET", "latency")
+    main = object()
+    try:
+        first = ReplayBackend(Cassette(str(tmp_path / "a")), latency_scale=0, failure_rate=0)
+        set_backend(first)
+        model = gemini_service.stage_model(main, "condicomer")
+        assert gemini_service.stage_model(main, "condicomer") is model
+        second = ReplayBackend(Cassette(str(tmp_path / "b")), latency_scale=0, failure_rate=0)
+        set_backend(second)
+        other = gemini_service.stage_model(main, "condicomer")
+        assert other is not model and other.backend is second
+        assert gemini_service.stage_model(main, "proposta") is main
+    finally:
+        set_backend(None)
+
+
+class _Response:
+    def __init__(self, headers=None, body=None):
+        self.headers = headers or {}
+        self._body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._body
+
+
+class _FilesBackend:
+    def __init__(self):
+        self.fetched = []
+
+    def get_file(self, name):
+        self.fetched.append(name)
+        return name
+
+
+def test_resumable_upload_fetches_the_handle_through_the_backend(tmp_path, monkeypatch):
+    from equalprop import transport
+
+    posts = []
+
+    def _post(url, **kwargs):
+        posts.append(kwargs["headers"]["X-Goog-Upload-Command"])
+        if len(posts) == 1:
+            return _Response({"X-Goog-Upload-URL": "https://upload.test/sessao"})
+        return _Response(body={"file": {"name": "files/abc"}})
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "teste")
+    monkeypatch.setattr(transport.requests, "post", _post)
+    backend = _FilesBackend()
+    set_backend(backend)
+    try:
+        path = tmp_path / "doc.pdf"
+        path.write_bytes(b"%PDF-1.4 teste")
+        assert transport.resumable_upload(str(path)) == "files/abc"
+    finally:
+        set_backend(None)
+    assert backend.fetched == ["files/abc"] and posts == ["start", "upload, finalize"]